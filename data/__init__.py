@@ -1,4 +1,4 @@
-from .get_dataloader import get_audio_dataloader
+from .get_dataloader import get_audio_dataloader, set_epoch
 
 from data.vision import get_deepscores_dataloader 
 from data.vision import get_universal_dataloader
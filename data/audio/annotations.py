@@ -0,0 +1,62 @@
+import os
+import hashlib
+import numpy as np
+
+
+def file_hash(fp):
+    h = hashlib.sha1()
+    with open(fp, "rb") as f:
+        for block in iter(lambda: f.read(2 ** 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def save_annotations(cache_path, arrays, sources, mtimes, sizes, hashes):
+    cache_dir = os.path.dirname(cache_path)
+    if not os.path.exists(cache_dir):
+        os.makedirs(cache_dir)
+
+    with open(cache_path + ".tmp", "wb") as f:
+        np.savez(
+            f,
+            _sources=np.array(sources),
+            _mtimes=mtimes,
+            _sizes=sizes,
+            _hashes=np.array(hashes),
+            **arrays,
+        )
+    os.replace(cache_path + ".tmp", cache_path)
+
+
+def cached_annotations(cache_path, sources, build):
+    """
+    Returns the dict of numpy arrays made by |build|, cached in |cache_path| (.npz).
+    The cache is valid as long as the mtime and size of all |sources| match, or their
+    content hash when only the mtime changed, so it is only rebuilt when they change.
+    """
+    cache_path = str(cache_path)
+    sources = [str(fp) for fp in sources]
+    stats = [os.stat(fp) for fp in sources]
+    mtimes = np.array([st.st_mtime_ns for st in stats], dtype=np.int64)
+    sizes = np.array([st.st_size for st in stats], dtype=np.int64)
+
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cache:
+            arrays = {k: cache[k] for k in cache.files}
+
+        if arrays.pop("_sources").tolist() == sources:
+            cached_mtimes = arrays.pop("_mtimes")
+            cached_sizes = arrays.pop("_sizes")
+            hashes = arrays.pop("_hashes").tolist()
+            if np.array_equal(cached_mtimes, mtimes) and np.array_equal(cached_sizes, sizes):
+                return arrays
+
+            if np.array_equal(cached_sizes, sizes) and [file_hash(fp) for fp in sources] == hashes:
+                save_annotations(cache_path, arrays, sources, mtimes, sizes, hashes)
+                return arrays
+
+    print(f"Building annotation cache {cache_path}")
+    arrays = build()
+    hashes = [file_hash(fp) for fp in sources]
+    save_annotations(cache_path, arrays, sources, mtimes, sizes, hashes)
+    return arrays
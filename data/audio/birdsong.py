@@ -10,9 +10,11 @@ from tqdm import tqdm
 import time
 
 from .dataset import Dataset
+from .packed import load_shared_tracks
+from .index import AudioIndex
 from scripts.datasets.utils import write_statistics
 from utils import random_undersample_balanced
-from utils.audio import load_tracks, concat_tracks
+from utils.audio import pcm_to_float
 
 def load_csv(fp):
     df = pd.read_csv(fp)
@@ -59,15 +61,12 @@ class BirdsongDataset(Dataset):
 
         df = load_csv(self.annotations_file)
 
+        rows = []
         if split == "test":
             self.tags = []
-            self.index = []
-            self.track_index = []
         else:
             self.tags = sorted(df.ebird_code.unique().tolist(), reverse=True)
             self.num_tags = len(self.tags)
-            self.index = []
-            self.track_index = defaultdict(list)
             segment = 0
             for clip_id, row in df.iterrows():
                 # fp = os.path.join(row["ebird_code"], row["filename"])
@@ -76,9 +75,11 @@ class BirdsongDataset(Dataset):
                 label[self.tags.index(track_id)] = 1
                 fp = f"{track_id}-{clip_id}-{self.sample_rate}.wav"
                 fp = os.path.join(self.audio_proc_dir, self.split, fp)
-                self.index.append([track_id, clip_id, segment, fp, label])
-                self.track_index[track_id].append([clip_id, segment, fp, label])
-            
+                # tracks are identified by the index of their tag
+                rows.append([self.tags.index(track_id), clip_id, segment, fp, label])
+
+        self.index = AudioIndex.from_rows(rows)
+        self.track_index = self.index.track_index()
         print(len(self.index))
 
         ## get dataset statistics
@@ -87,7 +88,9 @@ class BirdsongDataset(Dataset):
 
         if self.load_ram and self.pretrain and self.split == "train":
             print("Loading train data into memory for faster training")
-            self.audios = load_tracks(args.sample_rate, self.index)
+            self.audios, self.ram_slots = load_shared_tracks(
+                args, self.name, self.split, self.index
+            )
 
         if self.split == "valid":
             self.index = self.index[:5]
@@ -104,11 +107,6 @@ class BirdsongDataset(Dataset):
             self.std,
         )
 
-        # memory leak bug in DDP
-        if args.world_size > 1:
-            self.index = np.array(self.index)
-            self.track_index = {k: np.array(v) for k, v in self.track_index.items()}
-
 
     # get one segment (==59049 samples) and its 50-d label
     def __getitem__(self, idx):
@@ -123,7 +121,7 @@ class BirdsongDataset(Dataset):
         label = torch.FloatTensor(label)
         try:
             if self.load_ram and self.pretrain and self.split == "train":
-                audio = self.audios["{}-{}".format(track_id, clip_id)]
+                audio = self.get_ram_audio(idx)
             else:
                 audio = self.get_audio(fp)
 
@@ -143,7 +141,7 @@ class BirdsongDataset(Dataset):
         #     audio = (audio, audio)
         else:
             start_idx = int(segment) * self.audio_length
-            audio = audio[start_idx : start_idx + self.audio_length]
+            audio = pcm_to_float(audio[start_idx : start_idx + self.audio_length])
             audio = audio.reshape(1, -1)  # [channels, samples]
             audio = torch.from_numpy(audio)
             audio = (audio, audio)
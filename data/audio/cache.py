@@ -0,0 +1,155 @@
+import os
+from collections import OrderedDict
+from tqdm import tqdm
+
+
+def signature(fp):
+    # the size and mtime of a file, None if it cannot be read
+    try:
+        st = os.stat(fp)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class AudioCache:
+    """
+    Least-recently-used cache of decoded tracks, bounded by |max_bytes|.
+    Every DataLoader worker holds its own instance (a pre-warmed cache is
+    inherited by the workers when they are forked). Keys are file paths, a track
+    is dropped when the size or mtime of its file change.
+    """
+
+    report_every = 10000
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.items = OrderedDict()
+        self.signatures = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items and self.check(key)
+
+    def check(self, key):
+        """
+        Drops the track of |key| if its file changed since it was cached
+        """
+        if self.signatures[key] == signature(key):
+            return True
+        self.num_bytes -= self.items.pop(key).nbytes
+        del self.signatures[key]
+        self.invalidations += 1
+        return False
+
+    def get(self, key):
+        audio = self.items.get(key)
+        if audio is not None and not self.check(key):
+            audio = None
+        if audio is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.items.move_to_end(key)
+
+        if (self.hits + self.misses) % self.report_every == 0:
+            print(f"[Cache {os.getpid()}]: {self.stats()}")
+        return audio
+
+    def put(self, key, audio):
+        if key in self.items or audio.nbytes > self.max_bytes:
+            return False
+
+        while self.num_bytes + audio.nbytes > self.max_bytes:
+            evicted_key, evicted = self.items.popitem(last=False)
+            del self.signatures[evicted_key]
+            self.num_bytes -= evicted.nbytes
+            self.evictions += 1
+
+        self.items[key] = audio
+        self.signatures[key] = signature(key)
+        self.num_bytes += audio.nbytes
+        return True
+
+    def warm(self, fps, loader):
+        """
+        Fills the cache in order of |fps|, until the budget is reached
+        """
+        for fp in tqdm(fps):
+            if fp in self.items:
+                continue
+            audio = loader(fp)
+            if self.num_bytes + audio.nbytes > self.max_bytes:
+                break
+            self.put(fp, audio)
+
+    def stats(self):
+        lookups = max(1, self.hits + self.misses)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "hit_rate": self.hits / lookups,
+            "tracks": len(self.items),
+            "mb": self.num_bytes / 2 ** 20,
+        }
+
+
+class CropReservoir:
+    """
+    Worker-local reservoir of recently decoded tracks, for drawing |max_uses| positive pairs
+    from one decode (`args.crops_per_track`). A track is dropped after |max_uses| uses, or when
+    more than |max_tracks| tracks are held (least recently used first).
+    """
+
+    report_every = 10000
+
+    def __init__(self, max_tracks, max_uses):
+        self.max_tracks = max_tracks
+        self.max_uses = max_uses
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, key, loader):
+        item = self.items.get(key)
+        if item is None:
+            self.misses += 1
+            item = [loader(key), 0]
+            self.items[key] = item
+            while len(self.items) > self.max_tracks:
+                self.items.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.hits += 1
+            self.items.move_to_end(key)
+
+        item[1] += 1
+        if item[1] >= self.max_uses:
+            del self.items[key]
+
+        if (self.hits + self.misses) % self.report_every == 0:
+            print(f"[Reservoir {os.getpid()}]: {self.stats()}")
+        return item[0]
+
+    def stats(self):
+        lookups = max(1, self.hits + self.misses)
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups,
+            "tracks": len(self.items),
+        }
@@ -0,0 +1,252 @@
+import io
+import os
+import hashlib
+import subprocess
+from collections import namedtuple
+import numpy as np
+import torchaudio
+
+from utils.misc import LRUDict
+from utils.resample import resample_poly
+
+compressed_formats = (".mp3", ".ogg", ".flac")
+
+# kbps, indexed by the bitrate bits of the frame header (Layer III)
+MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],  # MPEG-2 / 2.5
+}
+
+MP3_SAMPLE_RATES = [44100, 48000, 32000]
+
+# frames decoded ahead of the requested frame, to fill the bit reservoir of the decoder
+MP3_PREROLL_FRAMES = 10
+
+FrameIndex = namedtuple("FrameIndex", ["offsets", "starts", "sample_rate", "channels"])
+
+
+def is_compressed(fp):
+    return fp.lower().endswith(compressed_formats)
+
+
+def parse_mp3_header(b):
+    """
+    Returns (frame length in bytes, samples per frame, sample rate, channels) of the
+    MPEG Layer III frame header |b| (4 bytes), or None if it is not a valid header
+    """
+    if b[0] != 0xFF or (b[1] & 0xE0) != 0xE0:
+        return None
+    version = (b[1] >> 3) & 3  # 3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5
+    layer = (b[1] >> 1) & 3  # 1: Layer III
+    bitrate_idx = b[2] >> 4
+    sample_rate_idx = (b[2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_idx in (0, 15) or sample_rate_idx == 3:
+        return None
+
+    mpeg1 = version == 3
+    bitrate = MP3_BITRATES[1 if mpeg1 else 2][bitrate_idx] * 1000
+    sample_rate = MP3_SAMPLE_RATES[sample_rate_idx] // {3: 1, 2: 2, 0: 4}[version]
+    padding = (b[2] >> 1) & 1
+    frame_length = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+    channels = 1 if (b[3] >> 6) == 3 else 2
+    return frame_length, 1152 if mpeg1 else 576, sample_rate, channels
+
+
+def build_mp3_index(fp):
+    """
+    Scans the frame headers of an MP3 file, for the byte offset and first sample of every frame
+    """
+    with open(fp, "rb") as f:
+        data = f.read()
+
+    pos = 0
+    if data[:3] == b"ID3":
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        pos = 10 + size + (10 if data[5] & 0x10 else 0)
+
+    offsets = []
+    starts = []
+    num_samples = 0
+    sample_rate = None
+    channels = None
+    while pos + 4 <= len(data):
+        header = parse_mp3_header(data[pos : pos + 4])
+        if header is not None and pos + header[0] > len(data):
+            header = None  # a truncated last frame
+        if header is None:
+            # after the last frame: an ID3v1 tag, or trailing junk
+            if sample_rate is not None:
+                break
+            pos += 1
+            continue
+
+        frame_length, frame_samples, sr, ch = header
+        if sample_rate is None:
+            # a sync word in junk data: the first frame is followed by the next frame (or the
+            # end of the file / an ID3v1 tag)
+            end = pos + frame_length
+            if end + 4 <= len(data) and parse_mp3_header(data[end : end + 4]) is None and data[end : end + 3] != b"TAG":
+                pos += 1
+                continue
+
+            sample_rate, channels = sr, ch
+            # the Xing/Info frame of VBR files holds no audio
+            if b"Xing" in data[pos : pos + 64] or b"Info" in data[pos : pos + 64]:
+                pos += frame_length
+                continue
+
+        offsets.append(pos)
+        starts.append(num_samples)
+        num_samples += frame_samples
+        pos += frame_length
+
+    if not offsets:
+        raise Exception(f"{fp} has no MPEG Layer III frames")
+
+    # the end of the last frame
+    offsets.append(pos)
+    starts.append(num_samples)
+    return FrameIndex(
+        np.array(offsets, dtype=np.int64), np.array(starts, dtype=np.int64), sample_rate, channels
+    )
+
+
+def decode_bytes(data, fmt):
+    """
+    Decodes an in-memory (partial) file to mono float32, in-process if torchaudio supports
+    file-like objects, otherwise through ffmpeg pipes
+    """
+    try:
+        audio, sr = torchaudio.load(io.BytesIO(data), format=fmt)
+        return audio.mean(dim=0).numpy(), sr
+    except Exception:
+        pass
+
+    process = subprocess.Popen(
+        ["ffmpeg", "-f", fmt, "-i", "pipe:0", "-ac", "1", "-f", "s16le", "pipe:1"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    stdout, _ = process.communicate(data)
+    if process.returncode != 0:
+        raise Exception("ffmpeg could not decode the audio")
+    return np.frombuffer(stdout, dtype=np.int16).astype(np.float32) / 32768, None
+
+
+class CompressedAudioReader:
+    """
+    Reads windows of compressed (MP3 / OGG / FLAC) files at |sample_rate|, by decoding only
+    the frames that hold the window. MP3 seeks use a frame index (byte offset and first sample of
+    every frame), cached in |cache_dir|; OGG and FLAC seek through torchaudio. Only the
+    |max_files| most recently read indexes are held in memory, the others are loaded again
+    from |cache_dir|.
+    Sample positions follow the decoded stream without the encoder delay trimming of a full
+    decode, so they can be off by the encoder delay (< 1 frame).
+    """
+
+    # ~18 KB per index of a 30 s MP3
+    max_files = 1024
+
+    def __init__(self, sample_rate, cache_dir):
+        self.sample_rate = sample_rate
+        self.cache_dir = cache_dir
+        self.indexes = LRUDict(self.max_files)
+        self.infos = LRUDict(self.max_files)
+
+    def frame_index(self, fp):
+        index = self.indexes.get(fp)
+        if index is not None:
+            return index
+
+        st = os.stat(fp)
+        key = hashlib.sha1(f"{fp}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()
+        cache_path = os.path.join(self.cache_dir, key[:2], f"{key}.npz")
+        if os.path.exists(cache_path):
+            with np.load(cache_path) as f:
+                index = FrameIndex(
+                    f["offsets"], f["starts"], int(f["sample_rate"]), int(f["channels"])
+                )
+        else:
+            index = build_mp3_index(fp)
+            if not os.path.exists(os.path.dirname(cache_path)):
+                os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **index._asdict())
+            os.replace(tmp_path, cache_path)
+
+        self.indexes[fp] = index
+        return index
+
+    def info(self, fp):
+        """
+        (number of samples, sample rate) of the source file
+        """
+        if fp.lower().endswith(".mp3"):
+            index = self.frame_index(fp)
+            return int(index.starts[-1]), index.sample_rate
+
+        info = self.infos.get(fp)
+        if info is None:
+            info = torchaudio.info(fp)
+            if isinstance(info, tuple):  # older torchaudio: (signal info, encoding info)
+                info = (info[0].length // info[0].channels, int(info[0].rate))
+            else:
+                info = (info.num_frames, info.sample_rate)
+            self.infos[fp] = info
+        return info
+
+    def num_samples(self, fp):
+        num_samples, sr = self.info(fp)
+        return num_samples * self.sample_rate // sr
+
+    def read_source(self, fp, start, length):
+        """
+        Decodes samples [start, start + length) at the source sample rate
+        """
+        if fp.lower().endswith(".mp3"):
+            index = self.frame_index(fp)
+            first = max(0, np.searchsorted(index.starts, start, side="right") - 1)
+            last = np.searchsorted(index.starts, start + length, side="left")
+            pre = max(0, first - MP3_PREROLL_FRAMES)
+            last = min(last, len(index.offsets) - 1)
+            with open(fp, "rb") as f:
+                f.seek(index.offsets[pre])
+                data = f.read(index.offsets[last] - index.offsets[pre])
+
+            audio, _ = decode_bytes(data, "mp3")
+            skip = start - index.starts[pre]
+            return audio[skip : skip + length]
+
+        # OGG / FLAC seek natively
+        try:
+            audio, _ = torchaudio.load(fp, frame_offset=start, num_frames=length)
+        except TypeError:  # older torchaudio
+            audio, _ = torchaudio.load(fp, offset=start, num_frames=length)
+        return audio.mean(dim=0).numpy()
+
+    def read(self, fp, start=0, length=None):
+        """
+        Returns samples [start, start + length) at |sample_rate|, as mono float32
+        """
+        num_samples, sr = self.info(fp)
+        if length is None:
+            length = num_samples * self.sample_rate // sr - start
+
+        # at the source rate no margin is needed: read_source already decodes
+        # MP3_PREROLL_FRAMES frames ahead of the window (the decoder pre-roll) and drops them,
+        # and OGG / FLAC decode sample-exact from the seek position
+        if sr == self.sample_rate:
+            return self.read_source(fp, start, length).astype(np.float32, copy=False)
+
+        # decode a margin around the window, so the resampling filter has no edge effects (the
+        # margin is only for the filter; the MP3 pre-roll is added by read_source in both cases)
+        margin = sr // 100
+        src_start = start * sr // self.sample_rate
+        src_length = -(-length * sr // self.sample_rate)
+        pre = min(margin, src_start)
+        audio = self.read_source(fp, src_start - pre, src_length + pre + margin)
+        audio = resample_poly(audio, sr, self.sample_rate)
+        skip = pre * self.sample_rate // sr
+        return audio[skip : skip + length].astype(np.float32, copy=False)
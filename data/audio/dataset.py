@@ -1,4 +1,5 @@
 import os
+import random
 from pathlib import Path
 from collections import defaultdict
 import torch
@@ -7,11 +8,54 @@ import torchaudio
 from torch.utils.data import Dataset as TorchDataset
 import numpy as np
 
-from utils.audio import process_wav
+from utils import random_undersample_balanced
+from utils.audio import process_wav, pcm_to_float, encode_audio, read_wav_header, read_wav_window
+from .cache import AudioCache, CropReservoir
+from .index import AudioIndex
+from .manifest import AudioManifest, is_transient
+from .compressed import is_compressed
+from .readahead import read_file
+
+
+# random crops (and compressed windows) are prefetched by reading the whole clip only up to this
+# size, larger WAV clips only get their header parsed (the crops are drawn in the actual read)
+PREFETCH_WHOLE_BYTES = 4 * 2 ** 20
+
+
+class SegmentError(Exception):
+    """
+    Raised when a segment lies outside the clip, which does not make the whole file bad
+    """
 
 # inherits Dataset from PyTorch
 class Dataset(TorchDataset):
 
+    # whether pre-training batches should hold unique tracks (see TrackBatchSampler)
+    track_batches = False
+
+    # optional PackedAudioStore, set by datasets that support `args.packed`
+    store = None
+
+    # shared-memory store of the train set and the store slot of each index row (`args.load_ram`)
+    audios = None
+    ram_slots = None
+
+    # optional LRU cache of decoded tracks (`args.cache_mb`), in the `args.storage_format` sample format
+    cache = None
+    storage_format = "int16"
+
+    # optional CropReservoir, decoded tracks that yield `args.crops_per_track` positive pairs each
+    reservoir = None
+
+    # optional CompressedAudioReader, to decode crops straight from the original files (`args.audio_format`)
+    compressed = None
+
+    # optional AudioManifest, the header-only probe and quarantine list of the audio files (`args.manifest`)
+    manifest = None
+
+    # optional ScratchCache, copies of the files read on local scratch storage (`args.scratch_dir`)
+    scratch = None
+
     def __init__(self, name, split, sample_rate, audio_length, tracks_list, num_segments, audio_proc_dir, mean, std):
         self.name = name
         self.split = split
@@ -27,39 +71,102 @@ class Dataset(TorchDataset):
 
 
     def indexer(self, ids, id2audio_path, id2gt, dataset, onepos=False):
-        index = []
-        tmp = []
-        track_index = defaultdict(list)
+        track_ids = []
+        clip_ids = []
+        paths = []
+        labels = []
+        tracks = {}
         track_idx = 0
-        clip_idx = 0
-        for clip_id in ids:
+        for clip_idx, clip_id in enumerate(ids):
             fp = id2audio_path[clip_id]
-            label = id2gt[clip_id]
+            labels.append(id2gt[clip_id])
 
             if dataset == "magnatagatune":
+                # NOTE: the counter only moves on unseen tracks, this numbering is part of
+                # the processed file names
                 track_id = "".join(Path(fp).stem.split("-")[:-2])
-                if track_id not in tmp:
-                    tmp.append(track_id)
+                if track_id not in tracks:
                     track_idx += 1
+                    tracks[track_id] = track_idx
                 fp = f"{track_idx}-{clip_id}-{self.sample_rate}.wav"
                 fp = os.path.join(self.audio_proc_dir, self.split, fp)
+                track_ids.append(track_idx)
+                clip_ids.append(int(clip_id))
             else:
-                track_idx = clip_id
-                clip_id = clip_idx
+                # tracks are identified by their (interned) dataset id
+                track_ids.append(tracks.setdefault(clip_id, len(tracks)))
+                clip_ids.append(clip_idx)
                 fp = os.path.join(self.audio_proc_dir, fp)
-                clip_idx += 1
 
-            for s in range(self.num_segments): 
-                index.append([track_idx, clip_id, s, fp, label])
-                track_index[track_idx].append([clip_id, s, fp, label])
-        return index, track_index
+            if self.compressed is not None:
+                fp = self.raw_audio_path(id2audio_path[clip_id])
+            paths.append(fp)
+
+        index = AudioIndex.from_clips(track_ids, clip_ids, paths, labels, self.num_segments)
+        return index, index.track_index()
+
+    def raw_audio_path(self, path):
+        return os.path.join(self.audio_dir, path)
+
+    def undersample(self, index, perc_train_data):
+        """
+        Reduces |index| to |perc_train_data| of its rows, balanced over the label combinations
+        """
+        print("Train dataset size:", len(index))
+        train_X_indices = np.arange(len(index)).reshape(-1, 1)
+        train_X_indices, _ = random_undersample_balanced(
+            train_X_indices, index.row_labels(), perc_train_data
+        )
+        index = index.select(np.sort(train_X_indices.ravel()))
+        print("Undersampled train dataset size:", len(index))
+        return index
+
+    def setup_manifest(self, args, root):
+        """
+        Probes the headers of all files of the index (once, see AudioManifest) and drops the
+        rows of files that are quarantined, so they are never decoded
+        """
+        if not args.manifest:
+            return
+
+        fps = self.index.row_paths()
+        self.manifest = AudioManifest(root, np.unique(fps).tolist(), num_workers=args.workers)
+        bad = self.manifest.bad_mask(fps)
+        if bad.any():
+            print(f"[{self.name} {self.split}]: Dropped {bad.sum()} segments of quarantined files")
+            self.index = self.index.select(~bad)
+            self.track_index = self.index.track_index()
+
+    def skip_item(self, idx, track_id, fp, error):
+        """
+        Quarantines |fp| after it failed to decode, and returns the next index to load instead.
+        I/O and memory errors (e.g. a network file system hiccup) only skip the item.
+        """
+        print(f"Skipped {track_id, fp}, could not load audio: {error}")
+        if self.manifest is not None and not isinstance(error, SegmentError) and not is_transient(error):
+            self.manifest.quarantine(fp, error)
+        return (idx + 1) % len(self)
+
+    def is_quarantined(self, fp):
+        return self.manifest is not None and self.manifest.is_bad(fp)
+
+    def scratch_path(self, fp):
+        if self.scratch is None:
+            return fp
+        return self.scratch.path(fp)
 
     def loader(self, path):
-        audio, sr = process_wav(self.sample_rate, path, False)
+        audio, sr = process_wav(self.sample_rate, self.scratch_path(path), False)
         return audio, sr
 
     def get_audio(self, fp):
-        audio, sr = self.loader(fp)
+        if self.store is not None:
+            # int16 view into the memory-mapped store, converted after cropping
+            audio = self.store.get(fp)
+        elif self.compressed is not None and is_compressed(fp):
+            audio = self.compressed.read(fp)
+        else:
+            audio, sr = self.loader(fp)
         max_samples = audio.shape[0]
         # if sr != self.sample_rate:
         #     raise Exception("Sample rate is not consistent throughout the dataset")
@@ -72,21 +179,146 @@ class Dataset(TorchDataset):
 
         return audio
 
+    def setup_cache(self, args):
+        if args.cache_mb <= 0 or self.store is not None:
+            return
+
+        self.cache = AudioCache(args.cache_mb * 2 ** 20)
+        self.storage_format = args.storage_format
+        if args.cache_prewarm and self.split == "train":
+            print(f"[{self.name} {self.split}]: Pre-warming the audio cache ({args.cache_mb} MB)")
+            fps = list(dict.fromkeys(self.index.row_paths().tolist()))
+            self.cache.warm(fps, self.read_track)
+
+    def setup_reservoir(self, args):
+        # the TrackBatchSampler sends all pairs of a track to the same worker (see get_audio_dataloader)
+        if args.crops_per_track <= 1 or self.store is not None or not self.pretrain or self.split != "train":
+            return
+
+        self.reservoir = CropReservoir(args.crop_mix * args.batch_size, args.crops_per_track)
+        self.storage_format = args.storage_format
+
+    def read_track(self, fp):
+        return encode_audio(self.read_window(fp), self.storage_format)
+
+    def get_ram_audio(self, idx):
+        slot = self.ram_slots[idx]
+        if slot < 0:
+            raise Exception("Audio is not in the shared memory cache")
+        return self.audios.get_slot(slot)
+
+    def read_window(self, fp, start=0, length=None):
+        if self.compressed is not None and is_compressed(fp):
+            return self.compressed.read(fp, start, length)
+        audio, sr = read_wav_window(self.scratch_path(fp), start, length)
+        return audio
+
+    def prefetch(self, idx):
+        """
+        Pulls the file of row |idx| into the page cache, called by the read-ahead threads
+        (see ReadAheadDataset) ahead of the actual read. Datasets without an AudioIndex
+        (e.g. GTZAN, FMA) read without read-ahead.
+        """
+        if self.audios is not None or not isinstance(getattr(self, "index", None), AudioIndex):
+            return
+        fp = str(self.index.paths[self.index.path_ids[idx]])
+        if self.reservoir is not None and fp in self.reservoir.items:
+            return
+        if self.store is not None:
+            self.store.prefetch(fp)
+        elif self.cache is not None or self.reservoir is not None:
+            # the whole track is decoded into the cache / reservoir
+            if self.cache is None or fp not in self.cache:
+                read_file(fp if self.compressed is not None and is_compressed(fp) else self.scratch_path(fp))
+        elif self.compressed is not None and is_compressed(fp):
+            # the frames of a window are not known before the frame index is read
+            if os.path.getsize(fp) <= PREFETCH_WHOLE_BYTES:
+                read_file(fp)
+        else:
+            # only the bytes of the window that get_segment / get_random_crops read
+            fp = self.scratch_path(fp)
+            header = read_wav_header(fp)
+            frame_size = header.dtype.itemsize * header.channels
+            if not self.supervised and self.pretrain and self.transform:
+                if header.num_samples * frame_size <= PREFETCH_WHOLE_BYTES:
+                    read_file(fp, header.offset, header.num_samples * frame_size)
+            else:
+                start = int(self.index.segments[idx]) * self.audio_length
+                read_file(fp, header.offset + start * frame_size, self.audio_length * frame_size)
+
+    def get_num_samples(self, fp):
+        if self.store is not None:
+            return self.store.num_samples(fp)
+        if self.cache is not None and fp in self.cache:
+            return self.cache.items[fp].shape[0]
+        if self.compressed is not None and is_compressed(fp):
+            return self.compressed.num_samples(fp)
+        if self.manifest is not None:
+            num_samples = self.manifest.num_samples(fp)
+            if num_samples is not None:
+                return num_samples
+        return read_wav_header(self.scratch_path(fp)).num_samples
+
+    def get_audio_window(self, fp, start, length):
+        """
+        Reads only samples [start, start + length) of the clip (raw PCM, see pcm_to_float)
+        """
+        if self.store is not None:
+            return self.store.get(fp, start, length)
+
+        if self.cache is not None:
+            audio = self.cache.get(fp)
+            if audio is None:
+                audio = self.read_track(fp)
+                self.cache.put(fp, audio)
+            return audio[start : start + length]
+
+        return self.read_window(fp, start, length)
+
+    def get_segment(self, fp, segment):
+        audio = self.get_audio_window(fp, int(segment) * self.audio_length, self.audio_length)
+        if audio.shape[0] < self.audio_length:
+            raise SegmentError("Segment exceeds number of samples in clip")
+        return audio
+
+    def get_random_crop(self, fp):
+        max_samples = self.get_num_samples(fp)
+        if max_samples - self.audio_length <= 0:
+            raise Exception("Max samples exceeds number of samples in crop")
+
+        start_idx = random.randint(0, max_samples - self.audio_length)
+        return self.get_audio_window(fp, start_idx, self.audio_length)
+
+    def get_random_crops(self, fp, num_crops=2):
+        """
+        |num_crops| random crops of the clip, from one decode of the clip if there is a reservoir
+        """
+        if self.reservoir is None:
+            return tuple(self.get_random_crop(fp) for _ in range(num_crops))
+
+        audio = self.reservoir.get(fp, self.read_track)
+        max_samples = audio.shape[0]
+        if max_samples - self.audio_length <= 0:
+            raise Exception("Max samples exceeds number of samples in crop")
+
+        crops = []
+        for _ in range(num_crops):
+            start_idx = random.randint(0, max_samples - self.audio_length)
+            crops.append(audio[start_idx : start_idx + self.audio_length])
+        return tuple(crops)
+
     def __len__(self):
         return len(self.tracks_list)
 
     def get_full_size_audio(self, fp):
-        audio = self.get_audio(fp)
-
-        # split into equally sized tensors of self.audio_length
-        audio = torch.from_numpy(audio).reshape(1, -1)
-        batch = torch.split(audio, self.audio_length, dim=1)
-
-        # remove last, since it is not a full self.audio_length, and stack
-        batch = torch.cat(batch[:-1])
+        # split into equally sized tensors of self.audio_length, and remove the last,
+        # since it is not a full self.audio_length (so it is not read at all)
+        num_segments = -(-self.get_num_samples(fp) // self.audio_length) - 1
+        audio = self.get_audio_window(fp, 0, num_segments * self.audio_length)
+        audio = torch.from_numpy(pcm_to_float(audio))
 
         # reshape to B x 1 x N
-        batch = batch.reshape(batch.shape[0], 1, -1)
+        batch = audio.reshape(num_segments, 1, -1)
         return batch
 
     def normalise_audio(self, audio):
@@ -112,5 +344,7 @@ class Dataset(TorchDataset):
             if (start_idx + self.audio_length) > audio.shape[0]:
                 return None
 
-            batch[idx, 0, :] = torch.from_numpy(audio[start_idx : start_idx + self.audio_length])
+            batch[idx, 0, :] = torch.from_numpy(
+                pcm_to_float(audio[start_idx : start_idx + self.audio_length])
+            )
         return batch
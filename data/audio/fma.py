@@ -18,7 +18,9 @@ try:
 except:
     pass
 
-from scripts.datasets.utils import write_statistics
+from scripts.datasets.utils import read_statistics
+from scripts.datasets.statistics import get_dataset_stats
+from .index import AudioIndex
 
 def default_loader(path):
     # with audio normalisation
@@ -26,33 +28,19 @@ def default_loader(path):
     return audio, sr
 
 
-def get_dataset_stats(loader, tracks_list):
-    means = []
-    stds = []
-    for track_id, fp, label, _ in tqdm(tracks_list):
-        audio, sr = loader(fp)
-        if np.isnan(audio.mean()) or np.isnan(audio.std()):
-            continue
-        means.append(audio.mean())
-        stds.append(audio.std())
-    return np.array(means).mean(), np.array(stds).mean()
-
-
 def default_indexer(path, tracks, labels, sample_rate):
-    items = []
-    track_dict = defaultdict(list)
+    rows = []
     for idx, t in enumerate(tracks.index):
         fp = get_audio_path(path, t)
         fp = f"{os.path.splitext(fp)[0]}.wav"
         if os.path.exists(fp) and os.path.getsize(fp) > 0:
-            dir_id = str(Path(fp).parent.name)
-            track_id = str(Path(fp).stem)
+            track_id = int(Path(fp).stem)
             label = labels[idx] # TODO
             segment = 0
-            items.append((track_id, fp, label, segment))
-            track_dict[track_id].append(idx)
+            rows.append((track_id, idx, segment, fp, label))
 
-    return items, track_dict
+    index = AudioIndex.from_rows(rows)
+    return index, index.track_index()
 
 
 class FmaDataset(Dataset):
@@ -130,19 +118,14 @@ class FmaDataset(Dataset):
             print(f"[{name} dataset]: Fetching dataset statistics (mean/std) for {version}_{self.sample_rate}{at_least_one_pos} version")
             if train:
                 self.mean, self.std = get_dataset_stats(
-                    self.loader, self.tracks_list
+                    self.loader, self.tracks_list.row_paths().tolist(), stats_path, args.workers
                 )
-                write_statistics(self.mean, self.std, len(self.tracks_list), stats_path)
             else:
                 raise FileNotFoundError(
                     f"{stats_path} does not exist, no mean/std from train set"
                 )
         else:
-            with open(stats_path, "r") as f:
-                l = f.readlines()
-                stats = l[1].split(";")
-                self.mean = float(stats[0])
-                self.std = float(stats[1])
+            self.mean, self.std = read_statistics(stats_path)
         
         print(f"[{name} dataset ({version}_{self.sample_rate})]: Loaded mean/std: {self.mean}, {self.std}")
         print(f"[{name}]: Loaded {len(self.tracks_list)} tracks")
@@ -171,7 +154,7 @@ class FmaDataset(Dataset):
         return (norm_audio * self.std) + self.mean
 
     def __getitem__(self, index):
-        track_id, fp, label, _ = self.tracks_list[index]
+        track_id, clip_id, segment, fp, label = self.tracks_list[index]
         
         try:
             audio = self.get_audio(fp)
@@ -200,8 +183,7 @@ class FmaDataset(Dataset):
         """
         batch = torch.zeros(batch_size, 1, self.audio_length)
         for idx in range(batch_size):
-            index = self.tracks_dict[track_id][0]
-            _, fp, label, _ = self.tracks_list[index]  # from non-dup!!
+            _, _, fp, _ = self.tracks_dict[track_id][0]
 
             audio = self.get_audio(fp)
             audio = self.normalise_audio(audio)
@@ -7,7 +7,10 @@ import numpy as np
 from pathlib import Path
 from collections import defaultdict
 from tqdm import tqdm
-from scripts.datasets.utils import write_statistics
+from scripts.datasets.utils import read_statistics
+from scripts.datasets.statistics import get_dataset_stats
+from .manifest import AudioManifest, is_transient
+from utils.audio import read_wav_header
 import random
 
 # much faster loading
@@ -41,38 +44,74 @@ def path2gt(path):
         raise Exception('Did not find the corresponding ground truth (' + str(path) + ')!')
 
 
-def default_indexer(args, path, annotations_file):
+def read_annotations(annotations_file):
+    with open(annotations_file, "r") as f:
+        return f.read().splitlines()
+
+
+def probe_header(fp, manifest):
+    """
+    (num_samples, sample_rate) of |fp| from the manifest, or from its header without one.
+    None if the file cannot be read (it is then skipped).
+    """
+    if manifest is not None:
+        if manifest.is_bad(fp):
+            print("Skipped {}: {}".format(fp, manifest.quarantined[fp]))
+            return None
+        if manifest.num_samples(fp) is None:
+            print("Skipped {}: could not probe the file".format(fp))
+            return None
+        return manifest.num_samples(fp), manifest.sample_rate(fp)
+
+    try:
+        header = read_wav_header(fp)
+    except Exception as e:
+        print("Skipped {}: {}".format(fp, e))
+        return None
+    return header.num_samples, header.sample_rate
+
+
+def default_indexer(args, path, annotations_file, manifest=None):
     items = []
     tracks_dict = defaultdict(list)
     index = {}
     index_num = 0
-    with open(annotations_file, "r") as f:
-        lines = f.read().splitlines()
-        for idx, fp in enumerate(lines):
-            label = path2gt(fp)
-
-            fp = os.path.join(path, fp)
-            if os.path.exists(fp) and os.path.getsize(fp) > 0:
-                audio_example, _ = default_loader(fp)
-                num_segments = audio_example.size(1) // args.audio_length
-
-                index_name = Path(fp).stem
-                if index_name not in index.keys():
-                    index[index_name] = index_num
-                    index_num += 1
-
-                # if supervised/eval
-                if args.model_name == "supervised" or args.lin_eval:
-                    # n segments so it sees all data
-                    for n in range(num_segments):
-                        items.append((index[index_name], fp, label, n))
-                else:
-                    items.append(
-                        (index[index_name], fp, label, 0)
-                    )  # only one segment, since full track
-                tracks_dict[index[index_name]].append(idx)
-            else:
-                print("File not found: {}".format(fp))
+    for idx, fp in enumerate(read_annotations(annotations_file)):
+        label = path2gt(fp)
+
+        fp = os.path.join(path, fp)
+
+        # the number of segments is read from the header, instead of decoding the file
+        probed = probe_header(fp, manifest)
+        if probed is None:
+            continue
+        num_samples, sample_rate = probed
+        if sample_rate != args.sample_rate:
+            raise Exception(
+                f"{fp} has a sample rate of {sample_rate} Hz, the configured sample rate is {args.sample_rate} Hz"
+            )
+        if num_samples - args.audio_length <= 0:
+            # too short for this audio_length, not a bad file
+            print("Skipped {}: Max samples exceeds number of samples in crop".format(fp))
+            continue
+
+        num_segments = num_samples // args.audio_length
+
+        index_name = Path(fp).stem
+        if index_name not in index.keys():
+            index[index_name] = index_num
+            index_num += 1
+
+        # if supervised/eval
+        if args.model_name == "supervised" or args.lin_eval:
+            # n segments so it sees all data
+            for n in range(num_segments):
+                items.append((index[index_name], fp, label, n))
+        else:
+            items.append(
+                (index[index_name], fp, label, 0)
+            )  # only one segment, since full track
+        tracks_dict[index[index_name]].append(idx)
     return items, tracks_dict
 
 
@@ -82,16 +121,6 @@ def default_loader(path):
     return audio, sr
 
 
-def get_dataset_stats(loader, tracks_list, stats_path):
-    means = []
-    stds = []
-    for track_id, fp, label, _ in tqdm(tracks_list):
-        audio, sr = loader(fp)
-        means.append(audio.mean())
-        stds.append(audio.std())
-    return np.array(means).mean(), np.array(stds).mean()
-
-
 
 class GTZANDataset(Dataset):
     def __init__(
@@ -123,8 +152,17 @@ class GTZANDataset(Dataset):
         )
         self.annotations_file = Path(annotations_dir) / f"{split_name}_filtered.txt"
 
+        # header-only probe of all files and the quarantine list, instead of decoding every file
+        self.manifest = None
+        if args.manifest:
+            self.manifest = AudioManifest(
+                os.path.join(self.audio_dir, split_name),
+                [os.path.join(self.audio_dir, fp) for fp in read_annotations(self.annotations_file)],
+                num_workers=args.workers,
+            )
+
         self.tracks_list_all, self.tracks_dict = self.indexer(
-            args, self.audio_dir, self.annotations_file
+            args, self.audio_dir, self.annotations_file, self.manifest
         )
 
         self.nodups = []
@@ -164,19 +202,14 @@ class GTZANDataset(Dataset):
             print(f"[{name} dataset]: Fetching dataset statistics (mean/std)")
             if train:
                 self.mean, self.std = get_dataset_stats(
-                    self.loader, self.tracks_list, stats_path
+                    self.loader, [fp for _, fp, _, _ in self.tracks_list], stats_path, args.workers
                 )
-                write_statistics(self.mean, self.std, len(self.tracks_list), stats_path)
             else:
                 raise FileNotFoundError(
                     f"{stats_path} does not exist, no mean/std from train set"
                 )
         else:
-            with open(stats_path, "r") as f:
-                l = f.readlines()
-                stats = l[1].split(";")
-                self.mean = float(stats[0])
-                self.std = float(stats[1])
+            self.mean, self.std = read_statistics(stats_path)
 
         print(f"[{name} dataset]: Loaded mean/std: {self.mean}, {self.std}")
 
@@ -222,13 +255,17 @@ class GTZANDataset(Dataset):
     # get one segment (==59049 samples) and its 50-d label
     def __getitem__(self, index):
         track_id, fp, label, segment = self.tracks_list[index]
+        if self.manifest is not None and self.manifest.is_bad(fp):
+            # known to be bad, do not spend a decode on it
+            return self.__getitem__((index + 1) % len(self))
 
         try:
             audio = self.get_audio(fp)
-        except:
-            pass
-            print(f"Skipped {track_id, fp}, could not load audio")
-            return self.__getitem__(index+1)
+        except Exception as e:
+            print(f"Skipped {track_id, fp}, could not load audio: {e}")
+            if self.manifest is not None and not is_transient(e):
+                self.manifest.quarantine(fp, e)
+            return self.__getitem__((index + 1) % len(self))
 
         # only transform if unsupervised training
         if self.lin_eval or self.model_name == "supervised":
@@ -0,0 +1,131 @@
+import numpy as np
+
+
+class TrackIndex:
+    """
+    Read-only mapping of track_id -> [(clip_id, segment, fp, label), ...] over the rows of an
+    AudioIndex, built with one argsort instead of a dict of Python lists.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.order = np.argsort(index.track_ids, kind="stable")
+        track_ids, starts = np.unique(index.track_ids[self.order], return_index=True)
+        self.track_ids = track_ids
+        self.bounds = np.append(starts, len(self.order))
+        self.positions = {track_id: i for i, track_id in enumerate(track_ids.tolist())}
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def __contains__(self, track_id):
+        return track_id in self.positions
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return self.track_ids.tolist()
+
+    def rows(self, track_id):
+        i = self.positions[track_id]
+        return self.order[self.bounds[i] : self.bounds[i + 1]]
+
+    def __getitem__(self, track_id):
+        return [self.index[row][1:] for row in self.rows(track_id)]
+
+    def items(self):
+        for track_id in self.keys():
+            yield track_id, self[track_id]
+
+
+class AudioIndex:
+    """
+    Columnar dataset index. Every row (one segment of a clip) is stored in integer columns,
+    paths and labels are stored once per clip in a path table (fixed-width strings) and a label
+    matrix. There are no per-row Python objects, so DataLoader workers can read it without
+    refcount updates copying pages. Indexing a row returns (track_id, clip_id, segment, fp, label).
+    """
+
+    def __init__(self, track_ids, clip_ids, segments, path_ids, paths, labels):
+        self.track_ids = np.asarray(track_ids, dtype=np.int64)
+        self.clip_ids = np.asarray(clip_ids, dtype=np.int64)
+        self.segments = np.asarray(segments, dtype=np.int64)
+        self.path_ids = np.asarray(path_ids, dtype=np.int64)
+        self.paths = np.asarray(paths, dtype=str)
+        self.labels = np.asarray(labels)
+
+    @classmethod
+    def from_clips(cls, track_ids, clip_ids, paths, labels, num_segments=1):
+        num_clips = len(paths)
+        return cls(
+            np.repeat(track_ids, num_segments),
+            np.repeat(clip_ids, num_segments),
+            np.tile(np.arange(num_segments), num_clips),
+            np.repeat(np.arange(num_clips), num_segments),
+            paths,
+            labels,
+        )
+
+    @classmethod
+    def from_rows(cls, rows):
+        track_ids = []
+        clip_ids = []
+        segments = []
+        path_ids = []
+        paths = []
+        labels = []
+        interned = {}
+        for track_id, clip_id, segment, fp, label in rows:
+            if fp not in interned:
+                interned[fp] = len(paths)
+                paths.append(fp)
+                labels.append(label)
+            track_ids.append(track_id)
+            clip_ids.append(clip_id)
+            segments.append(segment)
+            path_ids.append(interned[fp])
+        return cls(track_ids, clip_ids, segments, path_ids, paths, labels)
+
+    def __len__(self):
+        return len(self.track_ids)
+
+    def __iter__(self):
+        for row in range(len(self)):
+            yield self[row]
+
+    def __getitem__(self, row):
+        if isinstance(row, (slice, list, np.ndarray)):
+            return self.select(row)
+
+        path_id = self.path_ids[row]
+        return (
+            int(self.track_ids[row]),
+            int(self.clip_ids[row]),
+            int(self.segments[row]),
+            str(self.paths[path_id]),
+            self.labels[path_id],
+        )
+
+    def select(self, rows):
+        """
+        Returns the index of the selected rows (boolean mask, positions or slice),
+        sharing the path table and label matrix
+        """
+        return AudioIndex(
+            self.track_ids[rows],
+            self.clip_ids[rows],
+            self.segments[rows],
+            self.path_ids[rows],
+            self.paths,
+            self.labels,
+        )
+
+    def row_labels(self):
+        return self.labels[self.path_ids]
+
+    def row_paths(self):
+        return self.paths[self.path_ids]
+
+    def track_index(self):
+        return TrackIndex(self)
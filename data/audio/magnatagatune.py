@@ -8,11 +8,14 @@ from pathlib import Path
 from collections import defaultdict
 from tqdm import tqdm
 import time
+import json
 
 from .dataset import Dataset
+from .annotations import cached_annotations
+from .packed import PackedAudioStore, load_shared_tracks
+from .compressed import CompressedAudioReader
 from scripts.datasets.utils import write_statistics
-from utils import random_undersample_balanced
-from utils.audio import load_tracks, concat_tracks
+from utils.audio import pcm_to_float
 
 
 def load_id2gt(gt_file):
@@ -21,7 +24,7 @@ def load_id2gt(gt_file):
     id2gt = dict()
     for line in fgt.readlines():
         id, gt = line.strip().split("\t")  # id is string
-        id2gt[id] = eval(gt)  # gt is array
+        id2gt[id] = json.loads(gt)  # gt is array
         ids.append(id)
     return ids, id2gt
 
@@ -37,14 +40,14 @@ def load_id2path(index_file):
     return paths, id2path
 
 
-def get_dataset_stats(loader, tracks_list):
-    means = []
-    stds = []
-    for track_id, fp, label, _ in tqdm(tracks_list):
-        audio, sr = loader(fp)
-        means.append(audio.mean())
-        stds.append(audio.std())
-    return np.array(means).mean(), np.array(stds).mean()
+def build_annotations(gt_file, index_file):
+    ids, id2gt = load_id2gt(gt_file)
+    _, id2path = load_id2path(index_file)
+    return {
+        "ids": np.array(ids),
+        "labels": np.array([id2gt[id] for id in ids], dtype=np.float32),
+        "paths": np.array([id2path[id] for id in ids]),
+    }
 
 
 class MTTDataset(Dataset):
@@ -52,6 +55,9 @@ class MTTDataset(Dataset):
     base_dir = "magnatagatune"
     splits = ("train", "valid", "test")
 
+    # pre-train with batches of unique tracks (a track consists of multiple clips)
+    track_batches = True
+
     def __init__(
         self, args, split, pretrain, download=False, transform=None,
     ):
@@ -82,6 +88,15 @@ class MTTDataset(Dataset):
             args.data_input_dir, self.base_dir, "processed"
         )
 
+        if args.audio_format == "compressed":
+            # decode crops straight from the original files, instead of the processed WAV clips
+            self.compressed = CompressedAudioReader(
+                self.sample_rate, os.path.join(args.data_input_dir, self.base_dir, "frame_index")
+            )
+
+        if args.packed:
+            self.store = PackedAudioStore(os.path.join(self.audio_proc_dir, self.split), self.sample_rate)
+
         mtt_processed_annot = Path(
             args.data_input_dir, self.base_dir, "processed_annotations"
         )
@@ -99,43 +114,30 @@ class MTTDataset(Dataset):
             self.tags = eval(lines[1][lines[1].find("[") :])
             self.num_tags = len(self.tags)
 
-        [audio_repr_paths, id2audio_path] = load_id2path(
-            Path(mtt_processed_annot) / "index_mtt.tsv"
+        # compiled once into an .npz cache, rebuilt only when the annotation files change
+        index_file = Path(mtt_processed_annot) / "index_mtt.tsv"
+        annotations = cached_annotations(
+            Path(mtt_processed_annot) / "cache" / f"{self.annotations_file.stem}.npz",
+            [self.annotations_file, index_file],
+            lambda: build_annotations(self.annotations_file, index_file),
         )
-        [ids, id2gt] = load_id2gt(self.annotations_file)
+        ids = annotations["ids"].tolist()
+        id2gt = dict(zip(ids, annotations["labels"]))
+        id2audio_path = dict(zip(ids, annotations["paths"].tolist()))
         self.id2audio_path = id2audio_path
 
         self.index, self.track_index = self.indexer(
             ids, id2audio_path, id2gt, "magnatagatune", onepos=args.onepos
         )
+        self.setup_manifest(args, os.path.join(self.audio_proc_dir, self.split))
 
         if not self.supervised and self.pretrain:
             # we already load a full fragment of audio (with 10 segments)
-            self.index = [
-                [track_id, clip_id, segment, fp, label]
-                for track_id, clip_id, segment, fp, label in self.index
-                if segment == 0
-            ]
+            self.index = self.index.select(self.index.segments == 0)
 
         # reduce dataset to n%
         if args.perc_train_data < 1.0 and split == "train":  # only on train set
-            print("Train dataset size:", len(self.index))
-            train_X_indices = np.array(
-                [idx for idx in range(len(self.index))]
-            ).reshape(-1, 1)
-            train_y = np.array([label for _, _, _, _, label in self.index])
-            train_X_indices, _ = random_undersample_balanced(
-                train_X_indices, train_y, args.perc_train_data
-            )
-
-            new_index = []
-            for idx, (track_id, clip_id, segment, fp, label) in enumerate(self.index):
-                if idx in train_X_indices:
-                    new_index.append([track_id, clip_id, segment, fp, label])
-
-
-            self.index = new_index
-            print("Undersampled train dataset size:", len(self.index), len(self.track_index))
+            self.index = self.undersample(self.index, args.perc_train_data)
 
         # print(f"Num tracks: {len(self.tracks_list)}")
 
@@ -145,23 +147,21 @@ class MTTDataset(Dataset):
 
         # remove tracks if they do not contain a label:
         if args.onepos:
-            self.index = [[track_id, clip_id, segment, fp, label] for track_id, clip_id, segment, fp, label in self.index if sum(label) != 0]
+            self.index = self.index.select(self.index.row_labels().sum(axis=1) != 0)
             print(split, len(self.index))
             
-        if not self.supervised and self.pretrain and self.split == "train":
-            # track index contains track_ids matched with clip_ids, so filtering is easier
-            print(
-                "Concatenating tracks for pre-training (to avoid positive samples in the negative samples batch)"
-            )
+        # clips of the same track are kept out of each other's negatives by the
+        # TrackBatchSampler (see get_audio_dataloader), which reads the track index
+        self.track_index = self.index.track_index()
 
-            # new track_id filtered index (unique track_ids)
-            self.index = concat_tracks(
-                args.sample_rate, self.audio_proc_dir, self.split, self.track_index
-            )
+        self.setup_cache(args)
+        self.setup_reservoir(args)
 
         if self.load_ram and self.pretrain and self.split == "train":
             print("Loading train data into memory for faster training")
-            self.audios = load_tracks(args.sample_rate, self.index)
+            self.audios, self.ram_slots = load_shared_tracks(
+                args, self.name, self.split, self.index
+            )
 
         super(MTTDataset, self).__init__(
             self.name,
@@ -175,32 +175,36 @@ class MTTDataset(Dataset):
             self.std,
         )
 
-        # memory leak bug in DDP
-        if args.world_size > 1:
-            self.index = np.array(self.index)
-            self.track_index = {k: np.array(v) for k, v in self.track_index.items()}
-
     # get one segment (==59049 samples) and its 50-d label
     def __getitem__(self, idx):
         track_id, clip_id, segment, fp, label = self.index[idx]
+        if self.is_quarantined(fp):
+            # known to be bad, do not spend a decode on it
+            return self.__getitem__((idx + 1) % len(self))
 
         ## for faster i/o
         # clip_id, segment, fp, label = random.choice(self.track_index[track_id])
         ## fp = os.path.splitext(fp)[0] + "-" + str(segment) + ".wav"
 
         label = torch.FloatTensor(label)
+        crop = not self.supervised and self.pretrain and self.transform
         try:
             if self.load_ram and self.pretrain and self.split == "train":
-                audio = self.audios["{}-{}".format(track_id, clip_id)]
+                audio = self.get_ram_audio(idx)
+                if not crop:
+                    start_idx = int(segment) * self.audio_length
+                    audio = audio[start_idx : start_idx + self.audio_length]
+            elif crop:
+                # only read the two |audio_length| windows that are cropped for the views
+                audio = self.get_random_crops(fp)
             else:
-                audio = self.get_audio(fp)
+                audio = self.get_segment(fp, segment)
 
         except Exception as e:
-            print(f"Skipped {track_id, fp}, could not load audio: {e}")
-            return self.__getitem__(idx + 1)
+            return self.__getitem__(self.skip_item(idx, track_id, fp, e))
 
         # only transform if unsupervised training
-        if not self.supervised and self.pretrain and self.transform:
+        if crop:
             audio = self.transform(audio, self.mean, self.std)
         # elif self.model_name == "cpc":
         #     max_samples = audio.size(1)
@@ -209,8 +213,7 @@ class MTTDataset(Dataset):
         #     audio = self.normalise_audio(audio)
         #     audio = (audio, audio)
         else:
-            start_idx = int(segment) * self.audio_length
-            audio = audio[start_idx : start_idx + self.audio_length]
+            audio = pcm_to_float(audio)
             audio = audio.reshape(1, -1)  # [channels, samples]
             audio = torch.from_numpy(audio)
             audio = (audio, audio)
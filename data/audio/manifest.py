@@ -0,0 +1,238 @@
+import os
+import time
+import multiprocessing
+import numpy as np
+import torchaudio
+from tqdm import tqdm
+
+from utils.audio import read_wav_header
+
+
+# errors of the environment (I/O, file handles, memory) rather than of the file, which do not
+# quarantine it
+TRANSIENT_ERRORS = (OSError, MemoryError)
+
+
+def is_transient(error):
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+def manifest_paths(root):
+    root = root.rstrip(os.sep)
+    return root + ".manifest.npz", root + ".quarantine.tsv"
+
+
+def probe_torchaudio(fp):
+    info = torchaudio.info(fp)
+    if isinstance(info, tuple):  # older torchaudio: (signal info, encoding info)
+        si = info[0]
+        return si.length // si.channels, int(si.rate), si.channels
+    return info.num_frames, info.sample_rate, info.num_channels
+
+
+def probe(fp):
+    """
+    Reads the number of samples, sample rate and channels of |fp| from its header only.
+    Returns (fp, num_samples, sample_rate, channels, error), num_samples is -1 after a transient
+    error (the file is probed again on the next run, and not quarantined)
+    """
+    try:
+        if fp.endswith(".wav"):
+            header = read_wav_header(fp)
+            # a truncated file holds fewer samples than its header declares
+            frame_size = header.dtype.itemsize * header.channels
+            available = (os.path.getsize(fp) - header.offset) // frame_size
+            num_samples = min(header.num_samples, available)
+            sample_rate = header.sample_rate
+            channels = header.channels
+        else:
+            num_samples, sample_rate, channels = probe_torchaudio(fp)
+
+        if num_samples <= 0:
+            raise Exception("no audio samples")
+    except TRANSIENT_ERRORS as e:
+        return fp, -1, 0, 0, str(e) or type(e).__name__
+    except Exception as e:
+        return fp, 0, 0, 0, str(e) or type(e).__name__
+    return fp, num_samples, sample_rate, channels, ""
+
+
+class AudioManifest:
+    """
+    Header-only probe (num_samples, sample_rate, channels) of the audio files of a dataset split,
+    persisted in <root>.manifest.npz, together with the quarantine list of files that cannot
+    be read (<root>.quarantine.tsv). Files are only probed again when their size or mtime change.
+    Columns are sorted by path, so lookups are a binary search instead of a dict of Python objects.
+    """
+
+    # seconds between two checks for files that other workers / ranks quarantined
+    refresh_interval = 10.0
+
+    def __init__(self, root, fps, num_workers=None):
+        self.path, self.quarantine_path = manifest_paths(root)
+        fps = sorted(set(str(fp) for fp in fps))
+
+        sizes = np.full(len(fps), -1, dtype=np.int64)
+        mtimes = np.full(len(fps), -1, dtype=np.int64)
+        for i, fp in enumerate(fps):
+            try:
+                st = os.stat(fp)
+            except OSError:
+                continue
+            sizes[i] = st.st_size
+            mtimes[i] = st.st_mtime_ns
+
+        cached = {}
+        if os.path.exists(self.path):
+            with np.load(self.path) as m:
+                for row in zip(
+                    m["paths"].tolist(),
+                    m["sizes"].tolist(),
+                    m["mtimes"].tolist(),
+                    m["num_samples"].tolist(),
+                    m["sample_rates"].tolist(),
+                    m["channels"].tolist(),
+                    m["errors"].tolist(),
+                ):
+                    cached[row[0]] = row[1:]
+
+        entries = {}
+        todo = []
+        for fp, size, mtime in zip(fps, sizes.tolist(), mtimes.tolist()):
+            entry = cached.get(fp)
+            if size < 0:
+                entries[fp] = (0, 0, 0, "file not found")
+            elif entry is not None and entry[:2] == (size, mtime):
+                entries[fp] = entry[2:]
+            else:
+                todo.append(fp)
+
+        if todo:
+            print(f"Probing the headers of {len(todo)}/{len(fps)} audio files ({self.path})")
+            with multiprocessing.Pool(processes=num_workers or None) as p:
+                for fp, num_samples, sample_rate, channels, error in tqdm(
+                    p.imap_unordered(probe, todo, chunksize=64), total=len(todo)
+                ):
+                    entries[fp] = (num_samples, sample_rate, channels, error)
+
+        self.paths = np.array(fps, dtype=str)
+        self.num_samples_ = np.array([entries[fp][0] for fp in fps], dtype=np.int64)
+        self.sample_rates = np.array([entries[fp][1] for fp in fps], dtype=np.int64)
+        self.channels = np.array([entries[fp][2] for fp in fps], dtype=np.int64)
+        errors = [entries[fp][3] for fp in fps]
+        transient = self.num_samples_ < 0
+        if transient.any():
+            print(f"Could not probe {transient.sum()} audio files, they are probed again on the next run")
+            mtimes[transient] = -1
+
+        if todo or len(cached) != len(fps):
+            # write next to the manifest and rename, so readers never see a partial manifest
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    paths=self.paths,
+                    sizes=sizes,
+                    mtimes=mtimes,
+                    num_samples=self.num_samples_,
+                    sample_rates=self.sample_rates,
+                    channels=self.channels,
+                    errors=np.array(errors, dtype=str),
+                )
+            os.replace(tmp_path, self.path)
+
+        # files that were replaced since they were quarantined get another chance
+        stats = dict(zip(fps, zip(sizes.tolist(), mtimes.tolist())))
+        self.quarantined = {}
+        self.quarantine_size = 0
+        kept = []
+        quarantined = self.read_quarantine()
+        for fp, (size, mtime, error) in quarantined.items():
+            if stats.get(fp, (size, mtime)) == (size, mtime):
+                self.quarantined[fp] = error
+                kept.append(f"{fp}\t{size}\t{mtime}\t{error}\n")
+
+        if len(kept) != len(quarantined):
+            tmp_path = f"{self.quarantine_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                f.writelines(kept)
+            os.replace(tmp_path, self.quarantine_path)
+            self.quarantine_size = os.path.getsize(self.quarantine_path)
+
+        for fp, error, num_samples in zip(fps, errors, self.num_samples_.tolist()):
+            if error and num_samples >= 0 and fp not in self.quarantined:
+                self.quarantine(fp, error)
+
+        if self.quarantined:
+            print(f"{len(self.quarantined)} quarantined audio files ({self.quarantine_path})")
+        self.refreshed = time.monotonic()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __contains__(self, fp):
+        return self.find(fp) >= 0
+
+    def find(self, fp):
+        i = np.searchsorted(self.paths, fp)
+        if i < len(self.paths) and self.paths[i] == fp:
+            return i
+        return -1
+
+    def num_samples(self, fp):
+        i = self.find(fp)
+        if i < 0 or self.num_samples_[i] < 0:
+            return None
+        return int(self.num_samples_[i])
+
+    def sample_rate(self, fp):
+        i = self.find(fp)
+        if i < 0 or self.num_samples_[i] < 0:
+            return None
+        return int(self.sample_rates[i])
+
+    def read_quarantine(self):
+        quarantined = {}
+        if not os.path.exists(self.quarantine_path):
+            return quarantined
+        with open(self.quarantine_path, "r") as f:
+            for line in f.read().splitlines():
+                fp, size, mtime, error = line.split("\t", 3)
+                quarantined[fp] = (int(size), int(mtime), error)
+        self.quarantine_size = os.path.getsize(self.quarantine_path)
+        return quarantined
+
+    def quarantine(self, fp, error):
+        """
+        Adds |fp| to the quarantine list. Lines are appended, so every DataLoader worker
+        and rank can add the files it fails to read.
+        """
+        error = " ".join(str(error).split()) or "unknown error"
+        try:
+            st = os.stat(fp)
+            size, mtime = st.st_size, st.st_mtime_ns
+        except OSError:
+            size, mtime = -1, -1
+
+        line = f"{fp}\t{size}\t{mtime}\t{error}\n"
+        self.quarantined[fp] = error
+        with open(self.quarantine_path, "a") as f:
+            f.write(line)
+        self.quarantine_size += len(line.encode())
+
+    def is_bad(self, fp):
+        # pick up the files that other workers quarantined, at most every |refresh_interval|
+        now = time.monotonic()
+        if now - self.refreshed >= self.refresh_interval:
+            self.refreshed = now
+            try:
+                size = os.path.getsize(self.quarantine_path)
+            except OSError:
+                size = 0
+            if size != self.quarantine_size:
+                for q, (_, _, error) in self.read_quarantine().items():
+                    self.quarantined.setdefault(q, error)
+        return fp in self.quarantined
+
+    def bad_mask(self, fps):
+        return np.isin(fps, list(self.quarantined))
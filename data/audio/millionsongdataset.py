@@ -3,18 +3,21 @@ import torchaudio
 import os
 import pandas as pd
 import pickle
+import json
 import numpy as np
 from pathlib import Path
 from collections import defaultdict
 from tqdm import tqdm
 from scripts.datasets.utils import write_statistics
-from utils import random_undersample_balanced
 from tqdm import tqdm
-from utils.audio import load_tracks, concat_tracks
+from utils.audio import pcm_to_float
 
 import random
 
 from .dataset import Dataset
+from .annotations import cached_annotations
+from .packed import PackedAudioStore, load_shared_tracks
+from .compressed import CompressedAudioReader
 
 
 """
@@ -29,7 +32,7 @@ def load_id2gt(gt_file, msd_7d):
     for line in fgt.readlines():
         msd_id, gt = line.strip().split("\t")  # id is string
         id_7d = msd_7d[msd_id]
-        id2gt[msd_id] = eval(gt)  # gt is array
+        id2gt[msd_id] = json.loads(gt)  # gt is array
         ids.append(msd_id)
     return ids, id2gt
 
@@ -47,6 +50,18 @@ def load_id2path(index_file, msd_7d):
     return paths, id2path
 
 
+def build_annotations(gt_file, index_file, msd_7d_file):
+    with open(msd_7d_file, "rb") as f:
+        msd_7d = pickle.load(f)
+    ids, id2gt = load_id2gt(gt_file, msd_7d)
+    _, id2path = load_id2path(index_file, msd_7d)
+    return {
+        "ids": np.array(ids),
+        "labels": np.array([id2gt[msd_id] for msd_id in ids], dtype=np.float32),
+        "paths": np.array([id2path[msd_id] for msd_id in ids]),
+    }
+
+
 def default_indexer(args, path, id2audio, id2gt):
     items = []
     tracks_dict = defaultdict(list)
@@ -73,16 +88,6 @@ def default_loader(path):
     return audio, sr
 
 
-def get_dataset_stats(loader, tracks_list):
-    means = []
-    stds = []
-    for track_id, fp, label in tqdm(tracks_list):
-        audio, sr = loader(fp)
-        means.append(audio.mean())
-        stds.append(audio.std())
-    return np.array(means).mean(), np.array(stds).mean()
-
-
 class MSDDataset(Dataset):
 
     base_dir = "msd"
@@ -118,6 +123,15 @@ class MSDDataset(Dataset):
             args.data_input_dir, self.base_dir, "raw"
         )
 
+        if args.audio_format == "compressed":
+            # decode crops straight from the original files, instead of the processed WAV clips
+            self.compressed = CompressedAudioReader(
+                self.sample_rate, os.path.join(args.data_input_dir, self.base_dir, "frame_index")
+            )
+
+        if args.packed:
+            self.store = PackedAudioStore(self.audio_proc_dir, self.sample_rate)
+
         msd_processed_annot = Path(
             args.data_input_dir, "msd", "processed_annotations"
         )
@@ -129,9 +143,6 @@ class MSDDataset(Dataset):
         else:
             self.annotations_file = Path(msd_processed_annot) / "test_gt_msd.tsv"
 
-        self.msd_to_7d = pickle.load(
-            open(Path(msd_processed_annot) / "MSD_id_to_7D_id.pkl", "rb")
-        )
 
         # int to label
         with open(Path(msd_processed_annot) / f"output_labels_msd.txt", "r") as f:
@@ -139,45 +150,37 @@ class MSDDataset(Dataset):
             self.tags = eval(lines[1][lines[1].find("[") :])
             self.num_tags = len(self.tags)
 
-        [audio_repr_paths, id2audio_path] = load_id2path(
-            Path(msd_processed_annot) / "index_msd.tsv", self.msd_to_7d
+        # compiled once into an .npz cache, so the MSD id mapping is only unpickled when
+        # the annotation files change
+        index_file = Path(msd_processed_annot) / "index_msd.tsv"
+        msd_7d_file = Path(msd_processed_annot) / "MSD_id_to_7D_id.pkl"
+        annotations = cached_annotations(
+            Path(msd_processed_annot) / "cache" / f"{self.annotations_file.stem}.npz",
+            [self.annotations_file, index_file, msd_7d_file],
+            lambda: build_annotations(self.annotations_file, index_file, msd_7d_file),
         )
-        [ids, id2gt] = load_id2gt(self.annotations_file, self.msd_to_7d)
+        ids = annotations["ids"].tolist()
+        id2gt = dict(zip(ids, annotations["labels"]))
+        id2audio_path = dict(zip(ids, annotations["paths"].tolist()))
 
         self.index, self.track_index = self.indexer(ids, id2audio_path, id2gt, dataset="million_song_dataset")
+        self.setup_manifest(args, os.path.join(self.audio_proc_dir, self.split))
         
         # we already load a full fragment of audio, and then select a segment from all N segments)
         if not self.supervised and self.pretrain:
-            self.index = [
-                [track_id, clip_id, segment, fp, label]
-                for track_id, clip_id, segment, fp, label in self.index
-                if segment == 0
-            ]
+            self.index = self.index.select(self.index.segments == 0)
 
-        
         # reduce dataset to n%
         if args.perc_train_data < 1.0 and split == "train":  # only on train set
-            print("Train dataset size:", len(self.index))
-            train_X_indices = np.array(
-                [idx for idx in range(len(self.index))]
-            ).reshape(-1, 1)
-            train_y = np.array([label for _, _, _, _, label in self.index])
-            train_X_indices, _ = random_undersample_balanced(
-                train_X_indices, train_y, args.perc_train_data
-            )
-
-            new_index = []
-            for idx, (track_id, clip_id, segment, fp, label) in enumerate(self.index):
-                if idx in train_X_indices:
-                    new_index.append([track_id, clip_id, segment, fp, label])
+            self.index = self.undersample(self.index, args.perc_train_data)
 
-            self.index = new_index
-            print("Undersampled train dataset size:", len(self.index), len(self.track_index))
+        self.setup_cache(args)
 
-        
         if self.load_ram and self.pretrain and self.split == "train":
             print("Loading train data into memory for faster training")
-            self.audios = load_tracks(args.sample_rate, self.index)
+            self.audios, self.ram_slots = load_shared_tracks(
+                args, self.name, self.split, self.index
+            )
 
         print(f"[{split} dataset ({args.dataset}_{self.sample_rate})]")
 
@@ -193,19 +196,35 @@ class MSDDataset(Dataset):
             self.std,
         )
 
+    def raw_audio_path(self, path):
+        # the original clips are mp3
+        return os.path.join(self.audio_raw_dir, os.path.splitext(path)[0] + ".mp3")
+
     # get one segment (==59049 samples) and its 50-d label
     def __getitem__(self, index):
-        track_id, clip_id, segment, fp, label = self.tracks_list[index]
+        track_id, clip_id, segment, fp, label = self.index[index]
+        if self.is_quarantined(fp):
+            # known to be bad, do not spend a decode on it
+            return self.__getitem__((index + 1) % len(self))
         label = torch.FloatTensor(label)
+        crop = not self.supervised and self.pretrain and self.transform
 
         try:
-            audio = self.get_audio(fp)
+            if self.load_ram and self.pretrain and self.split == "train":
+                audio = self.get_ram_audio(index)
+                if not crop:
+                    start_idx = int(segment) * self.audio_length
+                    audio = audio[start_idx : start_idx + self.audio_length]
+            elif crop:
+                # only read the two |audio_length| windows that are cropped for the views
+                audio = self.get_random_crops(fp)
+            else:
+                audio = self.get_segment(fp, segment)
         except Exception as e:
-            print(f"Skipped {track_id, fp}, could not load audio: {e}")
-            return self.__getitem__(index + 1)
+            return self.__getitem__(self.skip_item(index, track_id, fp, e))
             
         # only transform if unsupervised training
-        if not self.supervised and self.pretrain and self.transform:
+        if crop:
             audio = self.transform(audio, self.mean, self.std)
         # elif self.model_name == "cpc":
         #     max_samples = audio.size(1)
@@ -213,8 +232,7 @@ class MSDDataset(Dataset):
         #     audio = audio[:, start_idx : start_idx + self.audio_length]
         #     audio = (audio, audio)
         else:
-            start_idx = int(segment) * self.audio_length
-            audio = audio[start_idx : start_idx + self.audio_length]
+            audio = pcm_to_float(audio)
             audio = audio.reshape(1, -1) # [channels, samples]
             audio = torch.from_numpy(audio)
             audio = (audio, audio)
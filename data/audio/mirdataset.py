@@ -10,25 +10,13 @@ from matplotlib import pyplot as plt
 from tqdm import tqdm
 import random
 
-from scripts.datasets.utils import write_statistics
+from scripts.datasets.utils import read_statistics
+from scripts.datasets.statistics import get_dataset_stats
 
 def default_loader(path):
     audio, sr = torchaudio.load(path, normalization=lambda x: torch.abs(x).max())
     return audio, sr
 
-def get_dataset_stats(loader, tracks_list, stats_path):
-    means = []
-    stds = []
-    for track_id, fp, label, _ in tqdm(tracks_list):
-        audio, sr = loader(fp)
-        if np.isnan(audio.mean()) or np.isnan(audio.std()):
-            continue
-
-        means.append(audio.mean())
-        stds.append(audio.std())
-    return np.array(means).mean(), np.array(stds).mean()
-
-
 def default_indexer(path, fp, tracks, sr):
     items = []
     tracks_dict = defaultdict(list)
@@ -133,19 +121,14 @@ class MIRDataset(Dataset):
                 print(f"[{name} dataset]: Fetching dataset statistics (mean/std) for {version}_{self.sample_rate} version")
                 if train:
                     self.mean, self.std = get_dataset_stats(
-                        self.loader, self.tracks_list, stats_path
+                        self.loader, [fp for _, fp, _, _ in self.tracks_list], stats_path, args.workers
                     )
-                    write_statistics(self.mean, self.std, len(self.tracks_list), stats_path)
                 else:
                     raise FileNotFoundError(
                         f"{stats_path} does not exist, no mean/std from train set"
                     )
             else:
-                with open(stats_path, "r") as f:
-                    l = f.readlines()
-                    stats = l[1].split(";")
-                    self.mean = float(stats[0])
-                    self.std = float(stats[1])
+                self.mean, self.std = read_statistics(stats_path)
             
 
         else:
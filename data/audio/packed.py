@@ -0,0 +1,255 @@
+import os
+import glob
+import atexit
+import hashlib
+import tempfile
+import numpy as np
+import torch.distributed as dist
+from tqdm import tqdm
+
+from utils.audio import read_wav, ensure_mono, encode_audio, storage_dtypes
+
+
+def packed_store_paths(root, sample_rate=None):
+    # processed directories can hold clips at several sample rates (`{id}-{sample_rate}.wav`),
+    # which get one store per rate
+    root = root.rstrip(os.sep)
+    if sample_rate is not None:
+        root = f"{root}.{sample_rate}"
+    return root + ".packed", root + ".packed.npz"
+
+
+def find_wavs(root):
+    fps = []
+    for dirpath, _, filenames in os.walk(root):
+        for fn in filenames:
+            if fn.endswith(".wav"):
+                fps.append(os.path.join(dirpath, fn))
+    return sorted(fps)
+
+
+def write_packed_store(root, fps=None, storage_format="int16", keys=None, sample_rate=None):
+    """
+    Packs all clips under |root| (at |sample_rate|, if given) into one contiguous blob of
+    |storage_format| samples (float32, int16 or 8-bit mu-law), with an offset/length index keyed
+    by the path relative to |root| (or by |keys|).
+    """
+    if fps is None:
+        fps = find_wavs(root)
+        if sample_rate is not None:
+            fps = [fp for fp in fps if fp.endswith(f"-{sample_rate}.wav")]
+    if keys is None:
+        keys = [os.path.relpath(fp, root) for fp in fps]
+
+    blob_path, index_path = packed_store_paths(root, sample_rate)
+    dtype = storage_dtypes[storage_format]
+
+    # write next to the target and rename, so readers never see a partial store (the pid
+    # tells which writer a leftover .tmp file belonged to, see remove_stale_tmp)
+    tmp = f".{os.getpid()}.tmp"
+    try:
+        written_keys = []
+        offsets = []
+        lengths = []
+        sample_rate = None
+        offset = 0
+        with open(blob_path + tmp, "wb") as f:
+            for key, fp in tqdm(zip(keys, fps), total=len(fps)):
+                try:
+                    audio, sr = read_wav(fp)
+                except Exception as e:
+                    print(f"Skipped {fp}, could not read audio: {e}")
+                    continue
+
+                if sample_rate is None:
+                    sample_rate = sr
+                elif sr != sample_rate:
+                    raise Exception("Sample rate is not consistent throughout the dataset")
+
+                audio = encode_audio(ensure_mono(audio), storage_format)
+                f.write(audio.tobytes())
+
+                written_keys.append(key)
+                offsets.append(offset)
+                lengths.append(audio.shape[0])
+                offset += audio.shape[0]
+
+        with open(index_path + tmp, "wb") as f:
+            np.savez(
+                f,
+                keys=np.array(written_keys),
+                offsets=np.array(offsets, dtype=np.int64),
+                lengths=np.array(lengths, dtype=np.int64),
+                dtype=np.array(dtype.str),
+                sample_rate=np.array(sample_rate or 0),
+            )
+        os.replace(blob_path + tmp, blob_path)
+        os.replace(index_path + tmp, index_path)
+    except BaseException:
+        for path in [blob_path + tmp, index_path + tmp]:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    return len(written_keys)
+
+
+def remove_stale_tmp(root):
+    """
+    Removes the .tmp files of the store at |root| that were left by writers that died
+    """
+    for path in glob.glob(glob.escape(root) + ".packed*.tmp"):
+        try:
+            pid = int(path.rsplit(".", 2)[-2])
+            os.kill(pid, 0)
+            continue  # still being written
+        except (ValueError, ProcessLookupError):
+            pass
+        except PermissionError:
+            continue  # a live process of another user
+        print(f"Removing {path}, left by an interrupted run")
+        os.remove(path)
+
+
+class PackedAudioStore:
+    """
+    Read-only store of all clips under |root|, packed by `write_packed_store`.
+    The blob is memory-mapped lazily in each process, so DataLoader workers share
+    the page cache and slicing a clip does not copy or open a file.
+    """
+
+    def __init__(self, root, sample_rate=None):
+        self.root = root.rstrip(os.sep)
+        self.blob_path, self.index_path = packed_store_paths(self.root, sample_rate)
+        if sample_rate is not None and not os.path.exists(self.index_path):
+            # stores packed from a single-rate directory
+            self.blob_path, self.index_path = packed_store_paths(self.root)
+        if not os.path.exists(self.index_path):
+            raise FileNotFoundError(
+                f"{self.index_path} does not exist, run scripts/datasets/pack_dataset.py first"
+            )
+
+        with np.load(self.index_path) as index:
+            keys = index["keys"]
+            self.offsets = index["offsets"]
+            self.lengths = index["lengths"]
+            self.dtype = np.dtype(str(index["dtype"]))
+            self.sample_rate = int(index["sample_rate"])
+
+        self.slots = {k: slot for slot, k in enumerate(keys.tolist())}
+        self._blob = None
+
+    def __getstate__(self):
+        # never pickle the mapping itself (np.memmap pickles as a full copy)
+        state = self.__dict__.copy()
+        state["_blob"] = None
+        return state
+
+    @property
+    def blob(self):
+        if self._blob is None:
+            self._blob = np.memmap(self.blob_path, dtype=self.dtype, mode="r")
+        return self._blob
+
+    def __len__(self):
+        return len(self.slots)
+
+    def __contains__(self, fp):
+        return self.key(fp) in self.slots
+
+    def key(self, fp):
+        if fp.startswith(self.root + os.sep):
+            return fp[len(self.root) + 1 :]
+        return os.path.relpath(fp, self.root)
+
+    def slot(self, fp):
+        return self.slots[self.key(fp)]
+
+    def num_samples(self, fp):
+        return int(self.lengths[self.slot(fp)])
+
+    def get_slot(self, slot, start=0, length=None):
+        offset = self.offsets[slot]
+        n = self.lengths[slot]
+        if length is None:
+            length = n - start
+        length = min(length, n - start)
+        return self.blob[offset + start : offset + start + length]
+
+    def get(self, fp, start=0, length=None):
+        return self.get_slot(self.slot(fp), start, length)
+
+    def prefetch(self, fp):
+        # a plain read of the clip's bytes, so the page faults of the mapping hit the page cache
+        slot = self.slot(fp)
+        with open(self.blob_path, "rb", buffering=0) as f:
+            f.seek(int(self.offsets[slot]) * self.dtype.itemsize)
+            f.read(int(self.lengths[slot]) * self.dtype.itemsize)
+
+
+def shared_memory_dir():
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+def shared_digest(fps):
+    # the paths, sizes and modification times of the files, so reprocessed files get a new arena
+    h = hashlib.sha1()
+    for fp in fps:
+        try:
+            st = os.stat(fp)
+            h.update(f"{fp}\t{st.st_size}\t{st.st_mtime_ns}\n".encode())
+        except OSError:
+            h.update(f"{fp}\t-\n".encode())
+    return h.hexdigest()[:12]
+
+
+def remove_shared_store(root, pid):
+    # only the process that wrote the arena removes it (not forked children), the mappings of
+    # other processes stay valid until they are closed
+    if os.getpid() != pid:
+        return
+    for path in packed_store_paths(root):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_shared_tracks(args, name, split, index):
+    """
+    Replaces a per-process dict of decoded tracks for `load_ram`: local rank 0 packs
+    the tracks (in the `storage_format` sample format) once into shared memory, all other ranks and DataLoader workers
+    attach read-only. Returns the store and the store slot of every index row.
+    The arena is removed when the writing process exits, unless `keep_shared` is set (the next
+    run with the same files then re-uses it).
+    """
+    # one entry per clip file, rows of the (columnar) index refer to it by path id
+    path_ids, rows = np.unique(index.path_ids, return_inverse=True)
+    fps = index.paths[path_ids].tolist()
+
+    root = os.path.join(
+        shared_memory_dir(),
+        f"clmr-{name}-{split}-{args.sample_rate}-{args.storage_format}-{shared_digest(fps)}",
+    )
+    error = None
+    if args.local_rank == 0:
+        remove_stale_tmp(root)
+        if not os.path.exists(packed_store_paths(root)[1]):
+            print(f"Loading {split} data into shared memory ({root})")
+            if not args.keep_shared:
+                atexit.register(remove_shared_store, root, os.getpid())
+            try:
+                write_packed_store(root, fps, storage_format=args.storage_format, keys=fps)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+
+    if args.world_size > 1 and dist.is_available() and dist.is_initialized():
+        # instead of a barrier, so the other ranks fail too (instead of waiting) when a writer fails
+        errors = [None] * dist.get_world_size()
+        dist.all_gather_object(errors, error)
+        error = next((e for e in errors if e is not None), None)
+    if error is not None:
+        raise Exception(f"Could not load the {split} data into shared memory ({root}): {error}")
+
+    store = PackedAudioStore(root)
+    slots = np.array([store.slots.get(fp, -1) for fp in fps], dtype=np.int64)
+    return store, slots[rows]
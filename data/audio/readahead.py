@@ -0,0 +1,95 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from torch.utils.data import Dataset as TorchDataset
+from torch.utils.data.dataloader import default_collate
+
+# size of the reads that pull a file into the page cache
+READ_CHUNK = 2 ** 20
+
+_buffers = threading.local()
+
+
+def read_file(fp, offset=0, length=None):
+    """
+    Reads bytes [offset, offset + length) of |fp| (up to the end of the file if |length| is
+    None) and drops them, so the next read of that range hits the page cache
+    """
+    buf = getattr(_buffers, "buf", None)
+    if buf is None:
+        buf = _buffers.buf = bytearray(READ_CHUNK)
+    view = memoryview(buf)
+    with open(fp, "rb", buffering=0) as f:
+        if offset:
+            f.seek(offset)
+        while length is None or length > 0:
+            n = READ_CHUNK if length is None else min(READ_CHUNK, length)
+            if f.readinto(view[:n]) < n:
+                break
+            if length is not None:
+                length -= n
+
+
+class ReadAheadDataset(TorchDataset):
+    """
+    Wraps a map-style dataset so DataLoader workers load whole batches (with batch_size=None and
+    a BatchSampler as sampler, see get_audio_dataloader). While a worker decodes and augments an
+    item, a small thread pool reads the bytes of the next |depth| items of the batch (see
+    `Dataset.prefetch`), so a few workers hide the storage latency that would otherwise take
+    many worker processes. Any other attribute is looked up on the wrapped dataset.
+    """
+
+    def __init__(self, dataset, depth=8, num_threads=4):
+        self.dataset = dataset
+        self.depth = depth
+        self.num_threads = num_threads
+        self._pool = None
+        self._pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        state["_pid"] = None
+        return state
+
+    def __getattr__(self, name):
+        # only called for attributes that are not set on the wrapper
+        if name == "dataset":
+            raise AttributeError(name)
+        return getattr(self.dataset, name)
+
+    def __len__(self):
+        return len(self.dataset)
+
+    @property
+    def pool(self):
+        # the threads belong to the (worker) process that started them
+        if self._pid != os.getpid():
+            self._pool = ThreadPoolExecutor(self.num_threads)
+            self._pid = os.getpid()
+        return self._pool
+
+    def load(self, indices):
+        """
+        Yields the items of |indices| in order, reading ahead of the current item
+        """
+        prefetch = getattr(self.dataset, "prefetch", None)
+        if prefetch is None or self.depth <= 0:
+            for idx in indices:
+                yield self.dataset[idx]
+            return
+
+        futures = [self.pool.submit(prefetch, idx) for idx in indices[: self.depth]]
+        for i, idx in enumerate(indices):
+            if i + self.depth < len(indices):
+                futures.append(self.pool.submit(prefetch, indices[i + self.depth]))
+            # the actual read skips / quarantines the file, the error is only reported here
+            error = futures[i].exception()
+            if error is not None:
+                print(f"[ReadAhead {os.getpid()}]: could not prefetch item {idx}: {type(error).__name__}: {error}")
+            yield self.dataset[idx]
+
+    def __getitem__(self, indices):
+        if not isinstance(indices, (list, tuple)):
+            return self.dataset[indices]
+        return default_collate(list(self.load(indices)))
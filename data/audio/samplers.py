@@ -0,0 +1,239 @@
+import numpy as np
+import torch.distributed as dist
+from torch.utils.data import Sampler
+
+
+class TrackBatchSampler(Sampler):
+    """
+    Yields batches of dataset rows in which every track occurs at most once, so clips of the
+    same track never end up among each other's negatives. Every epoch visits each track of the
+    TrackIndex once, with a random clip (row) of that track. The training loop sets the epoch
+    (set_epoch), which seeds the shuffle.
+
+    With |crops_per_track| K > 1, every track is visited K times per epoch, in K different
+    batches of a window of |crop_mix| x K batches (|crop_mix| x batch size tracks per rank).
+    All batches of a window are sent to the same DataLoader worker (workers take batches in
+    turn), so the worker decodes the track once and keeps it in its CropReservoir for K pairs.
+    The windows are padded to a multiple of the number of workers with tracks from the start of
+    the epoch, so every worker gets a whole window until the end of the epoch.
+    """
+
+    def __init__(
+        self,
+        track_index,
+        batch_size,
+        drop_last=True,
+        seed=0,
+        num_replicas=1,
+        rank=0,
+        crops_per_track=1,
+        crop_mix=4,
+        num_workers=0,
+    ):
+        self.track_index = track_index
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.crops_per_track = crops_per_track
+        self.crop_mix = crop_mix
+        self.num_workers = max(1, num_workers)
+        self.epoch = 0
+
+        if len(self) == 0:
+            raise Exception(
+                f"{len(track_index)} tracks are not enough for batches of {self.global_batch_size} unique tracks"
+            )
+
+    @property
+    def global_batch_size(self):
+        return self.batch_size * self.num_replicas
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        if self.crops_per_track > 1:
+            return self.num_windows() * self.crop_mix * self.crops_per_track
+        if self.drop_last:
+            return len(self.track_index) // self.global_batch_size
+        return -(-len(self.track_index) // self.global_batch_size)
+
+    def sample_rows(self, rng):
+        # one random row of every track, in a random order of the tracks
+        order = self.track_index.order
+        bounds = self.track_index.bounds
+        tracks = rng.permutation(len(self.track_index))
+        counts = bounds[tracks + 1] - bounds[tracks]
+        offsets = (rng.random_sample(len(tracks)) * counts).astype(np.int64)
+        return order[bounds[tracks] + offsets]
+
+    def num_windows(self):
+        num_windows = len(self.track_index) // (self.crop_mix * self.global_batch_size)
+        if num_windows == 0:
+            return 0
+        return -(-num_windows // self.num_workers) * self.num_workers
+
+    def multi_crop_batches(self, rows, rng):
+        window_size = self.crop_mix * self.global_batch_size
+        # padded with the first tracks (a window of consecutive rows holds unique tracks)
+        rows = np.resize(rows, self.num_windows() * window_size)
+        windows = []
+        for w in range(self.num_windows()):
+            # the tracks of every rank, reshuffled into |crop_mix| batches for every crop
+            tracks = rows[w * window_size : (w + 1) * window_size].reshape(self.num_replicas, -1)
+            batches = []
+            for _ in range(self.crops_per_track):
+                shuffled = tracks[:, rng.permutation(tracks.shape[1])]
+                shuffled = shuffled.reshape(self.num_replicas, self.crop_mix, self.batch_size)
+                batches.extend(shuffled.transpose(1, 0, 2).reshape(self.crop_mix, -1))
+            windows.append(batches)
+
+        # interleave |num_workers| windows, so batch i of window g * num_workers + w goes to
+        # worker w (batch number (g * crop_mix * crops_per_track + i) * num_workers + w)
+        for g in range(0, len(windows), self.num_workers):
+            group = windows[g : g + self.num_workers]
+            for i in range(self.crop_mix * self.crops_per_track):
+                for batches in group:
+                    yield batches[i]
+
+    def __iter__(self):
+        # every rank draws the same rows, and takes its part of each global batch
+        rng = np.random.RandomState(self.seed + self.epoch)
+        rows = self.sample_rows(rng)
+
+        if self.crops_per_track > 1:
+            batches = self.multi_crop_batches(rows, rng)
+        else:
+            batches = (
+                rows[b * self.global_batch_size : (b + 1) * self.global_batch_size] for b in range(len(self))
+            )
+
+        for batch in batches:
+            yield batch[self.rank * self.batch_size : (self.rank + 1) * self.batch_size].tolist()
+
+
+class DistributedTrackBatchSampler(TrackBatchSampler):
+    """
+    TrackBatchSampler for DistributedDataParallel: tracks are unique within the global batch
+    (|batch_size| x world size), and incomplete global batches are dropped so all ranks
+    run the same number of steps.
+    """
+
+    def __init__(
+        self,
+        track_index,
+        batch_size,
+        seed=0,
+        num_replicas=None,
+        rank=None,
+        crops_per_track=1,
+        crop_mix=4,
+        num_workers=0,
+    ):
+        if num_replicas is None:
+            num_replicas = dist.get_world_size()
+        if rank is None:
+            rank = dist.get_rank()
+
+        super(DistributedTrackBatchSampler, self).__init__(
+            track_index,
+            batch_size,
+            drop_last=True,
+            seed=seed,
+            num_replicas=num_replicas,
+            rank=rank,
+            crops_per_track=crops_per_track,
+            crop_mix=crop_mix,
+            num_workers=num_workers,
+        )
+
+
+def locality_keys(index, store=None):
+    """
+    Sort key of every row of |index| in storage order: the byte offset of its clip in the
+    packed |store|, otherwise its path (clips of one directory are mostly stored close together)
+    """
+    if store is not None:
+        slots = np.array([store.slots.get(store.key(fp), -1) for fp in index.paths.tolist()])
+        offsets = np.where(slots >= 0, store.offsets[slots], np.iinfo(np.int64).max)
+        return offsets[index.path_ids]
+    return np.argsort(np.argsort(index.paths))[index.path_ids]
+
+
+class BlockShuffleSampler(Sampler):
+    """
+    Locality-aware shuffle for slow (HDD / network) storage. Rows are put in storage order
+    (see locality_keys), cut into blocks of |block_size| consecutive rows, and the blocks are
+    shuffled; rows are then shuffled within windows of |window| rows, which mixes neighbouring
+    blocks. block_size=1 is a full shuffle, larger blocks (and smaller windows) read longer
+    sequential runs at the cost of less random batches. The training loop sets the epoch
+    (set_epoch), which seeds the shuffle. Each rank takes a contiguous part of the shuffled rows.
+    """
+
+    def __init__(self, index, block_size=64, window=0, keys=None, seed=0, num_replicas=1, rank=0):
+        self.block_size = max(1, block_size)
+        self.window = window
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+
+        if keys is None:
+            keys = locality_keys(index)
+        # the segments of a clip are read from one file, so they form a run within their clip
+        self.order = np.lexsort((index.segments, keys))
+        self.num_samples = -(-len(self.order) // self.num_replicas)
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return self.num_samples
+
+    def shuffled_rows(self, rng):
+        num_blocks = -(-len(self.order) // self.block_size)
+        blocks = rng.permutation(num_blocks)
+        starts = blocks * self.block_size
+        lengths = np.minimum(starts + self.block_size, len(self.order)) - starts
+        positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        rows = self.order[positions]
+
+        if self.window > 1:
+            # random keys within each window, and sort by (window, key)
+            windows = np.arange(len(rows)) // self.window
+            rows = rows[np.lexsort((rng.random_sample(len(rows)), windows))]
+        return rows
+
+    def __iter__(self):
+        # every rank draws the same order, and takes its own contiguous part of it
+        rng = np.random.RandomState(self.seed + self.epoch)
+        rows = self.shuffled_rows(rng)
+
+        total_size = self.num_samples * self.num_replicas
+        if total_size > len(rows):
+            rows = np.concatenate([rows, rows[: total_size - len(rows)]])
+        return iter(rows[self.rank * self.num_samples : (self.rank + 1) * self.num_samples].tolist())
+
+
+class DistributedBlockShuffleSampler(BlockShuffleSampler):
+    """
+    BlockShuffleSampler for DistributedDataParallel, every rank reads its own blocks
+    """
+
+    def __init__(self, index, block_size=64, window=0, keys=None, seed=0, num_replicas=None, rank=None):
+        if num_replicas is None:
+            num_replicas = dist.get_world_size()
+        if rank is None:
+            rank = dist.get_rank()
+
+        super(DistributedBlockShuffleSampler, self).__init__(
+            index,
+            block_size,
+            window,
+            keys=keys,
+            seed=seed,
+            num_replicas=num_replicas,
+            rank=rank,
+        )
@@ -0,0 +1,184 @@
+import os
+import time
+import queue
+import shutil
+import threading
+
+
+class ScratchCache:
+    """
+    Tiered copy of the files under |root| (the shared file system) on fast local scratch
+    storage |scratch_dir|, bounded by |max_bytes|. Reads are served from the shared file system
+    straight away, and every file that is read is copied to scratch by background threads, so
+    later epochs read from local disk without a blocking copy before training.
+    All DataLoader workers and ranks of a node share the scratch directory: copies are written
+    to a per-process temporary file and renamed, and the least recently used files (by mtime,
+    which is touched on every hit) are evicted once the directory exceeds its budget.
+    """
+
+    report_every = 10000
+
+    # files used within this many seconds are never evicted, so a path that was just
+    # handed out is still there when it is opened
+    grace = 60
+
+    def __init__(self, root, scratch_dir, max_bytes, num_threads=2, max_pending=10000):
+        self.root = os.path.abspath(root)
+        self.scratch_dir = os.path.abspath(scratch_dir)
+        self.max_bytes = max_bytes
+        self.num_threads = num_threads
+        self.max_pending = max_pending
+        self.hits = 0
+        self.misses = 0
+        self.copied = 0
+        self.evictions = 0
+        self._reset()
+
+    def _reset(self):
+        # the copy threads (and their queue) belong to the process that started them
+        self._pid = None
+        self._queue = None
+        self._pending = set()
+        self._lock = threading.Lock()
+        # serializes the eviction scans of the copy threads, without holding |_lock|, so
+        # schedule() (on the loading path) never waits for a directory walk
+        self._evict_lock = threading.Lock()
+        self._num_bytes = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for k in ["_queue", "_pending", "_lock", "_evict_lock"]:
+            state[k] = None
+        state["_pid"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._reset()
+
+    def local_path(self, fp):
+        rel = os.path.relpath(os.path.abspath(fp), self.root)
+        if rel.startswith(os.pardir):
+            return None
+        return os.path.join(self.scratch_dir, rel)
+
+    def path(self, fp):
+        """
+        Returns the scratch copy of |fp| if there is one, otherwise |fp| itself (and
+        schedules a copy)
+        """
+        local = self.local_path(fp)
+        if local is None:
+            return fp
+
+        try:
+            os.utime(local)
+            self.hits += 1
+            fp = local
+        except FileNotFoundError:
+            self.misses += 1
+            self.schedule(fp, local)
+
+        if (self.hits + self.misses) % self.report_every == 0:
+            print(f"[Scratch {os.getpid()}]: {self.stats()}")
+        return fp
+
+    def schedule(self, fp, local):
+        if self._pid != os.getpid():
+            self._start()
+        with self._lock:
+            if local in self._pending or len(self._pending) >= self.max_pending:
+                return
+            self._pending.add(local)
+        self._queue.put((fp, local))
+
+    def _start(self):
+        self._reset()
+        self._pid = os.getpid()
+        self._queue = queue.Queue()
+        for _ in range(self.num_threads):
+            threading.Thread(target=self._copy_loop, daemon=True).start()
+
+    def _copy_loop(self):
+        while True:
+            fp, local = self._queue.get()
+            try:
+                self.copy(fp, local)
+            except Exception as e:
+                print(f"[Scratch {os.getpid()}]: could not copy {fp}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(local)
+
+    def copy(self, fp, local):
+        if os.path.exists(local):
+            return
+
+        size = os.path.getsize(fp)
+        if size > self.max_bytes:
+            return
+        self.reserve(size)
+
+        os.makedirs(os.path.dirname(local), exist_ok=True)
+        # a killed worker leaves only its own temporary file behind, which is evicted later
+        tmp_path = f"{local}.{os.getpid()}.part"
+        shutil.copyfile(fp, tmp_path)
+        os.replace(tmp_path, local)
+        self.copied += 1
+
+    def scan(self):
+        files = []
+        for dirpath, _, filenames in os.walk(self.scratch_dir):
+            for fn in filenames:
+                fp = os.path.join(dirpath, fn)
+                try:
+                    st = os.stat(fp)
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, st.st_size, fp))
+        return files
+
+    def reserve(self, size):
+        """
+        Makes room for |size| bytes. The size of the directory (written by all processes) is
+        only scanned when the estimate of this process exceeds the budget, and then evicted
+        down to 90% of the budget, so scans are rare.
+        """
+        if self._reserve(size):
+            return
+
+        with self._evict_lock:
+            # another copy thread may have made room while this one waited
+            if self._reserve(size):
+                return
+
+            files = sorted(self.scan())
+            num_bytes = sum(f[1] for f in files)
+            target = min(self.max_bytes - size, 0.9 * self.max_bytes)
+            now = time.time()
+            for mtime, file_size, fp in files:
+                if num_bytes <= target or now - mtime < self.grace:
+                    break
+                try:
+                    os.remove(fp)
+                    self.evictions += 1
+                except FileNotFoundError:
+                    pass
+                num_bytes -= file_size
+            with self._lock:
+                self._num_bytes = num_bytes + size
+
+    def _reserve(self, size):
+        with self._lock:
+            if self._num_bytes is not None and self._num_bytes + size <= self.max_bytes:
+                self._num_bytes += size
+                return True
+            return False
+
+    def stats(self):
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0
+        return (
+            f"{self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate), "
+            f"{self.copied} copied, {self.evictions} evicted"
+        )
@@ -0,0 +1,272 @@
+import io
+import os
+import json
+import random
+import tarfile
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.utils.data import IterableDataset, get_worker_info
+from tqdm import tqdm
+
+from utils.audio import read_wav_window, pcm_to_float
+
+
+def shard_dir(data_input_dir, base_dir, split):
+    return os.path.join(data_input_dir, base_dir, "shards", split)
+
+
+def add_member(tar, name, array):
+    buf = io.BytesIO()
+    np.save(buf, array)
+    info = tarfile.TarInfo(name)
+    info.size = buf.tell()
+    buf.seek(0)
+    tar.addfile(info, buf)
+
+
+def write_shards(dataset, out_dir, shard_size_mb=256, seed=0):
+    """
+    Writes one entry per clip of |dataset.index| (raw mono PCM, labels and ids) into tar
+    shards of about |shard_size_mb|, in a random order so every shard mixes the whole dataset.
+    The shard list (with the number of samples of every clip) is written last (shards.json),
+    so readers never see a partial set.
+    """
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+    index = dataset.index.select(dataset.index.segments == 0)
+    rows = np.random.RandomState(seed).permutation(len(index))
+
+    shards = []
+    tar = None
+    lengths = []
+    for row in tqdm(rows):
+        track_id, clip_id, _, fp, label = index[row]
+        try:
+            audio, sr = read_wav_window(fp)
+        except Exception as e:
+            print(f"Skipped {fp}, could not read audio: {e}")
+            continue
+
+        if tar is None or tar.fileobj.tell() > shard_size_mb * 2 ** 20:
+            if tar is not None:
+                tar.close()
+                os.replace(shard_path + ".tmp", shard_path)
+                shards[-1].update(num_clips=len(lengths), lengths=lengths)
+            name = f"shard-{len(shards):06d}.tar"
+            shard_path = os.path.join(out_dir, name)
+            tar = tarfile.open(shard_path + ".tmp", "w")
+            shards.append({"name": name, "num_clips": 0})
+            lengths = []
+
+        key = f"{track_id}-{clip_id}"
+        add_member(tar, f"{key}.audio.npy", audio)
+        add_member(tar, f"{key}.labels.npy", np.asarray(label, dtype=np.float32))
+        add_member(tar, f"{key}.ids.npy", np.array([track_id, clip_id], dtype=np.int64))
+        lengths.append(int(audio.shape[0]))
+
+    if tar is not None:
+        tar.close()
+        os.replace(shard_path + ".tmp", shard_path)
+        shards[-1].update(num_clips=len(lengths), lengths=lengths)
+
+    with open(os.path.join(out_dir, "shards.json"), "w") as f:
+        json.dump(
+            {
+                "sample_rate": dataset.sample_rate,
+                "num_tags": dataset.num_tags,
+                "shards": shards,
+            },
+            f,
+        )
+    return sum(shard["num_clips"] for shard in shards)
+
+
+def read_shard(fp):
+    """
+    Streams the clips of one shard sequentially, as (audio, labels, ids)
+    """
+    sample = {}
+    key = None
+    with tarfile.open(fp, "r|") as tar:
+        for member in tar:
+            member_key, field = member.name.split(".", 1)
+            if key is not None and member_key != key:
+                yield sample["audio.npy"], sample["labels.npy"], sample["ids.npy"]
+                sample = {}
+            key = member_key
+            sample[field] = np.load(io.BytesIO(tar.extractfile(member).read()))
+
+    if sample:
+        yield sample["audio.npy"], sample["labels.npy"], sample["ids.npy"]
+
+
+class ShardedAudioDataset(IterableDataset):
+    """
+    Streams the clips of a split from large tar shards (see scripts/datasets/write_shards.py)
+    with sequential reads only. Shards are split over DDP ranks and DataLoader workers, and
+    items are shuffled through a buffer of |shuffle_buffer| items. Every worker yields the same
+    whole number of batches (cycling through its shards), so all ranks run the same number of
+    steps and the length of the DataLoader is exact.
+    Pre-training yields one item (two crops) per clip, otherwise every full segment of a clip is
+    an item, like the map-style datasets.
+    """
+
+    def __init__(self, root, args, pretrain, transform=None, shuffle_buffer=1000):
+        with open(os.path.join(root, "shards.json"), "r") as f:
+            meta = json.load(f)
+
+        self.name = "shards"
+        self.split = os.path.basename(root.rstrip(os.sep))
+        self.root = root
+        self.shards = [os.path.join(root, shard["name"]) for shard in meta["shards"]]
+        self.num_clips = sum(shard["num_clips"] for shard in meta["shards"])
+        self.num_tags = meta["num_tags"]
+        self.sample_rate = meta["sample_rate"]
+        self.audio_length = args.audio_length
+        self.pretrain = pretrain
+        self.supervised = args.supervised
+        self.transform = transform
+        self.crops = not self.supervised and self.pretrain and self.transform is not None
+        self.shuffle_buffer = shuffle_buffer
+        self.batch_size = args.batch_size
+        self.num_workers = max(1, args.workers)
+        self.seed = args.seed
+        self.epoch = 0
+        self.scratch = None
+        self.mean = None
+        self.std = None
+
+        if meta["sample_rate"] != args.sample_rate:
+            raise Exception("Sample rate of the shards does not match the configured sample rate")
+
+        self.num_items = self.num_clips
+        if not self.crops:
+            if all("lengths" in shard for shard in meta["shards"]):
+                self.num_items = sum(
+                    length // self.audio_length
+                    for shard in meta["shards"]
+                    for length in shard["lengths"]
+                    if length > self.audio_length
+                )
+            else:
+                print(
+                    f"[{self.name} {self.split}]: shards without clip lengths (written by an older "
+                    "write_shards.py), epochs hold as many segments as there are clips"
+                )
+
+        print(
+            f"[{self.name} {self.split}]: {self.num_clips} clips ({self.num_items} items) in {len(self.shards)} shards ({root})"
+        )
+
+    def set_epoch(self, epoch):
+        # DataLoader workers get a copy of the dataset every epoch, so the epoch is set
+        # by the training loop (before the workers start) instead of counted in __iter__
+        self.epoch = epoch
+
+    def replicas(self):
+        if dist.is_available() and dist.is_initialized():
+            return dist.get_world_size(), dist.get_rank()
+        return 1, 0
+
+    def workers(self):
+        info = get_worker_info()
+        if info is None:
+            return 1, 0
+        return info.num_workers, info.id
+
+    def items_per_worker(self, world_size, num_workers):
+        # every worker collates its own batches, and drops its last incomplete batch
+        num_items = self.num_items // (world_size * num_workers)
+        return (num_items // self.batch_size) * self.batch_size
+
+    def __len__(self):
+        # called in the main process, which runs |args.workers| workers
+        world_size, _ = self.replicas()
+        return self.items_per_worker(world_size, self.num_workers) * self.num_workers
+
+    def items(self, audio, label):
+        """
+        The items of a clip: two independent random crops for pre-training (like the map-style
+        datasets), otherwise all of its full segments. The crops are copied out of the clip and
+        only transformed when they leave the shuffle buffer (see finish), as the transforms write
+        into buffers that are reused every batch.
+        """
+        max_samples = audio.shape[0]
+        if max_samples - self.audio_length <= 0:
+            return []
+
+        if self.crops:
+            crops = []
+            for _ in range(2):
+                start_idx = random.randint(0, max_samples - self.audio_length)
+                crops.append(audio[start_idx : start_idx + self.audio_length].copy())
+            return [(tuple(crops), label)]
+
+        return [
+            (audio[segment * self.audio_length : (segment + 1) * self.audio_length], label)
+            for segment in range(max_samples // self.audio_length)
+        ]
+
+    def finish(self, item):
+        audio, label = item
+        label = torch.FloatTensor(label)
+        if isinstance(audio, tuple):
+            return self.transform(audio, self.mean, self.std), label
+
+        audio = torch.from_numpy(pcm_to_float(audio).reshape(1, -1))  # [channels, samples]
+        return (audio, audio), label
+
+    def __iter__(self):
+        world_size, rank = self.replicas()
+        num_workers, worker_id = self.workers()
+
+        # all ranks and workers draw the same shard order, and take their own shards from it
+        epoch_seed = self.seed + self.epoch
+        shards = list(self.shards)
+        random.Random(epoch_seed).shuffle(shards)
+        shards = shards[rank * num_workers + worker_id :: world_size * num_workers]
+        if not shards:
+            raise Exception(
+                f"{len(self.shards)} shards are not enough for {world_size} ranks x {num_workers} workers"
+            )
+
+        rng = random.Random(epoch_seed * world_size * num_workers + rank * num_workers + worker_id)
+
+        num_items = self.items_per_worker(world_size, num_workers)
+        buffer = []
+        yielded = 0
+        while yielded < num_items:
+            pass_start = yielded
+            for shard in shards:
+                if self.scratch is not None:
+                    shard = self.scratch.path(shard)
+                for audio, label, _ in read_shard(shard):
+                    for item in self.items(audio, label):
+                        if len(buffer) < self.shuffle_buffer:
+                            buffer.append(item)
+                            continue
+
+                        i = rng.randrange(len(buffer))
+                        item, buffer[i] = buffer[i], item
+                        yield self.finish(item)
+                        yielded += 1
+                        if yielded == num_items:
+                            return
+
+            # drain the buffer at the end of every pass over the shards
+            rng.shuffle(buffer)
+            while buffer and yielded < num_items:
+                yield self.finish(buffer.pop())
+                yielded += 1
+
+            # the shards of this worker hold no usable clip
+            if yielded == pass_start:
+                return
+
+    def normalise_audio(self, audio):
+        return audio
+
+    def denormalise_audio(self, norm_audio):
+        return norm_audio
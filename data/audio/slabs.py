@@ -0,0 +1,102 @@
+import torch
+from torch.utils.data import Sampler
+
+from .readahead import ReadAheadDataset
+
+
+class BatchSlabs:
+    """
+    Ring of preallocated batch buffers in shared memory: |num_slabs| x (two views of
+    [batch_size, 1, audio_length] audio, [batch_size, num_tags] labels). DataLoader workers
+    write every item straight into its row of a slab, and the main process hands out views of
+    the slab, so there is no collate (stack) and no pin-memory copy. With CUDA, the slabs are
+    page-locked in place (cudaHostRegister), so the views are pinned tensors.
+    """
+
+    def __init__(self, num_slabs, batch_size, audio_length, num_tags):
+        self.num_slabs = num_slabs
+        self.batch_size = batch_size
+        self.audio = torch.empty(num_slabs, 2, batch_size, 1, audio_length).share_memory_()
+        self.labels = torch.empty(num_slabs, batch_size, num_tags).share_memory_()
+        self.pinned = False
+
+    def pin(self):
+        if self.pinned or not torch.cuda.is_available():
+            return
+        cudart = torch.cuda.cudart()
+        for t in [self.audio, self.labels]:
+            if cudart.cudaHostRegister(t.data_ptr(), t.numel() * t.element_size(), 0) != 0:
+                print("Could not pin the batch slabs, batches are copied from pageable memory")
+                return
+        self.pinned = True
+
+    def write(self, slab, row, item):
+        (x_i, x_j), y = item
+        self.audio[slab, 0, row].copy_(torch.as_tensor(x_i).view(1, -1))
+        self.audio[slab, 1, row].copy_(torch.as_tensor(x_j).view(1, -1))
+        self.labels[slab, row].copy_(torch.as_tensor(y))
+
+    def batch(self, slab, batch_size):
+        return (
+            (self.audio[slab, 0, :batch_size], self.audio[slab, 1, :batch_size]),
+            self.labels[slab, :batch_size],
+        )
+
+
+class SlabBatchSampler(Sampler):
+    """
+    Tags every batch of |batch_sampler| with the slab it is written to, in a round robin
+    """
+
+    def __init__(self, batch_sampler, num_slabs):
+        self.batch_sampler = batch_sampler
+        self.num_slabs = num_slabs
+
+    def __len__(self):
+        return len(self.batch_sampler)
+
+    def __iter__(self):
+        for b, indices in enumerate(self.batch_sampler):
+            yield b % self.num_slabs, list(indices)
+
+
+class SlabDataset(ReadAheadDataset):
+    """
+    Loads a (slab, indices) batch into its slab, and only returns the slab and batch size
+    """
+
+    def __init__(self, dataset, slabs, depth=0, num_threads=4):
+        super(SlabDataset, self).__init__(dataset, depth, num_threads)
+        self.slabs = slabs
+
+    def __getitem__(self, batch):
+        if not isinstance(batch, tuple):
+            return self.dataset[batch]
+
+        slab, indices = batch
+        for row, item in enumerate(self.load(indices)):
+            self.slabs.write(slab, row, item)
+        return slab, len(indices)
+
+
+class SlabLoader:
+    """
+    Iterates a DataLoader over a SlabDataset, and yields the batches as views of the slabs.
+    The workers already hold the slabs of the batches they prefetch (2 per worker), so with the
+    |num_slabs| of get_loader the slab of a batch is handed out again as soon as the batch after
+    the next one is drawn: a batch stays valid while the next one is drawn (e.g. to overlap
+    its copy to the GPU), and must be copied out to be kept any longer.
+    """
+
+    def __init__(self, loader, slabs):
+        self.loader = loader
+        self.slabs = slabs
+        self.dataset = loader.dataset
+        self.slabs.pin()
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        for slab, batch_size in self.loader:
+            yield self.slabs.batch(int(slab), int(batch_size))
@@ -1,10 +1,87 @@
 import os
 import torch
+from torch.utils.data import BatchSampler, RandomSampler, SequentialSampler
 from pathlib import Path
 import numpy as np
 
 from modules.transformations import AudioTransforms
+from modules.transformations.reverb import prepare_ir_bank
 from .audio import datasets
+from .audio.samplers import (
+    TrackBatchSampler,
+    DistributedTrackBatchSampler,
+    BlockShuffleSampler,
+    DistributedBlockShuffleSampler,
+    locality_keys,
+)
+from .audio.shards import ShardedAudioDataset, shard_dir
+from .audio.scratch import ScratchCache
+from .audio.readahead import ReadAheadDataset
+from .audio.slabs import BatchSlabs, SlabBatchSampler, SlabDataset, SlabLoader
+
+
+def get_loader(args, dataset, shuffle=False, sampler=None, batch_sampler=None, slabs=False):
+    if args.read_ahead > 0 or slabs:
+        # workers get whole batches of indices, and read ahead within them (see ReadAheadDataset)
+        if batch_sampler is None:
+            if sampler is None:
+                sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+            batch_sampler = BatchSampler(sampler, args.batch_size, drop_last=True)
+
+    if slabs:
+        # workers write the items into shared (pinned) batch buffers, room for all the
+        # batches the workers prefetch (2 per worker), the current one and the next one, so a
+        # batch is rewritten once the batch after the next one is drawn (see SlabLoader)
+        num_slabs = max(1, args.workers) * 2 + 2
+        batch_slabs = BatchSlabs(num_slabs, args.batch_size, args.audio_length, dataset.num_tags)
+        loader = torch.utils.data.DataLoader(
+            dataset=SlabDataset(dataset, batch_slabs, args.read_ahead, args.read_ahead_threads),
+            batch_size=None,
+            sampler=SlabBatchSampler(batch_sampler, num_slabs),
+            num_workers=args.workers,
+        )
+        return SlabLoader(loader, batch_slabs)
+
+    if args.read_ahead > 0:
+        return torch.utils.data.DataLoader(
+            dataset=ReadAheadDataset(dataset, args.read_ahead, args.read_ahead_threads),
+            batch_size=None,
+            sampler=batch_sampler,
+            num_workers=args.workers,
+            pin_memory=True,
+        )
+
+    if batch_sampler is not None:
+        return torch.utils.data.DataLoader(
+            dataset=dataset,
+            batch_sampler=batch_sampler,
+            num_workers=args.workers,
+            pin_memory=True,
+        )
+
+    return torch.utils.data.DataLoader(
+        dataset=dataset,
+        batch_size=args.batch_size,
+        shuffle=shuffle,
+        drop_last=True,
+        num_workers=args.workers,
+        pin_memory=True,
+        sampler=sampler,
+    )
+
+
+def set_epoch(loader, epoch):
+    """
+    Sets the epoch (the shuffle seed) of the dataset and (batch) samplers of |loader| that have
+    one, through the wrappers of get_loader. Called by the training loop before every epoch.
+    """
+    loader = getattr(loader, "loader", loader)  # SlabLoader
+    for obj in [loader.dataset, loader.sampler, loader.batch_sampler]:
+        while obj is not None:
+            if hasattr(obj, "set_epoch"):
+                obj.set_epoch(epoch)
+                break
+            obj = getattr(obj, "batch_sampler", None) or getattr(obj, "sampler", None)
 
 
 def get_audio_dataloader(args, pretrain=True, download=False):
@@ -12,26 +89,68 @@ def get_audio_dataloader(args, pretrain=True, download=False):
     Dataset = datasets[args.dataset]
 
     if pretrain:
+        if args.reverb_backend == "ir":
+            prepare_ir_bank(args)
         transforms = AudioTransforms(args)
     else:
         transforms = None
 
-    train_dataset = Dataset(
-        args, split="train", pretrain=pretrain, download=download, transform=transforms
-    )
+    if args.sharded:
+        # sequential reads from tar shards (see scripts/datasets/write_shards.py)
+        train_dataset = ShardedAudioDataset(
+            shard_dir(args.data_input_dir, Dataset.base_dir, "train"),
+            args,
+            pretrain=pretrain,
+            transform=transforms,
+        )
+    else:
+        train_dataset = Dataset(
+            args, split="train", pretrain=pretrain, download=download, transform=transforms
+        )
 
     val_dataset = Dataset(args, split="valid", pretrain=pretrain, transform=transforms)
 
     test_dataset = Dataset(args, split="test", pretrain=pretrain, transform=transforms)
 
+    if args.scratch_dir:
+        # serve from |data_input_dir| right away, and copy what is read to local scratch
+        scratch = ScratchCache(args.data_input_dir, args.scratch_dir, args.scratch_gb * 2 ** 30)
+        for dataset in [train_dataset, val_dataset, test_dataset]:
+            dataset.scratch = scratch
+
     train_sampler = None
     val_sampler = None
     test_sampler = None
-    if args.world_size > 1:
+    train_index = getattr(train_dataset, "index", None)
+    track_batches = (
+        not args.sharded and pretrain and not args.supervised and getattr(train_dataset, "track_batches", False)
+    )
+    if args.sharded and pretrain and not args.supervised and getattr(Dataset, "track_batches", False):
+        print(
+            f"sharded pre-training batches of {args.dataset} do not hold unique tracks: clips of one "
+            "track can be each other's negatives (TrackBatchSampler needs the map-style dataset)"
+        )
+    if args.block_shuffle > 0 and track_batches:
+        print(
+            f"block_shuffle is ignored: pre-training batches of {args.dataset} hold unique tracks (TrackBatchSampler)"
+        )
+    elif args.block_shuffle > 0 and not args.sharded and train_index is not None:
+        # shuffle blocks of clips that are stored close together, for slow storage
+        keys = locality_keys(train_index, getattr(train_dataset, "store", None))
+        if args.world_size > 1:
+            train_sampler = DistributedBlockShuffleSampler(
+                train_index, args.block_shuffle, args.shuffle_window, keys=keys, seed=args.seed
+            )
+        else:
+            train_sampler = BlockShuffleSampler(
+                train_index, args.block_shuffle, args.shuffle_window, keys=keys, seed=args.seed
+            )
+    elif args.world_size > 1 and not args.sharded:
         train_sampler = torch.utils.data.distributed.DistributedSampler(
             train_dataset, shuffle=True
         )
 
+    if args.world_size > 1:
         val_sampler = torch.utils.data.distributed.DistributedSampler(
             val_dataset, shuffle=True
         )
@@ -40,35 +159,46 @@ def get_audio_dataloader(args, pretrain=True, download=False):
             test_dataset, shuffle=False
         )
 
-    train_loader = torch.utils.data.DataLoader(
-        dataset=train_dataset,
-        batch_size=args.batch_size,
-        shuffle=(train_sampler is None),
-        drop_last=True,
-        num_workers=args.workers,
-        pin_memory=True,
-        sampler=train_sampler,
-    )
+    if args.sharded:
+        # the shards are split over ranks and workers, and shuffled by the dataset itself
+        train_loader = torch.utils.data.DataLoader(
+            dataset=train_dataset,
+            batch_size=args.batch_size,
+            drop_last=True,
+            num_workers=args.workers,
+            pin_memory=True,
+        )
+    elif track_batches:
+        # unique tracks per (global) batch, so clips of one track are never each other's negatives
+        # with crops_per_track > 1, every track yields several pairs from one decode
+        crops = dict(
+            crops_per_track=args.crops_per_track, crop_mix=args.crop_mix, num_workers=args.workers
+        )
+        if args.world_size > 1:
+            train_batch_sampler = DistributedTrackBatchSampler(
+                train_dataset.track_index, args.batch_size, seed=args.seed, **crops
+            )
+        else:
+            train_batch_sampler = TrackBatchSampler(
+                train_dataset.track_index, args.batch_size, seed=args.seed, **crops
+            )
 
-    val_loader = torch.utils.data.DataLoader(
-        dataset=val_dataset,
-        batch_size=args.batch_size,
-        shuffle=(val_sampler is None),
-        drop_last=True,
-        num_workers=args.workers,
-        pin_memory=True,
-        sampler=val_sampler,
-    )
+        train_loader = get_loader(
+            args, train_dataset, batch_sampler=train_batch_sampler, slabs=args.batch_slabs
+        )
+    else:
+        train_loader = get_loader(
+            args,
+            train_dataset,
+            shuffle=(train_sampler is None),
+            sampler=train_sampler,
+            slabs=args.batch_slabs,
+        )
 
-    test_loader = torch.utils.data.DataLoader(
-        dataset=test_dataset,
-        batch_size=args.batch_size,
-        shuffle=(test_sampler is None),  # do not shuffle test set
-        drop_last=True,
-        num_workers=args.workers,
-        pin_memory=True,
-        sampler=test_sampler,
-    )
+    val_loader = get_loader(args, val_dataset, shuffle=(val_sampler is None), sampler=val_sampler)
+
+    # do not shuffle test set
+    test_loader = get_loader(args, test_dataset, shuffle=(test_sampler is None), sampler=test_sampler)
     # test_loader = None
 
     args.n_classes = train_dataset.num_tags
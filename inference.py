@@ -5,7 +5,7 @@ import numpy as np
 import matplotlib.pyplot as plt
 from data import get_dataset
 from model import load_encoder
-from scripts.datasets.resample import resample
+from utils.resample import load_audio
 from utils import parse_args, download_yt
 
 def save_taggram(yt_audio, title, sr, audio_length, taggram, tags, fp):
@@ -88,10 +88,7 @@ if __name__ == "__main__":
     print("Downloading and converting YouTube video...")
     video_title, video_id = download_yt(args.audio_url, tmp_input_file, args.sample_rate)
 
-    conv_fn = f"{tmp_input_file}_{args.sample_rate}"
-    resample(tmp_input_file, conv_fn, args.sample_rate)
-
-    yt_audio = process_wav(args.sample_rate, conv_fn, False)
+    yt_audio = load_audio(tmp_input_file, args.sample_rate)
     yt_audio = torch.from_numpy(yt_audio)
     yt_audio = yt_audio.reshape(1, -1) # to mono
 
@@ -122,6 +119,5 @@ if __name__ == "__main__":
 
     print("Cleaning up mp3...")
     os.remove(tmp_input_file)
-    os.remove(conv_fn)
 
     save_taggram(yt_audio, video_title, args.sample_rate, args.audio_length, taggram, train_dataset.tags, "taggram.png")
\ No newline at end of file
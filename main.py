@@ -15,10 +15,11 @@ import torch.multiprocessing as mp
 from torch.nn.parallel import DistributedDataParallel, DataParallel
 
 # custom modules
-from data import get_dataset
+from data import get_dataset, set_epoch
 from model import load_encoder, load_optimizer, save_model
 from modules import SimCLR, BYOL, NT_Xent
 from modules.sync_batchnorm import convert_model
+from modules.transformations import BatchedAudioTransforms
 from solver import Solver
 from utils import LogFile, eval_all, write_audio_tb, parse_args, get_log_dir, write_args
 from validation import audio_latent_representations
@@ -91,7 +92,10 @@ def main(args):
         # write_audio_tb(args, train_loader, test_loader, writer)
 
     # start training
-    solver = Solver(model, optimizer, criterion, writer)
+    batch_transforms = None
+    if args.batch_transforms and not args.supervised:
+        batch_transforms = BatchedAudioTransforms(args)
+    solver = Solver(model, optimizer, criterion, writer, batch_transforms)
 
     if args.supervised:
         validate_idx = 1
@@ -137,6 +141,10 @@ def main(args):
                 optimizer.param_groups[0]["lr"] = initial_lr
         
         learning_rate = optimizer.param_groups[0]["lr"]
+
+        # the samplers (and the sharded train set) shuffle with a seed per epoch
+        set_epoch(train_loader, epoch)
+
         metrics = solver.train(args, train_loader)
 
         if args.is_master:
@@ -1,2 +1,3 @@
 from .audio import AudioTransforms
+from .batched import BatchedAudioTransforms
 from .vision import TransformsSimCLR
\ No newline at end of file
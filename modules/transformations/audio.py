@@ -1,15 +1,41 @@
+import os
 import torch
 import torchaudio
 import random
-try:
-    import essentia.standard
-except Exception as e:
-    print("Essentia not found")
-    
 import numpy as np
 import audioop
 from torchaudio.transforms import Vol
-import augment
+
+from utils.audio import pcm_to_float, pcm_to_float_into
+from .filters import filter_bank
+from .pitch_shift import BatchedPitchShift
+from .reverb import IRBank, ir_bank_path
+from .batched import batched_stages
+
+
+_rngs = {}
+
+
+def worker_rng():
+    """
+    numpy Generator of this process, seeded from `random` (which the DataLoader seeds per worker)
+    """
+    rng = _rngs.get(os.getpid())
+    if rng is None:
+        rng = _rngs[os.getpid()] = np.random.default_rng(random.getrandbits(64))
+    return rng
+
+
+def copy_into(y, out):
+    # results of the transforms without an in-place version (sox effects, convolutions), the
+    # sox effect chains return [channels, samples]
+    if y is not out:
+        y = np.asarray(y).reshape(-1)
+        n = min(y.shape[0], out.shape[0])
+        out[:n] = y[:n]
+        out[n:] = 0
+    return out
+
 
 class RandomResizedCrop:
     def __init__(self, sr, n_samples):
@@ -19,9 +45,15 @@ class RandomResizedCrop:
     def __call__(self, audio):
         max_samples = audio.shape[0]
         start_idx = random.randint(0, max_samples - self.n_samples)  # * 2))
-        audio = audio[start_idx : start_idx + self.n_samples]
+        # only the crop is converted when reading from a (memory-mapped) PCM store
+        audio = pcm_to_float(audio[start_idx : start_idx + self.n_samples])
         return audio
 
+    def crop_into(self, audio, out):
+        max_samples = audio.shape[0]
+        start_idx = random.randint(0, max_samples - self.n_samples)
+        return pcm_to_float_into(audio[start_idx : start_idx + self.n_samples], out)
+
 
 class InvertSignal:
     def __init__(self, sr, p=0.5):
@@ -33,6 +65,10 @@ class InvertSignal:
             audio = np.negative(audio)  # considerably faster
         return audio
 
+    def apply_(self, audio, scratch):
+        if random.random() < self.p:
+            np.negative(audio, out=audio)
+
 
 class Noise:
     def __init__(self, sr, p=0.8):
@@ -49,6 +85,15 @@ class Noise:
             audio = np.clip(audio, -1, 1)
         return audio
 
+    def apply_(self, audio, scratch):
+        if random.random() < self.p:
+            RMS_s = np.sqrt(np.dot(audio, audio) / audio.shape[0])
+            RMS_n = np.sqrt(RMS_s ** 2 / (pow(10, self.snr / 20)))
+            worker_rng().standard_normal(out=scratch, dtype=np.float32)
+            scratch *= RMS_n
+            audio += scratch
+            np.clip(audio, -1, 1, out=audio)
+
 
 class HighLowBandPass:
     def __init__(self, sr, p=0.5):
@@ -58,22 +103,21 @@ class HighLowBandPass:
     def __call__(self, audio):
         highlowband = random.randint(0, 1)
         if random.random() < self.p:
+            # first-order high-pass / low-pass (like essentia's HighPass / LowPass), with
+            # coefficients precomputed for every cutoff
             if highlowband == 0:
                 highpass_freq = random.randint(200, 1200)
-                filt = essentia.standard.HighPass(
-                    cutoffFrequency=highpass_freq, sampleRate=self.sr
-                )
+                audio = filter_bank(self.sr)(audio, True, highpass_freq)
             elif highlowband == 1:
                 lowpass_freq = random.randint(2200, 4000)
-                filt = essentia.standard.LowPass(
-                    cutoffFrequency=lowpass_freq, sampleRate=self.sr
-                )
-            # else:
-            #     filt = essentia.standard.BandPass(bandwidth=1000, cutoffFrequency=1500, sampleRate=self.sr)
-            audio = filt(audio)
+                audio = filter_bank(self.sr)(audio, False, lowpass_freq)
 
         return audio
 
+    def apply_(self, audio, scratch):
+        # scipy's lfilter has no output argument, so the filtered signal is copied back
+        copy_into(self(audio), audio)
+
 
 class Gain:
     def __init__(self, sr, p=0.5):
@@ -88,16 +132,34 @@ class Gain:
             audio = audio.numpy()
         return audio
 
+    def apply_(self, audio, scratch):
+        if random.random() < self.p:
+            gain = random.randint(-20, -1)
+            audio *= np.float32(10 ** (gain / 20))
+            np.clip(audio, -1, 1, out=audio)  # like Vol
+
 
 class RandomPitchShift:
-    def __init__(self, audio_length, sr, p=0.5):
+    """
+    Shifts the pitch by a random number of cents in [-700, 700], with sox (`pitch_backend:
+    sox`, the reference) or with the (CPU) phase vocoder of BatchedPitchShift, on a grid of
+    |grid| cents (`pitch_backend: torch`)
+    """
+
+    def __init__(self, audio_length, sr, p=0.5, backend="sox", grid=50):
         self.audio_length = audio_length
         self.sr = sr
         self.p = p
+        self.backend = backend
         self.n_steps = lambda: random.randint(-700, 700)
-        self.effect_chain = (
-            augment.EffectChain().pitch(self.n_steps).rate(self.sr)
-        )
+        if backend == "torch":
+            self.pitch_shift = BatchedPitchShift(sr, grid=grid)
+        else:
+            import augment
+
+            self.effect_chain = (
+                augment.EffectChain().pitch(self.n_steps).rate(self.sr)
+            )
         self.src_info = {"rate": self.sr}
         self.target_info = {
             "channels": 1,
@@ -109,14 +171,18 @@ class RandomPitchShift:
         if random.random() < self.p:
             audio = torch.from_numpy(audio)
 
-            y = self.effect_chain.apply(
-                audio, src_info=self.src_info, target_info=self.target_info
-            )
+            if self.backend == "torch":
+                with torch.no_grad():
+                    y = self.pitch_shift(audio.reshape(1, 1, -1), [self.n_steps()]).reshape(-1)
+            else:
+                y = self.effect_chain.apply(
+                    audio, src_info=self.src_info, target_info=self.target_info
+                )
 
             # sox might misbehave sometimes by giving nan/inf if sequences are too short (or silent)
             # and the effect chain includes eg `pitch`
             if torch.isnan(y).any() or torch.isinf(y).any():
-                return audio.clone()
+                return audio.numpy().copy()
 
             audio = y.numpy()
         return audio
@@ -160,17 +226,35 @@ class Delay:
 
         return audio
 
+    def apply_(self, audio, scratch):
+        if random.random() < self.p:
+            offset = self.calc_offset(random.choice(np.arange(200, 500, 50)))
+            n = audio.shape[0] - offset
+            np.multiply(audio[:n], self.factor, out=scratch[:n])
+            audio[offset:] += scratch[:n]
+            audio *= 0.5
+
 
 class Reverb:
-    def __init__(self, sr, p=0.5):
+    """
+    sox reverb with random (reverberance, damping, room size) in [1, 100] (the reference), or
+    convolution with a random impulse response of the pre-rendered sox grid (|ir_bank|)
+    """
+
+    def __init__(self, sr, p=0.5, ir_bank=None):
         self.sr = sr
         self.p = p
+        self.ir_bank = ir_bank
         self.reverberance = lambda: random.randint(1, 100) # 0 - 100
         self.dumping_factor = lambda: random.randint(1, 100) # 0 - 100
         self.room_size = lambda: random.randint(1, 100) # 0 - 100
-        self.effect_chain = (
-            augment.EffectChain().reverb(self.reverberance, self.dumping_factor, self.room_size).channels(1)
-        )
+        self.effect_chain = None
+        if ir_bank is None:
+            import augment
+
+            self.effect_chain = (
+                augment.EffectChain().reverb(self.reverberance, self.dumping_factor, self.room_size).channels(1)
+            )
         self.src_info = {"rate": self.sr}
         self.target_info = {
             "channels": 1,
@@ -179,6 +263,9 @@ class Reverb:
 
     def __call__(self, audio):
         if random.random() < self.p:
+            if self.ir_bank is not None:
+                return self.ir_bank(audio, random.randrange(len(self.ir_bank)))
+
             audio = torch.from_numpy(audio)
             y = self.effect_chain.apply(
                 audio, src_info=self.src_info, target_info=self.target_info
@@ -200,31 +287,86 @@ class AudioTransforms:
         self.ablation = args.ablation
         sr = args.sample_rate
 
-        self.train_transform = [
-            RandomResizedCrop(n_samples=args.audio_length, sr=sr),
-            InvertSignal(p=args.transforms_polarity, sr=sr),
-            Noise(p=args.transforms_noise, sr=sr),
-            Gain(p=args.transforms_gain, sr=sr),
-            HighLowBandPass(p=args.transforms_filters, sr=sr),
-            Delay(p=args.transforms_delay, sr=sr),
-            RandomPitchShift(
-                audio_length=args.audio_length, p=args.transforms_pitch, sr=sr
-            ),
-            Reverb(
-                p=args.transforms_reverb, sr=sr
+        # with `batch_transforms`, the stages after the last sox effect are applied to whole
+        # batches instead (see BatchedAudioTransforms), the workers run the ones before
+        batched = batched_stages(args) if args.batch_transforms else []
+
+        ir_bank = None
+        if args.reverb_backend == "ir" and "reverb" not in batched:
+            ir_bank = IRBank(
+                ir_bank_path(args.data_input_dir, sr, args.reverb_grid, args.reverb_ir_seconds),
+                sr,
+                args.reverb_grid,
+                args.reverb_ir_seconds,
             )
+
+        stages = [
+            ("polarity", lambda: InvertSignal(p=args.transforms_polarity, sr=sr)),
+            ("noise", lambda: Noise(p=args.transforms_noise, sr=sr)),
+            ("gain", lambda: Gain(p=args.transforms_gain, sr=sr)),
+            ("filters", lambda: HighLowBandPass(p=args.transforms_filters, sr=sr)),
+            ("delay", lambda: Delay(p=args.transforms_delay, sr=sr)),
+            (
+                "pitch",
+                lambda: RandomPitchShift(
+                    audio_length=args.audio_length,
+                    p=args.transforms_pitch,
+                    sr=sr,
+                    backend=args.pitch_backend,
+                    grid=args.pitch_grid,
+                ),
+            ),
+            ("reverb", lambda: Reverb(p=args.transforms_reverb, sr=sr, ir_bank=ir_bank)),
         ]
+        self.train_transform = [RandomResizedCrop(n_samples=args.audio_length, sr=sr)]
+        # disabled sox effects are left out, so they do not need sox (augment) either
+        skipped = batched + [stage for stage, p in [("pitch", args.transforms_pitch), ("reverb", args.transforms_reverb)] if p <= 0]
+        self.train_transform += [make() for stage, make in stages if stage not in skipped]
         self.test_transform = []
 
+        # per-worker float32 buffers the two views are written into (see buffers)
+        self.ring_size = max(1, args.batch_size)
+        self.ring = None
+        self.scratch = None
+        self.ring_pid = None
+        self.ring_idx = 0
+
+    def __getstate__(self):
+        # every DataLoader worker allocates its own buffers
+        state = self.__dict__.copy()
+        state["ring"] = None
+        state["scratch"] = None
+        state["ring_pid"] = None
+        return state
+
+    def buffers(self):
+        """
+        The next [2, audio_length] slot of this process' ring of |ring_size| pairs (one batch),
+        and a scratch array. A slot is only reused a batch later, after the DataLoader has
+        collated (copied) it.
+        """
+        if self.ring_pid != os.getpid():
+            self.ring = np.empty((self.ring_size, 2, self.args.audio_length), dtype=np.float32)
+            self.scratch = np.empty(self.args.audio_length, dtype=np.float32)
+            self.ring_pid = os.getpid()
+            self.ring_idx = 0
+        views = self.ring[self.ring_idx]
+        self.ring_idx = (self.ring_idx + 1) % self.ring_size
+        return views, self.scratch
+
     def __call__(self, x, mean, std):
-        x0 = self.transform(x, 0)
-        x1 = self.transform(x, 1)
-
-        # to PyTorch format (channels, samples)
-        x0 = x0.reshape(1, -1)
-        x1 = x1.reshape(1, -1)
-        x0 = torch.from_numpy(x0)
-        x1 = torch.from_numpy(x1)
+        # datasets may pass one pre-cropped window per view instead of the full clip
+        if isinstance(x, tuple):
+            x0, x1 = x
+        else:
+            x0, x1 = x, x
+        views, scratch = self.buffers()
+        self.transform_into(x0, views[0], scratch, 0)
+        self.transform_into(x1, views[1], scratch, 1)
+
+        # to PyTorch format (channels, samples), sharing the buffers
+        x0 = torch.from_numpy(views[0:1])
+        x1 = torch.from_numpy(views[1:2])
         return x0, x1
 
     def transform(self, x, num):
@@ -235,3 +377,18 @@ class AudioTransforms:
             for t in self.train_transform:
                 x = t(x)
         return x
+
+    def transform_into(self, x, out, scratch, num):
+        """
+        transform, written into the float32 array |out|: the crop is converted into it, and the
+        transforms modify it in place (apply_) or have their result copied back (sox effects)
+        """
+        self.train_transform[0].crop_into(x, out)
+        if self.ablation and num == 1:
+            return out
+        for t in self.train_transform[1:]:
+            if hasattr(t, "apply_"):
+                t.apply_(out, scratch)
+            else:
+                copy_into(t(out), out)
+        return out
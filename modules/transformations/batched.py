@@ -0,0 +1,156 @@
+import torch
+
+from .filters import filter_bank, HIGHPASS_CUTOFFS, LOWPASS_CUTOFFS
+from .pitch_shift import BatchedPitchShift
+from .reverb import IRBank, ir_bank_path, fft_convolve
+
+# the augmentations of AudioTransforms after the crop, in the order they are applied
+STAGES = ["polarity", "noise", "gain", "filters", "delay", "pitch", "reverb"]
+
+
+def batched_stages(args):
+    """
+    The stages `batch_transforms` applies to whole batches: the tail of the chain after the
+    last sox effect (which only runs per sample in the workers), so the order is kept
+    """
+    sox = []
+    if args.pitch_backend == "sox" and args.transforms_pitch > 0:
+        sox.append(STAGES.index("pitch"))
+    if args.reverb_backend == "sox" and args.transforms_reverb > 0:
+        sox.append(STAGES.index("reverb"))
+    if not sox:
+        return list(STAGES)
+    return STAGES[max(sox) + 1 :]
+
+
+class BatchedAudioTransforms:
+    """
+    The augmentations of AudioTransforms, applied to a whole [batch, 1, samples] tensor after
+    collation, on any device. Every sample draws its own parameters (as vectors), with the
+    probabilities and ranges of the per-sample transforms, so training is statistically the
+    same. Only the stages after the last sox effect run here (see batched_stages): with the sox
+    pitch shift the workers run the chain up to it and only the IR reverb is batched, with the
+    sox reverb (last) the whole chain runs in the workers and only the crop is left.
+    """
+
+    def __init__(self, args):
+        self.stages = batched_stages(args)
+        if not self.stages:
+            print("batch_transforms: the sox reverb runs last and per sample, so all augmentations run in the DataLoader workers")
+
+        self.sr = args.sample_rate
+        self.audio_length = args.audio_length
+        self.p_polarity = args.transforms_polarity
+        self.p_noise = args.transforms_noise
+        self.p_gain = args.transforms_gain
+        self.p_filters = args.transforms_filters
+        self.p_delay = args.transforms_delay
+
+        self.snr = 80
+        self.delay_factor = 0.2  # volume factor of delay signal
+        self.delay_ms = torch.arange(200, 500, 50)
+
+        self.p_pitch = args.transforms_pitch
+        self.pitch_shift = None
+        if "pitch" in self.stages and args.pitch_backend == "torch":
+            self.pitch_shift = BatchedPitchShift(self.sr, grid=args.pitch_grid)
+
+        self.p_reverb = args.transforms_reverb
+        self.ir_bank = None
+        if "reverb" in self.stages and args.reverb_backend == "ir":
+            self.ir_bank = IRBank(
+                ir_bank_path(args.data_input_dir, self.sr, args.reverb_grid, args.reverb_ir_seconds),
+                self.sr,
+                args.reverb_grid,
+                args.reverb_ir_seconds,
+            )
+
+    def apply(self, x, p):
+        # per-sample mask of the samples that are transformed with probability |p|
+        return torch.rand(x.shape[0], device=x.device) < p
+
+    def crop(self, x):
+        if x.shape[-1] <= self.audio_length:
+            return x
+        starts = torch.randint(0, x.shape[-1] - self.audio_length + 1, (x.shape[0], 1, 1), device=x.device)
+        idx = starts + torch.arange(self.audio_length, device=x.device)
+        return torch.gather(x, 2, idx.expand(-1, x.shape[1], -1))
+
+    def polarity(self, x):
+        mask = self.apply(x, self.p_polarity)
+        return torch.where(mask[:, None, None], -x, x)
+
+    def noise(self, x):
+        mask = self.apply(x, self.p_noise)
+        if not mask.any():
+            return x
+        rms_s = torch.sqrt(torch.mean(x ** 2, dim=(1, 2), keepdim=True))
+        rms_n = torch.sqrt(rms_s ** 2 / (10 ** (self.snr / 20)))
+        noisy = torch.clamp(x + torch.randn_like(x) * rms_n, -1, 1)
+        return torch.where(mask[:, None, None], noisy, x)
+
+    def gain(self, x):
+        mask = self.apply(x, self.p_gain)
+        if not mask.any():
+            return x
+        # input was normalized to max(x), gain in [-20, -1] dB, clamped like torchaudio's Vol
+        gain_db = torch.randint(-20, 0, (x.shape[0], 1, 1), device=x.device).to(x.dtype)
+        gained = torch.clamp(x * 10 ** (gain_db / 20), -1, 1)
+        return torch.where(mask[:, None, None], gained, x)
+
+    def filters(self, x):
+        # the band choice is drawn for every sample, like HighLowBandPass
+        highpass = torch.randint(0, 2, (x.shape[0],), device=x.device) == 0
+        mask = self.apply(x, self.p_filters)
+        if not mask.any():
+            return x
+
+        highpass_freq = torch.randint(HIGHPASS_CUTOFFS[0], HIGHPASS_CUTOFFS[1] + 1, (x.shape[0],), device=x.device)
+        lowpass_freq = torch.randint(LOWPASS_CUTOFFS[0], LOWPASS_CUTOFFS[1] + 1, (x.shape[0],), device=x.device)
+        cutoff = torch.where(highpass, highpass_freq, lowpass_freq)
+        # the first-order filters as truncated impulse responses, one FFT convolution for all
+        # samples instead of a sample-by-sample recursion
+        irs = filter_bank(self.sr).batch_impulse_responses(highpass[mask], cutoff[mask])
+
+        x = x.clone()
+        x[mask] = fft_convolve(x[mask], irs[:, None, :].to(x.dtype))
+        return x
+
+    def delay(self, x):
+        mask = self.apply(x, self.p_delay)
+        if not mask.any():
+            return x
+        # delay between 200 - 500ms with 50ms intervals
+        ms = self.delay_ms.to(x.device)[torch.randint(0, len(self.delay_ms), (x.shape[0],), device=x.device)]
+        offsets = (ms * (self.sr / 1000)).long()
+
+        idx = torch.arange(x.shape[-1], device=x.device) - offsets[:, None]
+        delayed = torch.gather(x, 2, idx.clamp(min=0)[:, None, :].expand(-1, x.shape[1], -1))
+        delayed = delayed * (idx >= 0)[:, None, :] * self.delay_factor
+        return torch.where(mask[:, None, None], (x + delayed) / 2, x)
+
+    def pitch(self, x):
+        mask = self.apply(x, self.p_pitch)
+        if self.pitch_shift is None or not mask.any():
+            return x
+        # kernels follow the batch to its device
+        self.pitch_shift.to(x.device)
+        cents = torch.randint(-700, 701, (x.shape[0],), device=x.device)
+        with torch.no_grad():
+            return self.pitch_shift(x, torch.where(mask, cents, torch.zeros_like(cents)))
+
+    def reverb(self, x):
+        mask = self.apply(x, self.p_reverb)
+        if self.ir_bank is None or not mask.any():
+            return x
+        # one FFT convolution for all samples, with a random impulse response each
+        idx = torch.randint(0, len(self.ir_bank), (int(mask.sum()),), device=x.device)
+        x = x.clone()
+        x[mask] = self.ir_bank.batch(x[mask], idx)
+        return x
+
+    def __call__(self, x):
+        x = self.crop(x)
+        for stage in self.stages:
+            x = getattr(self, stage)(x)
+        return x
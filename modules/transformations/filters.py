@@ -0,0 +1,93 @@
+import numpy as np
+import scipy.signal
+import torch
+
+# integer cutoff ranges (Hz, inclusive) of HighLowBandPass
+HIGHPASS_CUTOFFS = (200, 1200)
+LOWPASS_CUTOFFS = (2200, 4000)
+
+
+def first_order_biquads(cutoffs, sr, highpass):
+    """
+    Coefficients [b0, b1, b2, a0, a1, a2] of the first-order IIR high-pass / low-pass filters
+    of Essentia (HighPass, LowPass) for every cutoff, in biquad form (b2 = a2 = 0):
+    c = (tan(pi fc / sr) - 1) / (tan(pi fc / sr) + 1)
+    """
+    t = np.tan(np.pi * np.asarray(cutoffs, dtype=np.float64) / sr)
+    c = (t - 1) / (t + 1)
+    zeros = np.zeros_like(c)
+    if highpass:
+        b = [(1 - c) / 2, (c - 1) / 2, zeros]
+    else:
+        b = [(1 + c) / 2, (1 + c) / 2, zeros]
+    return np.stack(b + [np.ones_like(c), c, zeros], axis=1)
+
+
+def first_order_impulse_responses(sos, tol=1e-7):
+    """
+    Impulse responses of the first-order filters |sos| ([cutoffs, 6], see first_order_biquads),
+    truncated where every response has decayed below |tol|:
+    h[0] = b0, h[n] = r (-a1)^(n - 1), with r = b1 - a1 b0
+    """
+    b0, b1, a1 = sos[:, 0:1], sos[:, 1:2], sos[:, 4:5]
+    r = b1 - a1 * b0
+    # a cutoff at Nyquist puts the pole on the unit circle, but cancels it (r = 0)
+    decaying = np.abs(r[:, 0]) > tol
+    length = 1
+    if decaying.any():
+        taps = np.log(tol / np.abs(r[decaying, 0])) / np.log(np.abs(a1[decaying, 0]))
+        length += 1 + int(np.ceil(taps.max()))
+    n = np.arange(length - 1)
+    return np.concatenate([b0, r * (-a1) ** n], axis=1)
+
+
+class FilterBank:
+    """
+    Biquad coefficients of every integer cutoff of HighLowBandPass at sample rate |sr|,
+    computed once (see filter_bank), instead of a new filter object per call
+    """
+
+    def __init__(self, sr):
+        self.sr = sr
+        self.highpass = first_order_biquads(np.arange(HIGHPASS_CUTOFFS[0], HIGHPASS_CUTOFFS[1] + 1), sr, True)
+        self.lowpass = first_order_biquads(np.arange(LOWPASS_CUTOFFS[0], LOWPASS_CUTOFFS[1] + 1), sr, False)
+        self.ir_tables = {}
+
+    def coefficients(self, highpass, cutoff):
+        if highpass:
+            sos = self.highpass[cutoff - HIGHPASS_CUTOFFS[0]]
+        else:
+            sos = self.lowpass[cutoff - LOWPASS_CUTOFFS[0]]
+        return sos[:3], sos[3:]
+
+    def __call__(self, audio, highpass, cutoff):
+        b, a = self.coefficients(highpass, cutoff)
+        return scipy.signal.lfilter(b, a, audio).astype(np.float32)
+
+    def batch_impulse_responses(self, highpass, cutoff):
+        """
+        Truncated impulse responses [batch, taps] for boolean / integer tensors |highpass| and
+        |cutoff|, to filter a batch with one FFT convolution instead of a sample-by-sample
+        recursion (see BatchedAudioTransforms.filters)
+        """
+        irs = self.ir_tables.get(cutoff.device)
+        if irs is None:
+            # both banks in one table, high-pass first
+            irs = first_order_impulse_responses(np.concatenate([self.highpass, self.lowpass]))
+            irs = self.ir_tables[cutoff.device] = torch.from_numpy(irs).float().to(cutoff.device)
+        rows = torch.where(
+            highpass,
+            cutoff - HIGHPASS_CUTOFFS[0],
+            cutoff - LOWPASS_CUTOFFS[0] + len(self.highpass),
+        )
+        return irs[rows]
+
+
+_banks = {}
+
+
+def filter_bank(sr):
+    bank = _banks.get(sr)
+    if bank is None:
+        bank = _banks[sr] = FilterBank(sr)
+    return bank
\ No newline at end of file
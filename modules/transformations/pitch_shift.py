@@ -1,9 +1,21 @@
+import math
+from fractions import Fraction
 import torch
-from torchaudio.transforms import Spectrogram, TimeStretch, Resample
+from torchaudio.transforms import Resample
 from torchaudio import functional as F
 
+
+def shift_ratio(cents, max_denominator=64):
+    """
+    Frequency factor 2 ** (cents / 1200) as a fraction (numerator, denominator) with small
+    terms, so the resampling kernel stays short. The shift is off by less than a few cents.
+    """
+    ratio = Fraction(2 ** (cents / 1200)).limit_denominator(max_denominator)
+    return ratio.numerator, ratio.denominator
+
+
 class PitchShift(torch.nn.Module):
-    r"""Shift the pitch of a waveform by n_steps semitones.
+    r"""Shift the pitch of a waveform by n_steps semitones, on the device the module is on.
     Args:
         sample_rate(int): Waveform sampling rate.
         n_steps(int, optional): How many (fractional) half-steps to shift waveform. (Default: ``4``)
@@ -38,16 +50,16 @@ class PitchShift(torch.nn.Module):
         if not self.hop_length:
             self.hop_length = self.win_length // 2
 
-        self.Spectrogram = Spectrogram(power=None,
-                                       n_fft=self.n_fft,
-                                       win_length=self.win_length,
-                                       hop_length=self.hop_length).to("cuda")
-
         n_freq = n_fft // 2 + 1
-        self.rate = 2.0 ** (-n_steps / self.bins_per_octave)
+        self.register_buffer("window", torch.hann_window(self.win_length))
+        self.register_buffer(
+            "phase_advance", torch.linspace(0, math.pi * self.hop_length, n_freq)[..., None]
+        )
 
-        self.TimeStretch = TimeStretch(hop_length=self.hop_length, n_freq=n_freq, fixed_rate=self.rate).to("cuda")
-        self.Resample = Resample(self.sample_rate / self.rate, self.sample_rate).to("cuda")
+        # stretch by the (rational) frequency factor, and resample back to the original duration
+        orig_freq, new_freq = shift_ratio(1200 * n_steps / bins_per_octave)
+        self.rate = new_freq / orig_freq
+        self.Resample = Resample(orig_freq, new_freq)
 
     def forward(self, waveform):
         # type: (Tensor) -> Tensor
@@ -57,20 +69,70 @@ class PitchShift(torch.nn.Module):
         Returns:
             torch.Tensor: Tensor of audio of dimension (..., time).
         """
+        shape = waveform.shape
+        waveform = waveform.reshape(-1, shape[-1])
 
-        complex_specgrams = self.Spectrogram(waveform)
-        complex_specgrams_stretch = self.TimeStretch(complex_specgrams)
-        waveform_stretch = F.istft(complex_specgrams_stretch,
-                                   n_fft=self.n_fft,
-                                   hop_length=self.hop_length,
-                                   win_length=self.win_length)
+        complex_specgrams = torch.stft(
+            waveform,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            win_length=self.win_length,
+            window=self.window,
+            return_complex=True,
+        )
+        complex_specgrams_stretch = F.phase_vocoder(complex_specgrams, self.rate, self.phase_advance)
+        waveform_stretch = torch.istft(
+            complex_specgrams_stretch,
+            n_fft=self.n_fft,
+            hop_length=self.hop_length,
+            win_length=self.win_length,
+            window=self.window,
+        )
 
         waveform_shift = self.Resample(waveform_stretch)
 
-        waveform_length = waveform.size(-1)
+        waveform_length = shape[-1]
         waveform_shift_length = waveform_shift.size(-1)
 
         if waveform_length < waveform_shift_length:
-            return waveform_shift[..., :waveform_length]
+            waveform_shift = waveform_shift[..., :waveform_length]
+        else:
+            waveform_shift = torch.nn.functional.pad(waveform_shift, [0, waveform_length - waveform_shift_length])
+        return waveform_shift.reshape(shape)
+
+
+class BatchedPitchShift(torch.nn.Module):
+    """
+    Shifts every sample of a [batch, ..., time] tensor by its own number of cents. Shifts are
+    quantized to a grid of |grid| cents within [-max_cents, max_cents], and the PitchShift
+    (window, phase advance and resampling kernel) of every grid point is built once. Samples
+    with the same grid point are shifted together; the module runs on the device it is moved to.
+    """
+
+    def __init__(self, sample_rate, grid=50, max_cents=700, n_fft=1024, hop_length=256):
+        super(BatchedPitchShift, self).__init__()
+        self.grid = grid
+        self.max_cents = max_cents
+        self.points = list(range(-(max_cents // grid) * grid, max_cents + 1, grid))
+        self.shifts = torch.nn.ModuleDict(
+            {
+                str(cents): PitchShift(sample_rate, n_steps=cents / 100, n_fft=n_fft, hop_length=hop_length)
+                for cents in self.points
+                if cents != 0
+            }
+        )
+
+    def quantize(self, cents):
+        cents = torch.as_tensor(cents, dtype=torch.float32)
+        cents = torch.round(cents / self.grid) * self.grid
+        return cents.clamp(self.points[0], self.points[-1]).long()
 
-        return torch.nn.functional.pad(waveform_shift, [0, waveform_length - waveform_shift_length])
\ No newline at end of file
+    def forward(self, waveform, cents):
+        cents = self.quantize(cents).to(waveform.device)
+        out = waveform.clone()
+        for point in torch.unique(cents).tolist():
+            if point == 0:
+                continue
+            idx = (cents == point).nonzero(as_tuple=True)[0]
+            out[idx] = self.shifts[str(point)](waveform[idx])
+        return out
@@ -0,0 +1,133 @@
+import os
+import itertools
+import numpy as np
+import torch
+import torch.distributed as dist
+from tqdm import tqdm
+
+
+def ir_bank_path(data_input_dir, sr, grid, seconds):
+    return os.path.join(data_input_dir, "ir_bank", f"reverb-{sr}-{grid}-{seconds:g}s.npz")
+
+
+def grid_points(grid):
+    # |grid| values of every sox reverb parameter, over its range [1, 100]
+    return np.unique(np.round(np.linspace(1, 100, grid)).astype(np.int64))
+
+
+def render_ir_bank(sr, grid, seconds):
+    """
+    Impulse responses of the sox reverb effect (with the dry signal, like Reverb) for every
+    (reverberance, damping, room size) of the grid, by passing a unit impulse through it
+    """
+    import augment
+
+    impulse = torch.zeros(1, int(seconds * sr))
+    impulse[0, 0] = 1
+    points = grid_points(grid)
+    params = np.array(list(itertools.product(points, points, points)), dtype=np.int64)
+
+    irs = np.zeros((len(params), impulse.shape[1]), dtype=np.float32)
+    for i, (reverberance, damping, room_size) in enumerate(tqdm(params)):
+        chain = augment.EffectChain().reverb(int(reverberance), int(damping), int(room_size)).channels(1)
+        y = chain.apply(impulse, src_info={"rate": sr}, target_info={"channels": 1, "rate": sr})
+        y = y.reshape(-1).numpy()[: irs.shape[1]]
+        irs[i, : y.shape[0]] = y
+    return irs, params
+
+
+def save_ir_bank(path, sr, grid, seconds):
+    print(f"Rendering the reverb impulse responses ({grid}^3 at {sr} Hz) into {path}")
+    irs, params = render_ir_bank(sr, grid, seconds)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, irs=irs, params=params, sample_rate=sr)
+    os.replace(tmp_path, path)
+
+
+def prepare_ir_bank(args):
+    """
+    Renders the impulse-response bank of `reverb_backend: ir` if it does not exist yet, on local
+    rank 0 only: the other ranks wait for it (and fail too if it could not be rendered), instead
+    of every rank rendering the same bank
+    """
+    path = ir_bank_path(args.data_input_dir, args.sample_rate, args.reverb_grid, args.reverb_ir_seconds)
+    error = None
+    if args.local_rank == 0 and not os.path.exists(path):
+        try:
+            save_ir_bank(path, args.sample_rate, args.reverb_grid, args.reverb_ir_seconds)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+
+    if args.world_size > 1 and dist.is_available() and dist.is_initialized():
+        errors = [None] * dist.get_world_size()
+        dist.all_gather_object(errors, error)
+        error = next((e for e in errors if e is not None), None)
+    if error is not None:
+        raise Exception(
+            f"Could not render the reverb impulse responses into {path} ({error}), render them "
+            f"with `python -m scripts.datasets.render_ir_bank` where sox (augment) is installed"
+        )
+    return path
+
+
+def load_ir_bank(path, sr, grid, seconds):
+    """
+    Loads the impulse-response bank from |path|, see prepare_ir_bank and
+    scripts/datasets/render_ir_bank.py
+    """
+    if not os.path.exists(path):
+        raise Exception(
+            f"The reverb impulse responses are missing ({path}), render them with `python -m "
+            f"scripts.datasets.render_ir_bank --data_input_dir <dir> --sample_rate {sr} "
+            f"--reverb_grid {grid} --reverb_ir_seconds {seconds:g}`"
+        )
+
+    with np.load(path) as f:
+        if int(f["sample_rate"]) != sr:
+            raise Exception(f"{path} holds impulse responses at {int(f['sample_rate'])} Hz, not {sr} Hz")
+        return f["irs"], f["params"]
+
+
+def fft_convolve(x, h):
+    """
+    Convolves every row of [..., time] |x| with the matching row of |h|, truncated to the
+    length of |x|
+    """
+    length = x.shape[-1]
+    n = 1 << (length + h.shape[-1] - 2).bit_length()
+    y = torch.fft.irfft(torch.fft.rfft(x, n) * torch.fft.rfft(h, n), n)
+    return y[..., :length]
+
+
+class IRBank:
+    """
+    Reverb by convolution with a random impulse response of the pre-rendered sox reverb grid
+    (see render_ir_bank), per sample (numpy) or for a whole [batch, 1, time] tensor
+    """
+
+    def __init__(self, path, sr, grid=10, seconds=1.0):
+        self.path = path
+        irs, self.params = load_ir_bank(path, sr, grid, seconds)
+        self.irs = torch.from_numpy(irs)
+        self.device_irs = {}
+
+    def __len__(self):
+        return len(self.irs)
+
+    def __getstate__(self):
+        # only the CPU bank goes to DataLoader workers
+        state = self.__dict__.copy()
+        state["device_irs"] = {}
+        return state
+
+    def __call__(self, audio, idx):
+        y = fft_convolve(torch.from_numpy(audio).reshape(1, -1), self.irs[idx : idx + 1])
+        return y.reshape(-1).numpy().astype(np.float32)
+
+    def batch(self, x, idx):
+        irs = self.device_irs.get(x.device)
+        if irs is None:
+            irs = self.device_irs[x.device] = self.irs.to(x.device)
+        return fft_convolve(x, irs[idx].reshape(x.shape[0], *([1] * (x.dim() - 2)), -1))
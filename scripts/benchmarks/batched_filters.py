@@ -0,0 +1,79 @@
+import time
+import argparse
+import numpy as np
+import torch
+import torchaudio.functional as F
+
+from modules.transformations.filters import filter_bank, HIGHPASS_CUTOFFS, LOWPASS_CUTOFFS
+from modules.transformations.reverb import fft_convolve
+
+
+def lfilter(x, b, a):
+    # the sample-by-sample recursion BatchedAudioTransforms.filters used before the FFT convolution
+    try:
+        return F.lfilter(x, a, b, clamp=False, batching=True)
+    except TypeError:  # older torchaudio, without per-row coefficients
+        return torch.stack([F.lfilter(x[i], a[i], b[i], clamp=False) for i in range(x.shape[0])])
+
+
+def random_filters(bank, batch_size, device):
+    highpass = torch.randint(0, 2, (batch_size,), device=device) == 0
+    highpass_freq = torch.randint(HIGHPASS_CUTOFFS[0], HIGHPASS_CUTOFFS[1] + 1, (batch_size,), device=device)
+    lowpass_freq = torch.randint(LOWPASS_CUTOFFS[0], LOWPASS_CUTOFFS[1] + 1, (batch_size,), device=device)
+    return highpass, torch.where(highpass, highpass_freq, lowpass_freq)
+
+
+def coefficients(bank, highpass, cutoff):
+    sos = [bank.coefficients(bool(h), int(c)) for h, c in zip(highpass, cutoff)]
+    b = torch.tensor(np.stack([s[0] for s in sos]), dtype=torch.float32, device=cutoff.device)
+    a = torch.tensor(np.stack([s[1] for s in sos]), dtype=torch.float32, device=cutoff.device)
+    return b, a
+
+
+def timeit(name, n, fn, repeats, sync):
+    fn()  # warm-up (impulse-response tables, FFT plans)
+    sync()
+    t0 = time.time()
+    for _ in range(repeats):
+        fn()
+    sync()
+    dt = (time.time() - t0) / repeats
+    print(f"[{name}]\t{n} samples in {dt * 1e3:.1f} ms\t{n / dt:.1f} samples/s")
+
+
+if __name__ == "__main__":
+    # throughput of the batched high-pass / low-pass filters: torchaudio's lfilter recursion and
+    # the FFT convolution with the truncated impulse responses, and the largest difference to
+    # the per-sample (scipy) filters
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sample_rate", type=int, default=22050)
+    parser.add_argument("--audio_length", type=int, default=59049)
+    parser.add_argument("--batch_size", type=int, default=48)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    bank = filter_bank(args.sample_rate)
+    devices = ["cpu"] + (["cuda"] if torch.cuda.is_available() else [])
+    for device in devices:
+        sync = torch.cuda.synchronize if device == "cuda" else lambda: None
+        x = torch.rand(args.batch_size, args.audio_length, device=device) * 2 - 1
+        highpass, cutoff = random_filters(bank, args.batch_size, device)
+        b, a = coefficients(bank, highpass, cutoff)
+        irs = bank.batch_impulse_responses(highpass, cutoff)
+
+        with torch.no_grad():
+            timeit(f"lfilter {device}", args.batch_size, lambda: lfilter(x, b, a), args.repeats, sync)
+            timeit(
+                f"fft convolution {device} ({irs.shape[1]} taps)",
+                args.batch_size,
+                lambda: fft_convolve(x, irs),
+                args.repeats,
+                sync,
+            )
+
+        y = fft_convolve(x, irs).cpu().numpy()
+        x = x.cpu().numpy()
+        error = max(
+            np.abs(y[i] - bank(x[i], bool(highpass[i]), int(cutoff[i]))).max() for i in range(args.batch_size)
+        )
+        print(f"max. difference to the per-sample filters ({device}): {error:.2e}")
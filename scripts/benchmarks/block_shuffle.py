@@ -0,0 +1,73 @@
+import time
+import argparse
+import numpy as np
+
+from data.audio.index import AudioIndex
+from data.audio.packed import PackedAudioStore, find_wavs
+from data.audio.samplers import BlockShuffleSampler, locality_keys
+from utils.audio import read_wav_header, read_wav_window, pcm_to_float
+
+
+def per_file(fp, audio_length):
+    num_samples = read_wav_header(fp).num_samples
+    start_idx = np.random.randint(0, max(1, num_samples - audio_length))
+    audio, _ = read_wav_window(fp, start_idx, audio_length)
+    return pcm_to_float(audio)
+
+
+def packed(store, fp, audio_length):
+    num_samples = store.num_samples(fp)
+    start_idx = np.random.randint(0, max(1, num_samples - audio_length))
+    return pcm_to_float(store.get(fp, start_idx, audio_length))
+
+
+def randomness(rows, keys):
+    """
+    Mean distance (in storage order) between consecutive reads, relative to a full shuffle
+    (1.0 is as random as a full shuffle, 0.0 is a sequential scan)
+    """
+    positions = np.argsort(np.argsort(keys, kind="stable"), kind="stable")[rows]
+    return np.abs(np.diff(positions)).mean() / (len(keys) / 3)
+
+
+def run(name, index, keys, block_size, window, num_samples, read):
+    sampler = BlockShuffleSampler(index, block_size, window, keys=keys)
+    rows = np.array(list(sampler))[:num_samples]
+
+    num_bytes = 0
+    t0 = time.time()
+    for row in rows:
+        num_bytes += read(str(index.paths[index.path_ids[row]])).nbytes // 2  # int16 on disk
+    dt = time.time() - t0
+    print(
+        f"[{name}]\tblock {block_size}\twindow {window}\trandomness {randomness(rows, keys):.3f}\t"
+        f"{len(rows) / dt:.1f} samples/s\t{num_bytes / dt / 2 ** 20:.1f} MB/s"
+    )
+
+
+if __name__ == "__main__":
+    # read throughput vs. randomness of BlockShuffleSampler, on the per-file and packed stores
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, required=True, help="e.g. datasets/magnatagatune/processed/train")
+    parser.add_argument("--sample_rate", type=int, default=None, help="for processed directories with several rates")
+    parser.add_argument("--audio_length", type=int, default=59049)
+    parser.add_argument("--num_samples", type=int, default=2000)
+    parser.add_argument("--block_sizes", type=str, default="1,4,16,64,256")
+    parser.add_argument("--window", type=int, default=0)
+    args = parser.parse_args()
+
+    fps = find_wavs(args.root)
+    if args.sample_rate is not None:
+        fps = [fp for fp in fps if fp.endswith(f"-{args.sample_rate}.wav")]
+    index = AudioIndex.from_clips(np.arange(len(fps)), np.arange(len(fps)), fps, np.zeros((len(fps), 1)))
+    block_sizes = [int(b) for b in args.block_sizes.split(",")]
+
+    # NOTE: drop the page cache between runs (echo 3 > /proc/sys/vm/drop_caches) for cold numbers
+    keys = locality_keys(index)
+    for block_size in block_sizes:
+        run("per-file", index, keys, block_size, args.window, args.num_samples, lambda fp: per_file(fp, args.audio_length))
+
+    store = PackedAudioStore(args.root, args.sample_rate)
+    keys = locality_keys(index, store)
+    for block_size in block_sizes:
+        run("packed", index, keys, block_size, args.window, args.num_samples, lambda fp: packed(store, fp, args.audio_length))
@@ -0,0 +1,46 @@
+import os
+import time
+import random
+import argparse
+import numpy as np
+
+from data.audio.packed import PackedAudioStore, find_wavs
+from utils.audio import process_wav, pcm_to_float
+
+
+def per_file(fps, sample_rate, audio_length):
+    for fp in fps:
+        audio, _ = process_wav(sample_rate, fp, False)
+        start_idx = random.randint(0, audio.shape[0] - audio_length)
+        audio[start_idx : start_idx + audio_length]
+
+
+def packed(store, fps, audio_length):
+    for fp in fps:
+        audio = store.get(fp)
+        start_idx = random.randint(0, audio.shape[0] - audio_length)
+        pcm_to_float(audio[start_idx : start_idx + audio_length])
+
+
+def timeit(name, n, fn, *args):
+    t0 = time.time()
+    fn(*args)
+    dt = time.time() - t0
+    print(f"[{name}]\t{n} samples in {dt:.2f}s\t{n / dt:.1f} samples/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, required=True, help="e.g. datasets/magnatagatune/processed/train")
+    parser.add_argument("--sample_rate", type=int, default=22050)
+    parser.add_argument("--audio_length", type=int, default=59049)
+    parser.add_argument("--num_samples", type=int, default=2000)
+    args = parser.parse_args()
+
+    fps = find_wavs(args.root)
+    fps = [fps[i] for i in np.random.choice(len(fps), args.num_samples)]
+    store = PackedAudioStore(args.root)
+
+    # NOTE: drop the page cache between runs (echo 3 > /proc/sys/vm/drop_caches) for cold numbers
+    timeit("per-file", len(fps), per_file, fps, args.sample_rate, args.audio_length)
+    timeit("packed", len(fps), packed, store, fps, args.audio_length)
@@ -0,0 +1,125 @@
+import time
+import argparse
+import numpy as np
+import torch
+import augment
+
+from data.audio.packed import find_wavs
+from modules.transformations.pitch_shift import BatchedPitchShift
+from utils.audio import read_wav_window, pcm_to_float
+
+
+def sox_pitch_shift(audio, sr, cents):
+    chain = augment.EffectChain().pitch(cents).rate(sr)
+    y = chain.apply(
+        torch.from_numpy(audio).reshape(1, -1),
+        src_info={"rate": sr},
+        target_info={"channels": 1, "length": audio.shape[0], "rate": sr},
+    )
+    return y.reshape(-1).numpy()
+
+
+def synthetic_clips(num_clips, sr, audio_length, seed=0):
+    """
+    Harmonic tones (random f0, decaying partials) with some noise, when no audio is given
+    """
+    rng = np.random.RandomState(seed)
+    t = np.arange(audio_length) / sr
+    clips = []
+    for _ in range(num_clips):
+        f0 = rng.uniform(80, 800)
+        audio = sum(np.sin(2 * np.pi * f0 * k * t + rng.uniform(0, 2 * np.pi)) / k for k in range(1, 8) if f0 * k < sr / 2)
+        audio = audio / np.abs(audio).max() * 0.5 + rng.normal(0, 0.01, audio_length)
+        clips.append(audio.astype(np.float32))
+    return clips
+
+
+def load_clips(root, num_clips, audio_length):
+    clips = []
+    for fp in find_wavs(root)[:num_clips]:
+        audio, _ = read_wav_window(fp, 0, audio_length)
+        if audio.shape[0] == audio_length:
+            clips.append(pcm_to_float(audio).astype(np.float32))
+    return clips
+
+
+def log_spectrum(audio, n_fft=2048, hop_length=512):
+    spec = torch.stft(
+        torch.from_numpy(audio),
+        n_fft=n_fft,
+        hop_length=hop_length,
+        window=torch.hann_window(n_fft),
+        return_complex=True,
+    ).abs()
+    return torch.log(spec + 1e-5).numpy()
+
+
+def spectral_similarity(x, y):
+    """
+    Correlation of the log-magnitude spectrograms, and of the time-averaged log spectra
+    """
+    sx, sy = log_spectrum(x), log_spectrum(y)
+    frames = min(sx.shape[1], sy.shape[1])
+    sx, sy = sx[:, :frames], sy[:, :frames]
+    return np.corrcoef(sx.ravel(), sy.ravel())[0, 1], np.corrcoef(sx.mean(axis=1), sy.mean(axis=1))[0, 1]
+
+
+def timeit(name, n, fn):
+    t0 = time.time()
+    fn()
+    dt = time.time() - t0
+    print(f"[{name}]\t{n} samples in {dt:.2f}s\t{n / dt:.1f} samples/s")
+
+
+if __name__ == "__main__":
+    # throughput of the sox (reference) and torch pitch shifts, and the spectral similarity of
+    # their outputs for every grid point
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", type=str, default=None, help="directory of processed clips, synthetic tones if not given")
+    parser.add_argument("--sample_rate", type=int, default=22050)
+    parser.add_argument("--audio_length", type=int, default=59049)
+    parser.add_argument("--num_clips", type=int, default=64)
+    parser.add_argument("--grid", type=int, default=50)
+    parser.add_argument("--threshold", type=float, default=0.9, help="minimum mean spectrum correlation")
+    args = parser.parse_args()
+
+    if args.root:
+        clips = load_clips(args.root, args.num_clips, args.audio_length)
+    else:
+        clips = synthetic_clips(args.num_clips, args.sample_rate, args.audio_length)
+    batch = torch.from_numpy(np.stack(clips)).reshape(len(clips), 1, -1)
+    cents = torch.randint(-700, 701, (len(clips),))
+
+    shift = BatchedPitchShift(args.sample_rate, grid=args.grid)
+    with torch.no_grad():
+        timeit("sox", len(clips), lambda: [sox_pitch_shift(c, args.sample_rate, int(n)) for c, n in zip(clips, cents)])
+        timeit("torch cpu, per sample", len(clips), lambda: [shift(batch[i : i + 1], cents[i : i + 1]) for i in range(len(clips))])
+        timeit("torch cpu, batched", len(clips), lambda: shift(batch, cents))
+        if torch.cuda.is_available():
+            shift_cuda = BatchedPitchShift(args.sample_rate, grid=args.grid).cuda()
+            batch_cuda = batch.cuda()
+            shift_cuda(batch_cuda, cents)  # warm-up
+
+            def run():
+                shift_cuda(batch_cuda, cents)
+                torch.cuda.synchronize()
+
+            timeit("torch cuda, batched", len(clips), run)
+
+    print("cents\tspectrogram corr.\tspectrum corr.")
+    failed = []
+    with torch.no_grad():
+        for point in shift.points:
+            if point == 0:
+                continue
+            sox = [sox_pitch_shift(c, args.sample_rate, point) for c in clips]
+            ours = shift(batch, torch.full((len(clips),), point)).reshape(len(clips), -1).numpy()
+            similarity = np.array([spectral_similarity(x, y) for x, y in zip(sox, ours)])
+            spectrogram_corr, spectrum_corr = similarity.mean(axis=0)
+            print(f"{point}\t{spectrogram_corr:.3f}\t{spectrum_corr:.3f}")
+            if spectrum_corr < args.threshold:
+                failed.append(point)
+
+    if failed:
+        raise SystemExit(f"Spectra of the torch pitch shift differ from sox at {failed} cents")
+    print(f"All grid points within the threshold ({args.threshold})")
@@ -0,0 +1,95 @@
+import os
+import torch
+import numpy as np
+
+from data import get_dataset
+from data.audio.cache import AudioCache
+from model import load_encoder
+from utils import parse_args
+from utils.audio import read_wav_window, pcm_to_float, encode_audio, storage_dtypes
+from utils.eval import eval_all
+
+
+def snr(x, y):
+    noise = np.sum((x - y) ** 2)
+    return 10 * np.log10(np.sum(x ** 2) / max(noise, 1e-20))
+
+
+def signal_fidelity(fps, storage_format):
+    """
+    SNR (dB) of the round-trip through |storage_format|, w.r.t. the processed (int16) clips
+    """
+    snrs = []
+    num_bytes = 0
+    for fp in fps:
+        audio, _ = read_wav_window(fp)
+        encoded = encode_audio(audio, storage_format)
+        num_bytes += encoded.nbytes
+        snrs.append(snr(pcm_to_float(audio), pcm_to_float(encoded)))
+    return np.array(snrs), num_bytes
+
+
+if __name__ == "__main__":
+    # measures the impact of the RAM cache / packed store sample format (`storage_format`) on
+    # the signal, and on the downstream tag/clip ROC-AUC of a fine-tuned model (see eval_finetuned.py)
+    args = parse_args()
+    args.world_size = 1
+    args.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    args.batch_size = args.logistic_batch_size
+    args.load_ram = False
+    args.packed = False
+    args.cache_mb = 0
+
+    (
+        train_loader,
+        train_dataset,
+        val_loader,
+        val_dataset,
+        test_loader,
+        test_dataset,
+    ) = get_dataset(args, pretrain=False)
+
+    encoder = load_encoder(args, reload=True)
+    encoder.eval()
+    encoder = encoder.to(args.device)
+
+    model = None
+    if not args.supervised:
+        model = torch.nn.Sequential(torch.nn.Linear(args.n_features, args.n_classes))
+        model.load_state_dict(
+            torch.load(
+                os.path.join(
+                    args.finetune_model_path,
+                    f"finetuner_checkpoint_{args.finetune_epoch_num}.pt",
+                )
+            )
+        )
+        model = model.to(args.device)
+
+    args.current_epoch = args.epoch_num
+    fps = list(dict.fromkeys(test_dataset.index.row_paths().tolist()))
+
+    results = {}
+    for storage_format in storage_dtypes:
+        snrs, num_bytes = signal_fidelity(fps, storage_format)
+
+        # every clip is read once into an unbounded cache of |storage_format| samples, and
+        # expanded to float32 per window, like the training caches
+        test_dataset.cache = AudioCache(float("inf"))
+        test_dataset.storage_format = storage_format
+        metrics = eval_all(args, test_loader, encoder, model, None)
+
+        results[storage_format] = (
+            num_bytes / 2 ** 20,
+            np.median(snrs),
+            snrs.min(),
+            metrics["hparams/test_tag_auc_mean"],
+            metrics["hparams/test_clip_auc_mean"],
+        )
+
+    print("format\tMB\tSNR median (dB)\tSNR min (dB)\ttag AUC\tclip AUC\tdelta tag AUC")
+    base_auc = results["float32"][3]
+    for storage_format, (mb, snr_median, snr_min, tag_auc, clip_auc) in results.items():
+        print(
+            f"{storage_format}\t{mb:.1f}\t{snr_median:.1f}\t{snr_min:.1f}\t{tag_auc:.4f}\t{clip_auc:.4f}\t{tag_auc - base_auc:+.4f}"
+        )
@@ -0,0 +1,156 @@
+import time
+import random
+import argparse
+import tracemalloc
+import numpy as np
+import scipy.signal
+import torch
+
+from modules.transformations import AudioTransforms
+from modules.transformations.audio import InvertSignal, Noise, Gain, Delay, RandomPitchShift, Reverb
+from modules.transformations.filters import first_order_biquads
+
+try:
+    import essentia.standard
+except Exception:
+    essentia = None
+
+
+class BaselineCrop:
+    # the crop before the series: a view of the decoded float32 clip
+    def __init__(self, n_samples):
+        self.n_samples = n_samples
+
+    def __call__(self, audio):
+        start_idx = random.randint(0, audio.shape[0] - self.n_samples)
+        return audio[start_idx : start_idx + self.n_samples]
+
+
+class BaselineBandPass:
+    """
+    HighLowBandPass before the series: a new essentia HighPass / LowPass per call. Without
+    essentia, the first-order filter is designed per call and run by scipy instead (same
+    filter, float64 output converted back to float32)
+    """
+
+    def __init__(self, sr, p):
+        self.sr = sr
+        self.p = p
+
+    def __call__(self, audio):
+        highlowband = random.randint(0, 1)
+        if random.random() < self.p:
+            highpass = highlowband == 0
+            cutoff = random.randint(200, 1200) if highpass else random.randint(2200, 4000)
+            if essentia is not None:
+                filt = essentia.standard.HighPass if highpass else essentia.standard.LowPass
+                return filt(cutoffFrequency=cutoff, sampleRate=self.sr)(audio)
+            sos = first_order_biquads([cutoff], self.sr, highpass)[0]
+            audio = scipy.signal.lfilter(sos[:3], sos[3:], audio).astype(np.float32)
+        return audio
+
+
+def baseline_chain(config, transforms):
+    # the functional chain before the series (the sox effects are shared with the current chain)
+    sr = config.sample_rate
+    chain = [
+        BaselineCrop(config.audio_length),
+        InvertSignal(p=config.transforms_polarity, sr=sr),
+        Noise(p=config.transforms_noise, sr=sr),
+        Gain(p=config.transforms_gain, sr=sr),
+        BaselineBandPass(sr, config.transforms_filters),
+        Delay(p=config.transforms_delay, sr=sr),
+    ]
+    return chain + [t for t in transforms.train_transform if isinstance(t, (RandomPitchShift, Reverb))]
+
+
+def baseline(chain):
+    # AudioTransforms.__call__ before the series, on the decoded float32 clip
+    def fn(x):
+        views = []
+        for audio in x:
+            for t in chain:
+                audio = t(audio)
+            views.append(torch.from_numpy(audio.reshape(1, -1)))
+        return tuple(views)
+
+    return fn
+
+
+def in_place(transforms):
+    return lambda x: transforms(x, None, None)
+
+
+def run(name, fn, items):
+    fn(items[0])  # warm-up (buffers, filter bank, effect chains)
+
+    # peak of the memory allocated (and freed) while transforming one item
+    peaks = []
+    tracemalloc.start()
+    for x in items:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        fn(x)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    times = []
+    for x in items:
+        t0 = time.perf_counter()
+        fn(x)
+        times.append(time.perf_counter() - t0)
+
+    buffer_bytes = items[0][0].shape[0] * 4
+    print(
+        f"[{name}]\tpeak {np.mean(peaks) / 1024:.0f} KB / item ({np.mean(peaks) / buffer_bytes:.1f} float32 crops)"
+        f"\t{np.median(times) * 1e3:.3f} ms / item (median), {np.percentile(times, 95) * 1e3:.3f} ms (p95)"
+    )
+
+
+if __name__ == "__main__":
+    # transient allocations and latency of the per-sample augmentation chain before the series
+    # (functional transforms, essentia filters) and written into per-worker buffers (in place)
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sample_rate", type=int, default=22050)
+    parser.add_argument("--audio_length", type=int, default=59049)
+    parser.add_argument("--batch_size", type=int, default=48)
+    parser.add_argument("--num_items", type=int, default=500)
+    parser.add_argument("--p", type=float, default=1.0, help="probability of every numpy transform")
+    parser.add_argument("--sox", action="store_true", help="also run the sox pitch shift and reverb")
+    args = parser.parse_args()
+
+    config = argparse.Namespace(
+        sample_rate=args.sample_rate,
+        audio_length=args.audio_length,
+        batch_size=args.batch_size,
+        ablation=False,
+        batch_transforms=False,
+        data_input_dir="",
+        transforms_polarity=args.p,
+        transforms_noise=args.p,
+        transforms_gain=args.p,
+        transforms_filters=args.p,
+        transforms_delay=args.p,
+        transforms_pitch=args.p if args.sox else 0.0,
+        transforms_reverb=args.p if args.sox else 0.0,
+        pitch_backend="sox",
+        pitch_grid=50,
+        reverb_backend="sox",
+        reverb_grid=10,
+        reverb_ir_seconds=1.0,
+    )
+    transforms = AudioTransforms(config)
+
+    # int16 windows, as read from the packed store / shards, and the float32 clips the baseline
+    # decoded (the same windows, so both chains crop the whole item)
+    rng = np.random.RandomState(0)
+    items = [
+        tuple((rng.normal(0, 0.1, args.audio_length) * 32767).astype(np.int16) for _ in range(2))
+        for _ in range(args.num_items)
+    ]
+    float_items = [tuple(x.astype(np.float32) / 32768 for x in item) for item in items]
+
+    if essentia is None:
+        print("essentia is not installed, the baseline filters are designed per call and run by scipy")
+    run("baseline", baseline(baseline_chain(config, transforms)), float_items)
+    run("in place", in_place(transforms), items)
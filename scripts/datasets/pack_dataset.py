@@ -0,0 +1,36 @@
+import os
+import argparse
+
+from data.audio import datasets
+from data.audio.packed import write_packed_store, packed_store_paths
+
+
+def pack_dataset(data_input_dir, dataset, storage_format="int16", sample_rate=None):
+    Dataset = datasets[dataset]
+    proc_dir = os.path.join(data_input_dir, Dataset.base_dir, "processed")
+
+    # datasets with split sub-directories (e.g. MagnaTagATune) get one store per split
+    splits = getattr(Dataset, "splits", None)
+    if splits:
+        roots = [os.path.join(proc_dir, split) for split in splits]
+    else:
+        roots = [proc_dir]
+
+    for root in roots:
+        print(f"Packing {root} into {packed_store_paths(root, sample_rate)[0]}")
+        num_clips = write_packed_store(root, storage_format=storage_format, sample_rate=sample_rate)
+        print(f"Packed {num_clips} clips")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_input_dir", type=str, required=True)
+    parser.add_argument("--dataset", type=str, required=True)
+    parser.add_argument("--storage_format", type=str, default="int16", choices=["float32", "int16", "ulaw"])
+    parser.add_argument(
+        "--sample_rate", type=int, default=None,
+        help="only pack the clips at this sample rate, for processed directories with several rates",
+    )
+    args = parser.parse_args()
+
+    pack_dataset(args.data_input_dir, args.dataset, args.storage_format, args.sample_rate)
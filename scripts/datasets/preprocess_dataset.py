@@ -9,68 +9,67 @@ import torchaudio
 from pathlib import Path
 from tqdm import tqdm
 from shutil import which
-from .resample import resample
+from utils.preprocess import process_jobs
+from utils.yaml_config_hook import yaml_config_hook
 
 
 def chunk(lst, n):
     return list(zip(*[iter(lst)] * n))
 
 
-def process(split, data_input_dir, sample_rate, track_id, clip_id, segment, fp):
-    src_path = os.path.join(audio_dir, fp)
-    target_dir = os.path.join(data_input_dir, base_dir, "processed", split)
+def process_dataset(split, dataset, data_input_dir, sample_rates, num_workers=None):
+    # get all tracks and convert them to |audio_length| segments, at all |sample_rates|
+    target_dir = os.path.join(data_input_dir, dataset.base_dir, "processed", split)
 
-    if not os.path.exists(target_dir):
-        os.makedirs(target_dir)
-
-    target_fn = f"{track_id}-{clip_id}-{sample_rate}.wav"
-    target_path = os.path.join(target_dir, target_fn)
-
-    # resample to target sample rate
-    if not os.path.exists(target_path):
-        resample(src_path, target_path, sample_rate)
-
-
-def process_dataset(split, dataset, data_input_dir, sample_rate):
-    # get all tracks and convert them to |audio_length| segments
-
-    print("Processing all tracks (this may take a while)")
-    p = multiprocessing.Pool()
+    jobs = []
     for track_id, clip_id, segment, fp, _ in dataset.index:
         if segment == 0:
-            unproc_fp = dataset.id2audio_path[clip_id]
-            process(split, data_input_dir, sample_rate, track_id, clip_id, segment, unproc_fp)
-            # p.apply_async(
-            #     process,
-            #     args=[split, data_input_dir, sample_rate, track_id, clip_id, segment, unproc_fp],
-            # )
+            src_path = os.path.join(dataset.audio_dir, dataset.id2audio_path[str(clip_id)])
+            targets = [
+                (os.path.join(target_dir, f"{track_id}-{clip_id}-{sample_rate}.wav"), sample_rate)
+                for sample_rate in sample_rates
+            ]
+            jobs.append((src_path, targets))
 
-    p.close()
-    p.join()
+    print(f"Processing all {split} tracks with {num_workers or os.cpu_count()} processes")
+    process_jobs(jobs, os.path.join(target_dir, "manifest.txt"), num_workers)
 
 
 if __name__ == "__main__":
 
     if which("ffmpeg") is None:
-        raise Exception("ffmpeg is not installed on this system")
+        print("ffmpeg is not installed on this system, only formats that decode in-process are supported")
 
     parser = argparse.ArgumentParser()
     parser.add_argument("--data_input_dir", type=str, required=True)
     parser.add_argument("--dataset", type=str, required=True)
     parser.add_argument("--audio_length", type=int, required=True)
     parser.add_argument("--sample_rate", type=int, required=True)
+    parser.add_argument(
+        "--sample_rates", type=str, default=None,
+        help="comma-separated sample rates (e.g. 8000,16000,22050) written from one decode pass, defaults to --sample_rate",
+    )
     parser.add_argument("--file_format", type=str, default="wav")
+    parser.add_argument("--num_workers", type=int, default=os.cpu_count())
     args = parser.parse_args()
 
+    # every other option of the datasets comes from the config, like in main.py
+    for k, v in yaml_config_hook("./config/config.yaml").items():
+        if not hasattr(args, k):
+            setattr(args, k, v)
+
     args.domain = "audio"
     args.supervised = True
-    args.batch_size = 64
     args.workers = 0  # number of threads in CPU
     args.load_ram = False # do not load data into memory for processing
-    args.nodes = 1
+    args.cache_mb = 0
+    args.packed = False # read from the individual files that are being written
+    args.manifest = False # files are probed once they are written
+    args.sharded = False
+    args.audio_format = "wav"
+    args.scratch_dir = "" # read the clips in place
     args.perc_train_data = 1.0
     args.world_size = 1
-    args.onepos = False
 
     from data import get_dataset
 
@@ -84,9 +83,10 @@ if __name__ == "__main__":
         test_dataset,
     ) = get_dataset(args, pretrain=False, download=False)
 
-    base_dir = train_dataset.base_dir
-    audio_dir = train_dataset.audio_dir
+    sample_rates = [args.sample_rate]
+    if args.sample_rates:
+        sample_rates = [int(sr) for sr in args.sample_rates.split(",")]
 
-    process_dataset("train", train_dataset, args.data_input_dir, args.sample_rate)
-    process_dataset("valid", val_dataset, args.data_input_dir, args.sample_rate)
-    process_dataset("test", test_dataset, args.data_input_dir, args.sample_rate)
+    process_dataset("train", train_dataset, args.data_input_dir, sample_rates, args.num_workers)
+    process_dataset("valid", val_dataset, args.data_input_dir, sample_rates, args.num_workers)
+    process_dataset("test", test_dataset, args.data_input_dir, sample_rates, args.num_workers)
@@ -0,0 +1,20 @@
+import os
+import argparse
+
+from modules.transformations.reverb import ir_bank_path, load_ir_bank, save_ir_bank
+
+
+if __name__ == "__main__":
+    # renders the impulse responses of `reverb_backend: ir` once, before training
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_input_dir", type=str, required=True)
+    parser.add_argument("--sample_rate", type=int, required=True)
+    parser.add_argument("--reverb_grid", type=int, default=10)
+    parser.add_argument("--reverb_ir_seconds", type=float, default=1.0)
+    args = parser.parse_args()
+
+    path = ir_bank_path(args.data_input_dir, args.sample_rate, args.reverb_grid, args.reverb_ir_seconds)
+    if not os.path.exists(path):
+        save_ir_bank(path, args.sample_rate, args.reverb_grid, args.reverb_ir_seconds)
+    irs, params = load_ir_bank(path, args.sample_rate, args.reverb_grid, args.reverb_ir_seconds)
+    print(f"{len(irs)} impulse responses of {irs.shape[1]} samples in {path}")
@@ -5,7 +5,19 @@ from tqdm import tqdm
 import subprocess
 import re
 
-def resample(source, target, sample_rate):
+from utils.resample import (
+    resample_filter,
+    resample_poly,
+    decode,
+    ffmpeg_decode,
+    load_audio_rates,
+    load_audio,
+    resample,
+    resample_rates,
+)
+
+
+def ffmpeg_resample(source, target, sample_rate):
     process = subprocess.Popen(
         [
             "ffmpeg",
@@ -25,6 +37,8 @@ def resample(source, target, sample_rate):
     )
 
     stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        raise Exception(f"ffmpeg could not convert {source}")
     matches = re.search(
         r"Duration:\s{1}(?P<hours>\d+?):(?P<minutes>\d+?):(?P<seconds>\d+\.\d+?),",
         str(stdout),
@@ -0,0 +1,171 @@
+import os
+import multiprocessing
+import numpy as np
+from tqdm import tqdm
+
+from .utils import write_statistics
+
+# edges (dBFS) of the histogram of frame RMS levels
+RMS_BINS = np.linspace(-100, 0, 101)
+
+
+class RunningStatistics:
+    """
+    Per-channel sample count, mean and sum of squared deviations (M2), merged with Chan's
+    parallel update so the result is the exact mean/std over all samples, and a histogram
+    of the RMS level of |frame_length| frames.
+    """
+
+    def __init__(self, channels=0, frame_length=2048):
+        self.frame_length = frame_length
+        self.num_tracks = 0
+        self.count = np.zeros(channels, dtype=np.int64)
+        self.mean = np.zeros(channels, dtype=np.float64)
+        self.m2 = np.zeros(channels, dtype=np.float64)
+        self.rms_hist = np.zeros((channels, len(RMS_BINS) - 1), dtype=np.int64)
+
+    @property
+    def channels(self):
+        return len(self.count)
+
+    def resize(self, channels):
+        if channels <= self.channels:
+            return
+        pad = channels - self.channels
+        self.count = np.pad(self.count, (0, pad))
+        self.mean = np.pad(self.mean, (0, pad))
+        self.m2 = np.pad(self.m2, (0, pad))
+        self.rms_hist = np.pad(self.rms_hist, ((0, pad), (0, 0)))
+
+    def merge(self, other):
+        self.resize(other.channels)
+        other.resize(self.channels)
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        with np.errstate(invalid="ignore", divide="ignore"):
+            weight = np.where(count > 0, other.count / count, 0)
+        self.mean = self.mean + delta * weight
+        self.m2 = self.m2 + other.m2 + delta ** 2 * self.count * weight
+        self.count = count
+        self.rms_hist += other.rms_hist
+        self.num_tracks += other.num_tracks
+        return self
+
+    def update(self, audio):
+        """
+        Adds one track of [channels, samples] (or [samples]) audio
+        """
+        audio = np.asarray(audio, dtype=np.float64)
+        if audio.ndim == 1:
+            audio = audio.reshape(1, -1)
+
+        track = RunningStatistics(audio.shape[0], self.frame_length)
+        track.num_tracks = 1
+        track.count[:] = audio.shape[1]
+        track.mean = audio.mean(axis=1)
+        track.m2 = ((audio - track.mean[:, None]) ** 2).sum(axis=1)
+
+        num_frames = audio.shape[1] // self.frame_length
+        if num_frames > 0:
+            frames = audio[:, : num_frames * self.frame_length].reshape(audio.shape[0], num_frames, -1)
+            rms = np.sqrt((frames ** 2).mean(axis=2))
+            db = np.clip(20 * np.log10(np.maximum(rms, 1e-10)), RMS_BINS[0], RMS_BINS[-1])
+            for c in range(audio.shape[0]):
+                track.rms_hist[c] = np.histogram(db[c], bins=RMS_BINS)[0]
+        return self.merge(track)
+
+    def channel_std(self):
+        return np.sqrt(self.m2 / np.maximum(self.count, 1))
+
+    def global_mean_std(self):
+        total = RunningStatistics()
+        for c in range(self.channels):
+            channel = RunningStatistics(1)
+            channel.count[0] = self.count[c]
+            channel.mean[0] = self.mean[c]
+            channel.m2[0] = self.m2[c]
+            total.merge(channel)
+        return float(total.mean[0]), float(total.channel_std()[0])
+
+    def save(self, fp, done=()):
+        with open(fp + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                num_tracks=self.num_tracks,
+                frame_length=self.frame_length,
+                count=self.count,
+                mean=self.mean,
+                m2=self.m2,
+                rms_hist=self.rms_hist,
+                rms_bins=RMS_BINS,
+                done=np.array(list(done), dtype=str),
+            )
+        os.replace(fp + ".tmp", fp)
+
+    @classmethod
+    def load(cls, fp):
+        with np.load(fp) as f:
+            stats = cls(0, int(f["frame_length"]))
+            stats.num_tracks = int(f["num_tracks"])
+            stats.count = f["count"]
+            stats.mean = f["mean"]
+            stats.m2 = f["m2"]
+            stats.rms_hist = f["rms_hist"]
+            done = f["done"].tolist()
+        return stats, done
+
+
+def track_statistics(job):
+    fp, loader, frame_length = job
+    try:
+        audio, _ = loader(fp)
+        audio = np.asarray(audio, dtype=np.float64)
+        if np.isnan(audio).any():
+            raise Exception("Audio contains NaN values")
+        return fp, RunningStatistics(0, frame_length).update(audio), None
+    except Exception as e:
+        return fp, None, str(e)
+
+
+def compute_statistics(fps, loader, checkpoint_path=None, num_workers=None, frame_length=2048, checkpoint_every=500):
+    """
+    Streams all |fps| through a process pool and merges their statistics. Partial results are
+    saved in |checkpoint_path| every |checkpoint_every| tracks, so an interrupted run resumes.
+    """
+    fps = list(dict.fromkeys(fps))
+    stats = RunningStatistics(0, frame_length)
+    done = []
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        stats, done = RunningStatistics.load(checkpoint_path)
+        print(f"Resuming statistics from {checkpoint_path} ({len(done)}/{len(fps)} tracks)")
+
+    skip = set(done)
+    jobs = [(fp, loader, frame_length) for fp in fps if fp not in skip]
+    with multiprocessing.Pool(processes=num_workers or None) as p:
+        for i, (fp, track, error) in enumerate(
+            tqdm(p.imap_unordered(track_statistics, jobs, chunksize=4), total=len(jobs))
+        ):
+            if error is not None:
+                print(f"Skipped {fp} in statistics: {error}")
+            else:
+                stats.merge(track)
+            done.append(fp)
+
+            if checkpoint_path is not None and (i + 1) % checkpoint_every == 0:
+                stats.save(checkpoint_path, done)
+    return stats
+
+
+def get_dataset_stats(loader, fps, stats_path, num_workers=None):
+    """
+    Computes the exact global mean/std of the audio of |fps| and writes them (and the RMS
+    histograms) to |stats_path|
+    """
+    checkpoint_path = os.path.splitext(stats_path)[0] + ".partial.npz"
+    stats = compute_statistics(fps, loader, checkpoint_path, num_workers)
+    mean, std = stats.global_mean_std()
+    write_statistics(mean, std, stats.num_tracks, stats_path, stats)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return mean, std
@@ -1,4 +1,18 @@
-def write_statistics(mean, std, num_songs, stats_fp):
+import os
+
+
+def write_statistics(mean, std, num_songs, stats_fp, stats=None):
     with open(stats_fp, "w") as f:
         f.write("mean;std;num_songs\n")
-        f.write(";".join([str(mean), str(std), str(num_songs)]))
\ No newline at end of file
+        f.write(";".join([str(mean), str(std), str(num_songs)]))
+
+    # per-channel mean/std and RMS histograms (see scripts/datasets/statistics.py)
+    if stats is not None:
+        stats.save(os.path.splitext(stats_fp)[0] + ".npz")
+
+
+def read_statistics(stats_fp):
+    with open(stats_fp, "r") as f:
+        l = f.readlines()
+        stats = l[1].split(";")
+        return float(stats[0]), float(stats[1])
@@ -0,0 +1,52 @@
+import os
+import argparse
+
+from data.audio.shards import write_shards, shard_dir
+from utils.yaml_config_hook import yaml_config_hook
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data_input_dir", type=str, required=True)
+    parser.add_argument("--dataset", type=str, required=True)
+    parser.add_argument("--audio_length", type=int, required=True)
+    parser.add_argument("--sample_rate", type=int, required=True)
+    parser.add_argument("--shard_size_mb", type=int, default=256)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    # every other option of the datasets comes from the config, like in main.py
+    for k, v in yaml_config_hook("./config/config.yaml").items():
+        if not hasattr(args, k):
+            setattr(args, k, v)
+
+    # the shards are written from the processed clips, through the map-style datasets
+    args.domain = "audio"
+    args.supervised = True
+    args.workers = 0
+    args.load_ram = False
+    args.cache_mb = 0
+    args.packed = False
+    args.manifest = True # unreadable clips are quarantined instead of written
+    args.sharded = False
+    args.audio_format = "wav"
+    args.scratch_dir = "" # read the clips in place
+    args.perc_train_data = 1.0
+    args.world_size = 1
+
+    from data import get_dataset
+
+    (
+        train_loader,
+        train_dataset,
+        val_loader,
+        val_dataset,
+        test_loader,
+        test_dataset,
+    ) = get_dataset(args, pretrain=False, download=False)
+
+    for split, dataset in [("train", train_dataset), ("valid", val_dataset), ("test", test_dataset)]:
+        out_dir = shard_dir(args.data_input_dir, dataset.base_dir, split)
+        print(f"Writing {split} shards to {out_dir}")
+        num_clips = write_shards(dataset, out_dir, args.shard_size_mb, args.seed)
+        print(f"Wrote {num_clips} clips")
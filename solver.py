@@ -5,11 +5,25 @@ from utils.eval import get_metrics
 import time
 
 class Solver:
-    def __init__(self, model, optimizer, criterion, writer):
+    def __init__(self, model, optimizer, criterion, writer, batch_transforms=None):
         self.model = model
         self.optimizer = optimizer
         self.criterion = criterion
         self.writer = writer
+        self.batch_transforms = batch_transforms
+
+    def augment(self, args, x_i, x_j):
+        # the batched part of the augmentations (`batch_transforms`), on the training device
+        if self.batch_transforms is None:
+            return x_i, x_j
+
+        x_i = self.batch_transforms(x_i)
+        # assymetric ablation
+        if args.ablation:
+            x_j = self.batch_transforms.crop(x_j)
+        else:
+            x_j = self.batch_transforms(x_j)
+        return x_i, x_j
 
     def train(self, args, loader):
         metrics = defaultdict(float)
@@ -20,6 +34,8 @@ class Solver:
                 x_i = x_i.to(args.device)
                 x_j = x_j.to(args.device)
 
+                x_i, x_j = self.augment(args, x_i, x_j)
+
                 # positive pair, with encoding
                 h_i, h_j, z_i, z_j = self.model(x_i, x_j)
                 loss = self.criterion(z_i, z_j)
@@ -73,6 +89,7 @@ class Solver:
                 if not args.supervised:
                     x_i = x_i.to(args.device)
                     x_j = x_j.to(args.device)
+                    x_i, x_j = self.augment(args, x_i, x_j)
 
                     # positive pair, with encoding
                     # loss = self.model(x_i, x_j)
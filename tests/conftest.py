@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import wave
+import numpy as np
+import pytest
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_wav(fp, audio, sr):
+    with wave.open(fp, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(sr)
+        f.writeframes(audio.astype("<i2").tobytes())
+
+
+def make_mtt(root, sample_rate=8000, clips_per_split=6, clips_per_track=2, num_tags=4, seed=0):
+    """
+    A small MagnaTagATune tree (processed 30 s clips and annotations) under |root|
+    """
+    rng = np.random.RandomState(seed)
+    annotations = os.path.join(root, "magnatagatune", "processed_annotations")
+    os.makedirs(annotations)
+    with open(os.path.join(annotations, "output_labels_mtt.txt"), "w") as f:
+        f.write("tags\n")
+        f.write(f"labels: {[f'tag{i}' for i in range(num_tags)]}\n")
+
+    index_lines = []
+    clip_id = 0
+    for split, gt_name in [("train", "train_gt_mtt.tsv"), ("valid", "val_gt_mtt.tsv"), ("test", "test_gt_mtt.tsv")]:
+        split_dir = os.path.join(root, "magnatagatune", "processed", split)
+        os.makedirs(split_dir)
+        gt_lines = []
+        # the indexer numbers tracks in order of appearance, per split
+        track_idx = 0
+        for i in range(clips_per_split):
+            if i % clips_per_track == 0:
+                track_idx += 1
+            name = f"{split}_artist_{track_idx}-album-{i * 30}-{(i + 1) * 30}.mp3"
+            index_lines.append(f"{clip_id}\t{track_idx % 10}/{name}")
+            gt_lines.append(f"{clip_id}\t{json.dumps(rng.randint(0, 2, num_tags).tolist())}")
+            audio = rng.normal(0, 3000, 30 * sample_rate).clip(-32768, 32767)
+            write_wav(os.path.join(split_dir, f"{track_idx}-{clip_id}-{sample_rate}.wav"), audio, sample_rate)
+            clip_id += 1
+        with open(os.path.join(annotations, gt_name), "w") as f:
+            f.write("\n".join(gt_lines) + "\n")
+
+    with open(os.path.join(annotations, "index_mtt.tsv"), "w") as f:
+        f.write("\n".join(index_lines) + "\n")
+    return root
+
+
+def config(**kwargs):
+    with open(os.path.join(ROOT, "config", "config.yaml")) as f:
+        args = argparse.Namespace(**yaml.safe_load(f))
+    args.world_size = 1
+    for k, v in kwargs.items():
+        setattr(args, k, v)
+    return args
+
+
+def write_ir_bank(root, args):
+    # a small random bank instead of the rendered sox grid (see load_ir_bank)
+    from modules.transformations.reverb import ir_bank_path
+
+    path = ir_bank_path(str(root), args.sample_rate, args.reverb_grid, args.reverb_ir_seconds)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    irs = np.random.RandomState(0).normal(0, 0.1, (8, 256)).astype(np.float32)
+    irs[:, 0] = 1
+    np.savez(path, irs=irs, params=np.zeros((8, 3), dtype=np.int64), sample_rate=args.sample_rate)
+
+
+def pretrain_config(root, **kwargs):
+    """
+    Pre-training config of the make_mtt tree, with the augmentations that run without sox
+    """
+    args = config(
+        data_input_dir=root,
+        sample_rate=8000,
+        audio_length=8000,
+        workers=0,
+        batch_size=2,
+        pitch_backend="torch",
+        reverb_backend="ir",
+    )
+    for k, v in kwargs.items():
+        setattr(args, k, v)
+    write_ir_bank(root, args)
+    return args
+
+
+@pytest.fixture
+def mtt(tmp_path):
+    return make_mtt(str(tmp_path / "datasets"))
@@ -0,0 +1,83 @@
+import os
+import numpy as np
+import pytest
+
+from data.audio.annotations import cached_annotations
+from data.audio.magnatagatune import MTTDataset
+from tests.conftest import config
+
+
+def write(fp, text, mtime_offset=0):
+    with open(fp, "w") as f:
+        f.write(text)
+    if mtime_offset:
+        st = os.stat(fp)
+        os.utime(fp, ns=(st.st_atime_ns, st.st_mtime_ns + mtime_offset))
+
+
+def counting_build(sources, builds):
+    def build():
+        builds.append(1)
+        return {"text": np.array([open(fp).read() for fp in sources])}
+
+    return build
+
+
+@pytest.mark.parametrize("edited", [0, 1])
+def test_editing_a_source_rebuilds_the_cache(tmp_path, edited):
+    sources = [str(tmp_path / "gt.tsv"), str(tmp_path / "index.tsv")]
+    write(sources[0], "0\t[0, 1]\n")
+    write(sources[1], "0\ta.mp3\n")
+    cache_path = str(tmp_path / "cache" / "gt.npz")
+    builds = []
+    build = counting_build(sources, builds)
+
+    cached_annotations(cache_path, sources, build)
+    assert cached_annotations(cache_path, sources, build)["text"].tolist() == ["0\t[0, 1]\n", "0\ta.mp3\n"]
+    assert len(builds) == 1
+
+    # an edit of the same size, with a new mtime
+    text = ["0\t[1, 1]\n", "0\tb.mp3\n"][edited]
+    write(sources[edited], text, mtime_offset=10 ** 9)
+    arrays = cached_annotations(cache_path, sources, build)
+    assert len(builds) == 2
+    assert arrays["text"][edited] == text
+
+    # a longer edit
+    write(sources[edited], text + "1\t[0, 0]\n")
+    cached_annotations(cache_path, sources, build)
+    assert len(builds) == 3
+
+
+def test_touching_a_source_keeps_the_cache(tmp_path):
+    sources = [str(tmp_path / "gt.tsv")]
+    write(sources[0], "0\t[0, 1]\n")
+    cache_path = str(tmp_path / "gt.npz")
+    builds = []
+    cached_annotations(cache_path, sources, counting_build(sources, builds))
+
+    # the same content with a new mtime is checked by its hash, and the new mtime is stored
+    write(sources[0], "0\t[0, 1]\n", mtime_offset=10 ** 9)
+    cached_annotations(cache_path, sources, counting_build(sources, builds))
+    with np.load(cache_path) as cache:
+        assert cache["_mtimes"][0] == os.stat(sources[0]).st_mtime_ns
+    assert len(builds) == 1
+
+
+def test_mtt_labels_follow_the_annotation_files(mtt):
+    args = config(data_input_dir=mtt, sample_rate=8000, audio_length=8000, workers=0, manifest=False)
+    annotations = os.path.join(mtt, "magnatagatune", "processed_annotations")
+    dataset = MTTDataset(args, split="train", pretrain=False)
+    clip_id = dataset.index.clip_ids[0]
+    labels = dataset.index.row_labels()[0]
+
+    gt_path = os.path.join(annotations, "train_gt_mtt.tsv")
+    with open(gt_path) as f:
+        lines = f.read().splitlines()
+    flipped = (1 - labels).astype(int).tolist()
+    lines = [f"{clip_id}\t{flipped}" if line.split("\t")[0] == str(clip_id) else line for line in lines]
+    write(gt_path, "\n".join(lines) + "\n", mtime_offset=10 ** 9)
+
+    dataset = MTTDataset(args, split="train", pretrain=False)
+    row = dataset.index.clip_ids.tolist().index(clip_id)
+    np.testing.assert_array_equal(dataset.index.row_labels()[row], flipped)
@@ -0,0 +1,72 @@
+import os
+import numpy as np
+import pytest
+
+from utils import audio as audio_module
+from utils.audio import (
+    encode_audio,
+    float_to_int16,
+    float_to_ulaw,
+    pcm_to_float,
+    pcm_to_float_into,
+    read_wav_window,
+    ulaw_to_float,
+)
+from utils.misc import LRUDict
+from tests.conftest import write_wav
+
+
+def test_int16_round_trip_is_exact():
+    pcm = np.arange(-32768, 32768, dtype=np.int16)
+    np.testing.assert_array_equal(float_to_int16(pcm_to_float(pcm)), pcm)
+    np.testing.assert_array_equal(encode_audio(pcm_to_float(pcm), "int16"), pcm)
+
+
+def test_int16_encoding_error_is_within_half_a_step():
+    x = np.random.RandomState(0).uniform(-1, 1, 100000).astype(np.float32)
+    decoded = pcm_to_float(encode_audio(x, "int16"))
+    assert np.abs(decoded - x).max() <= 0.5 / 32767.5 + 1e-6
+    np.testing.assert_array_equal(encode_audio(np.array([-1.0, 1.0], dtype=np.float32), "int16"), [-32768, 32767])
+
+
+def test_ulaw_round_trip_is_exact():
+    codes = np.arange(256, dtype=np.uint8)
+    np.testing.assert_array_equal(float_to_ulaw(ulaw_to_float(codes)), codes)
+    np.testing.assert_array_equal(encode_audio(pcm_to_float(codes), "ulaw"), codes)
+
+
+@pytest.mark.parametrize("dtype", [np.int16, np.int32, np.uint8, np.float32, np.float64])
+def test_pcm_to_float_into_matches_pcm_to_float(dtype):
+    rng = np.random.RandomState(0)
+    if np.dtype(dtype).kind == "f":
+        x = rng.uniform(-1, 1, 1000).astype(dtype)
+    else:
+        info = np.iinfo(dtype)
+        x = rng.randint(info.min, int(info.max) + 1, 1000, dtype=np.int64).astype(dtype)
+
+    out = np.full(1000, np.nan, dtype=np.float32)
+    result = pcm_to_float_into(x, out)
+    assert result is out
+    np.testing.assert_allclose(out, pcm_to_float(x), rtol=0, atol=1e-6)
+
+
+def test_wav_header_is_parsed_again_when_the_file_changes(tmp_path):
+    fp = str(tmp_path / "a.wav")
+    write_wav(fp, np.arange(100), 8000)
+    assert read_wav_window(fp)[0].shape == (100,)
+
+    write_wav(fp, np.arange(300), 16000)
+    st = os.stat(fp)
+    os.utime(fp, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    audio, sr = read_wav_window(fp)
+    assert sr == 16000
+    np.testing.assert_array_equal(audio, np.arange(300))
+
+
+def test_wav_headers_are_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(audio_module, "_wav_headers", LRUDict(2))
+    fps = [str(tmp_path / f"{i}.wav") for i in range(3)]
+    for fp in fps:
+        write_wav(fp, np.arange(10), 8000)
+        read_wav_window(fp)
+    assert len(audio_module._wav_headers) == 2 and fps[0] not in audio_module._wav_headers
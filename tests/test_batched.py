@@ -0,0 +1,102 @@
+import random
+import numpy as np
+import torch
+
+from modules.transformations import BatchedAudioTransforms
+from modules.transformations.audio import Delay, Gain, HighLowBandPass, InvertSignal
+from tests.conftest import config, write_ir_bank
+
+NUM = 2000
+SR = 22050
+LENGTH = 2048
+
+
+def batched(root, **kwargs):
+    args = config(
+        data_input_dir=str(root),
+        sample_rate=SR,
+        audio_length=LENGTH,
+        pitch_backend="torch",
+        reverb_backend="ir",
+        transforms_pitch=0.0,
+        transforms_reverb=0.0,
+        batch_transforms=True,
+    )
+    for k, v in kwargs.items():
+        setattr(args, k, v)
+    write_ir_bank(root, args)
+    torch.manual_seed(0)
+    return BatchedAudioTransforms(args)
+
+
+def per_sample(transform, x):
+    random.seed(0)
+    out = []
+    scratch = np.empty(x.shape[0], dtype=np.float32)
+    for _ in range(NUM):
+        audio = x.copy()
+        if hasattr(transform, "apply_"):
+            transform.apply_(audio, scratch)
+        else:
+            audio = transform(audio)
+        out.append(audio)
+    return np.stack(out)
+
+
+def batch_of(x):
+    return torch.from_numpy(np.tile(x, (NUM, 1, 1)))
+
+
+def test_polarity_rate(tmp_path):
+    x = np.full(LENGTH, 0.5, dtype=np.float32)
+    ours = batched(tmp_path, transforms_polarity=0.8).polarity(batch_of(x))[:, 0, 0].numpy()
+    ref = per_sample(InvertSignal(SR, p=0.8), x)[:, 0]
+    assert abs((ours < 0).mean() - (ref < 0).mean()) < 0.05
+
+
+def test_gain_distribution(tmp_path):
+    x = np.full(LENGTH, 0.5, dtype=np.float32)
+    ours = batched(tmp_path, transforms_gain=0.5).gain(batch_of(x))[:, 0, 0].numpy()
+    ref = per_sample(Gain(SR, p=0.5), x)[:, 0]
+    to_db = lambda y: np.round(20 * np.log10(y / 0.5)).astype(int)
+    ours, ref = to_db(ours), to_db(ref)
+
+    assert abs((ours < 0).mean() - (ref < 0).mean()) < 0.05
+    # the same integer gains in [-20, -1] dB, uniformly
+    assert set(ours[ours < 0]) == set(ref[ref < 0]) == set(range(-20, 0))
+    assert abs(ours[ours < 0].mean() - ref[ref < 0].mean()) < 1
+
+
+def test_delay_distribution(tmp_path):
+    x = np.zeros(LENGTH * 6, dtype=np.float32)
+    x[0] = 1
+    transforms = batched(tmp_path, transforms_delay=0.5, audio_length=x.shape[0])
+    ours = transforms.delay(batch_of(x))[:, 0].numpy()
+    ref = per_sample(Delay(SR, p=0.5), x)
+
+    def offsets(y):
+        # the delayed impulse, or 0 if no delay was applied
+        return np.array([np.flatnonzero(row[1:])[0] + 1 if row[1:].any() else 0 for row in y])
+
+    ours, ref = offsets(ours), offsets(ref)
+    assert abs((ours > 0).mean() - (ref > 0).mean()) < 0.05
+    assert set(ours[ours > 0]) == set(ref[ref > 0])
+    assert abs(np.median(ours[ours > 0]) - np.median(ref[ref > 0])) <= SR * 0.05
+
+
+def test_filter_choice_rates(tmp_path):
+    # a high-pass removes the DC part, a low-pass the Nyquist part (first-order, zero at Nyquist)
+    n = np.arange(LENGTH)
+    x = (0.25 + 0.25 * (-1.0) ** n).astype(np.float32)
+    ours = batched(tmp_path, transforms_filters=0.8).filters(batch_of(x))[:, 0].numpy()
+    ref = per_sample(HighLowBandPass(SR, p=0.8), x)
+
+    def kinds(y):
+        tail = y[:, -512:]
+        dc = tail.mean(axis=1)
+        nyquist = (tail * (-1.0) ** n[-512:]).mean(axis=1)
+        return np.where(np.abs(dc) < 0.05, "high", np.where(np.abs(nyquist) < 0.05, "low", "none"))
+
+    ours, ref = kinds(ours), kinds(ref)
+    for kind in ["high", "low", "none"]:
+        assert abs((ours == kind).mean() - (ref == kind).mean()) < 0.05
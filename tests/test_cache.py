@@ -0,0 +1,88 @@
+import os
+import numpy as np
+
+from data.audio.cache import AudioCache, CropReservoir
+
+
+def loader(calls):
+    def load(key):
+        calls.append(key)
+        return f"audio of {key}"
+
+    return load
+
+
+def test_reservoir_decodes_a_track_once_for_max_uses():
+    calls = []
+    reservoir = CropReservoir(max_tracks=4, max_uses=3)
+    for _ in range(3):
+        assert reservoir.get("a", loader(calls)) == "audio of a"
+    assert calls == ["a"]
+    # dropped after its last use
+    assert len(reservoir) == 0
+    reservoir.get("a", loader(calls))
+    assert calls == ["a", "a"]
+    assert reservoir.stats()["hits"] == 2 and reservoir.stats()["misses"] == 2
+
+
+def test_reservoir_evicts_the_least_recently_used_track():
+    calls = []
+    reservoir = CropReservoir(max_tracks=2, max_uses=3)
+    reservoir.get("a", loader(calls))
+    reservoir.get("b", loader(calls))
+    reservoir.get("a", loader(calls))
+    reservoir.get("c", loader(calls))
+    # b was used least recently
+    assert list(reservoir.items) == ["a", "c"]
+    assert reservoir.evictions == 1
+    reservoir.get("b", loader(calls))
+    assert calls == ["a", "b", "c", "b"]
+    assert list(reservoir.items) == ["c", "b"]
+
+
+def write_track(tmp_path, name, num_samples):
+    fp = str(tmp_path / name)
+    with open(fp, "wb") as f:
+        f.write(bytes(num_samples))
+    return fp
+
+
+def test_cache_hits_and_misses(tmp_path):
+    fp = write_track(tmp_path, "a.wav", 100)
+    cache = AudioCache(max_bytes=1000)
+    assert cache.get(fp) is None
+    audio = np.zeros(100, dtype=np.int16)
+    assert cache.put(fp, audio)
+    assert cache.get(fp) is audio and fp in cache
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert cache.stats()["mb"] == 200 / 2 ** 20
+
+
+def test_cache_evicts_the_least_recently_used_tracks_at_the_byte_limit(tmp_path):
+    fps = [write_track(tmp_path, f"{i}.wav", 10) for i in range(4)]
+    cache = AudioCache(max_bytes=600)
+    for fp in fps[:3]:
+        cache.put(fp, np.zeros(100, dtype=np.int16))  # 200 bytes each
+    cache.get(fps[0])
+    cache.put(fps[3], np.zeros(150, dtype=np.int16))
+    # 1 and 2 are dropped for the 300 bytes of 3, 0 was used more recently
+    assert list(cache.items) == [fps[0], fps[3]]
+    assert cache.num_bytes == 500 and cache.evictions == 2
+    # larger than the whole budget
+    assert not cache.put(str(tmp_path / "big.wav"), np.zeros(301, dtype=np.int16))
+
+
+def test_cache_drops_a_track_when_its_file_changes(tmp_path):
+    fp = write_track(tmp_path, "a.wav", 100)
+    cache = AudioCache(max_bytes=1000)
+    cache.put(fp, np.zeros(100, dtype=np.int16))
+
+    write_track(tmp_path, "a.wav", 200)
+    assert fp not in cache
+    assert cache.get(fp) is None
+    assert cache.invalidations == 1 and cache.num_bytes == 0
+
+    cache.put(fp, np.ones(200, dtype=np.int16))
+    st = os.stat(fp)
+    os.utime(fp, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    assert cache.get(fp) is None and cache.invalidations == 2
@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+
+from data.audio import compressed
+from data.audio.compressed import CompressedAudioReader, build_mp3_index, parse_mp3_header
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, mono: 144 * 128000 // 44100 = 417 bytes per frame
+HEADER = bytes([0xFF, 0xFB, 0x90, 0xC0])
+FRAME_LENGTH = 417
+FRAME_SAMPLES = 1152
+
+
+def frame(i):
+    # the frame number in the payload, for the fake decoder below
+    return HEADER + i.to_bytes(4, "little") + bytes(FRAME_LENGTH - 8)
+
+
+def id3v2(size):
+    # syncsafe size, 7 bits per byte
+    return b"ID3\x04\x00\x00" + bytes([(size >> s) & 0x7F for s in (21, 14, 7, 0)]) + bytes(size)
+
+
+def write_mp3(fp, num_frames, prefix=b"", suffix=b""):
+    frames = [frame(i) for i in range(num_frames)]
+    with open(fp, "wb") as f:
+        f.write(prefix + b"".join(frames) + suffix)
+    return len(prefix) + FRAME_LENGTH * np.arange(num_frames + 1)
+
+
+def fake_decode(data, fmt):
+    # every frame decodes to its own sample numbers
+    audio = []
+    for pos in range(0, len(data), FRAME_LENGTH):
+        i = int.from_bytes(data[pos + 4 : pos + 8], "little")
+        audio.append(np.arange(i * FRAME_SAMPLES, (i + 1) * FRAME_SAMPLES, dtype=np.float32))
+    return np.concatenate(audio), None
+
+
+def test_parse_mp3_header():
+    assert parse_mp3_header(HEADER) == (FRAME_LENGTH, FRAME_SAMPLES, 44100, 1)
+    # padding, joint stereo
+    assert parse_mp3_header(bytes([0xFF, 0xFB, 0x92, 0x40])) == (FRAME_LENGTH + 1, FRAME_SAMPLES, 44100, 2)
+    # MPEG-2, 64 kbps, 22.05 kHz
+    assert parse_mp3_header(bytes([0xFF, 0xF3, 0x80, 0xC0])) == (72 * 64000 // 22050, 576, 22050, 1)
+    # no sync word, Layer II, free / bad bitrate, reserved sample rate, reserved version
+    for b in [b"\x00\xFB\x90\xC0", b"\xFF\xFD\x90\xC0", b"\xFF\xFB\x00\xC0", b"\xFF\xFB\xF0\xC0",
+              b"\xFF\xFB\x9C\xC0", b"\xFF\xEB\x90\xC0"]:
+        assert parse_mp3_header(b) is None
+
+
+@pytest.mark.parametrize(
+    "prefix,suffix",
+    [
+        (b"", b""),
+        (id3v2(30), b""),
+        (b"", b"TAG" + bytes(125)),
+        (id3v2(30), b"TAG" + bytes(125)),
+        (b"", b"junk"),
+    ],
+    ids=["bare", "id3v2", "id3v1", "id3v2+id3v1", "trailing junk"],
+)
+def test_build_mp3_index(tmp_path, prefix, suffix):
+    fp = str(tmp_path / "a.mp3")
+    offsets = write_mp3(fp, 6, prefix, suffix)
+    index = build_mp3_index(fp)
+    np.testing.assert_array_equal(index.offsets, offsets)
+    np.testing.assert_array_equal(index.starts, FRAME_SAMPLES * np.arange(7))
+    assert index.sample_rate == 44100 and index.channels == 1
+
+
+def test_build_mp3_index_skips_a_truncated_last_frame(tmp_path):
+    fp = str(tmp_path / "a.mp3")
+    offsets = write_mp3(fp, 4, suffix=frame(4)[:100])
+    np.testing.assert_array_equal(build_mp3_index(fp).offsets, offsets)
+
+
+def test_read_source_windows(tmp_path, monkeypatch):
+    monkeypatch.setattr(compressed, "decode_bytes", fake_decode)
+    fp = str(tmp_path / "a.mp3")
+    write_mp3(fp, 30, id3v2(30), b"TAG" + bytes(125))
+    reader = CompressedAudioReader(44100, str(tmp_path / "frame_index"))
+    assert reader.info(fp) == (30 * FRAME_SAMPLES, 44100)
+
+    for start, length in [(0, 100), (5000, 1152), (15 * FRAME_SAMPLES, 2000), (13000, 30 * FRAME_SAMPLES - 13000)]:
+        audio = reader.read_source(fp, start, length)
+        np.testing.assert_array_equal(audio, np.arange(start, start + length))
+
+
+def test_frame_indexes_are_bounded_and_reloaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(CompressedAudioReader, "max_files", 2)
+    reader = CompressedAudioReader(44100, str(tmp_path / "frame_index"))
+    fps = [str(tmp_path / f"{i}.mp3") for i in range(3)]
+    for fp in fps:
+        write_mp3(fp, 5)
+        reader.frame_index(fp)
+    assert len(reader.indexes) == 2 and fps[0] not in reader.indexes
+
+    # read again from the .npz written on the first read, without a scan
+    monkeypatch.setattr(compressed, "build_mp3_index", None)
+    np.testing.assert_array_equal(reader.frame_index(fps[0]).offsets, FRAME_LENGTH * np.arange(6))
+    assert fps[1] not in reader.indexes
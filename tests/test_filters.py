@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+import torch
+
+from modules.transformations.filters import filter_bank, first_order_biquads, first_order_impulse_responses
+from modules.transformations.reverb import fft_convolve
+
+
+def test_fft_convolve_matches_direct_convolution():
+    rng = np.random.RandomState(0)
+    x = rng.normal(size=(3, 1000)).astype(np.float32)
+    h = rng.normal(size=(3, 37)).astype(np.float32)
+    y = fft_convolve(torch.from_numpy(x), torch.from_numpy(h)).numpy()
+    for i in range(3):
+        np.testing.assert_allclose(y[i], np.convolve(x[i], h[i])[:1000], atol=1e-4)
+
+
+@pytest.mark.parametrize("sr", [8000, 16000, 22050, 44100])
+def test_impulse_responses_match_the_recursion(sr):
+    bank = filter_bank(sr)
+    x = np.random.RandomState(0).uniform(-1, 1, 8000).astype(np.float32)
+    cases = [(True, 200), (True, 1200), (False, 2200), (False, 4000), (False, 3999)]
+    highpass = torch.tensor([h for h, _ in cases])
+    cutoff = torch.tensor([c for _, c in cases])
+    irs = bank.batch_impulse_responses(highpass, cutoff)
+    y = fft_convolve(torch.from_numpy(np.tile(x, (len(cases), 1))), irs).numpy()
+    for i, (h, c) in enumerate(cases):
+        np.testing.assert_allclose(y[i], bank(x, h, c), atol=1e-5)
+
+
+def test_impulse_responses_decay_below_tolerance():
+    sos = first_order_biquads(np.arange(200, 1201), 22050, True)
+    irs = first_order_impulse_responses(sos, tol=1e-7)
+    assert np.abs(irs[:, -1]).max() <= 1e-7
@@ -0,0 +1,99 @@
+import argparse
+import os
+import numpy as np
+import pytest
+
+from data.audio import manifest as manifest_module
+from data.audio.manifest import AudioManifest
+from data.audio.gtzan import default_indexer
+from data.audio.magnatagatune import MTTDataset
+from tests.conftest import config, write_wav
+
+
+def mtt_dataset(root):
+    args = config(data_input_dir=root, sample_rate=8000, audio_length=8000, workers=0, manifest=True)
+    return MTTDataset(args, split="train", pretrain=False)
+
+
+def test_only_decode_errors_quarantine(mtt):
+    dataset = mtt_dataset(mtt)
+    fps = sorted(set(dataset.index.row_paths().tolist()))
+
+    dataset.skip_item(0, 1, fps[0], OSError(5, "Input/output error"))
+    dataset.skip_item(0, 1, fps[1], MemoryError())
+    dataset.skip_item(0, 1, fps[2], ValueError("not a RIFF/WAVE file"))
+    assert sorted(dataset.manifest.quarantined) == [fps[2]]
+
+    # persisted for the next run
+    assert mtt_dataset(mtt).manifest.bad_mask(fps).tolist() == [False, False, True] + [False] * (len(fps) - 3)
+
+
+def test_transient_probe_errors_are_retried(tmp_path, monkeypatch):
+    fps = []
+    for i in range(2):
+        fps.append(str(tmp_path / f"{i}.wav"))
+        write_wav(fps[-1], np.zeros(100), 8000)
+
+    read_wav_header = manifest_module.read_wav_header
+
+    def flaky(fp):
+        if fp == fps[0]:
+            raise OSError(116, "Stale file handle")
+        return read_wav_header(fp)
+
+    monkeypatch.setattr(manifest_module, "read_wav_header", flaky)
+    m = AudioManifest(str(tmp_path / "train"), fps, num_workers=1)
+    assert not m.quarantined
+    assert m.num_samples(fps[0]) is None and m.num_samples(fps[1]) == 100
+
+    monkeypatch.setattr(manifest_module, "read_wav_header", read_wav_header)
+    m = AudioManifest(str(tmp_path / "train"), fps, num_workers=1)
+    assert m.num_samples(fps[0]) == 100
+
+
+def test_quarantine_of_other_workers_is_picked_up_periodically(tmp_path):
+    fps = [str(tmp_path / "0.wav")]
+    write_wav(fps[0], np.zeros(100), 8000)
+    worker_a = AudioManifest(str(tmp_path / "train"), fps, num_workers=1)
+    worker_b = AudioManifest(str(tmp_path / "train"), fps, num_workers=1)
+
+    worker_a.quarantine(fps[0], "bad data")
+    assert worker_a.is_bad(fps[0])
+    assert not worker_b.is_bad(fps[0])  # within the refresh interval
+
+    worker_b.refresh_interval = 0
+    assert worker_b.is_bad(fps[0])
+
+
+def gtzan_files(tmp_path, sample_rates):
+    annotations = tmp_path / "train_filtered.txt"
+    names = []
+    for i, sr in enumerate(sample_rates):
+        names.append(f"blues.{i:05d}.wav")
+        write_wav(str(tmp_path / names[-1]), np.zeros(3 * sr), sr)
+    annotations.write_text("\n".join(names) + "\n")
+    return annotations
+
+
+def gtzan_args():
+    return argparse.Namespace(sample_rate=8000, audio_length=8000, model_name="supervised", lin_eval=False)
+
+
+@pytest.mark.parametrize("use_manifest", [False, True])
+def test_gtzan_indexer(tmp_path, use_manifest):
+    annotations = gtzan_files(tmp_path, [8000, 8000])
+    manifest = None
+    if use_manifest:
+        manifest = AudioManifest(str(tmp_path / "train"), [str(tmp_path / f"blues.{i:05d}.wav") for i in range(2)], num_workers=1)
+    items, _ = default_indexer(gtzan_args(), str(tmp_path), annotations, manifest)
+    assert len(items) == 2 * 3
+
+
+def test_gtzan_sample_rate_mismatch_is_a_config_error(tmp_path):
+    annotations = gtzan_files(tmp_path, [8000, 16000])
+    fps = [str(tmp_path / f"blues.{i:05d}.wav") for i in range(2)]
+    manifest = AudioManifest(str(tmp_path / "train"), fps, num_workers=1)
+    with pytest.raises(Exception, match="16000 Hz"):
+        default_indexer(gtzan_args(), str(tmp_path), annotations, manifest)
+    assert not manifest.quarantined
+    assert not os.path.exists(tmp_path / "train.quarantine.tsv")
@@ -0,0 +1,77 @@
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+
+from data.audio import packed
+from data.audio.index import AudioIndex
+from tests.conftest import config, write_wav
+
+
+@pytest.fixture
+def clips(tmp_path, monkeypatch):
+    monkeypatch.setattr(packed, "shared_memory_dir", lambda: str(tmp_path / "shm"))
+    os.makedirs(tmp_path / "shm")
+    fps = []
+    for i in range(3):
+        fp = str(tmp_path / f"{i}.wav")
+        write_wav(fp, np.full(100, i * 100), 8000)
+        fps.append(fp)
+    return AudioIndex.from_clips([0, 1, 2], [0, 1, 2], fps, np.zeros((3, 2)), 1)
+
+
+def arena_files(tmp_path):
+    return sorted(os.listdir(tmp_path / "shm"))
+
+
+def test_shared_tracks(tmp_path, clips):
+    args = config(local_rank=0, sample_rate=8000, keep_shared=False)
+    store, slots = packed.load_shared_tracks(args, "test", "train", clips)
+    assert [int(store.get_slot(slot)[0]) for slot in slots] == [0, 100, 200]
+
+
+def test_shared_tracks_follow_file_changes(tmp_path, clips):
+    args = config(local_rank=0, sample_rate=8000, keep_shared=True)
+    packed.load_shared_tracks(args, "test", "train", clips)
+    before = arena_files(tmp_path)
+
+    # same path, new contents
+    write_wav(str(tmp_path / "1.wav"), np.full(120, 7), 8000)
+    store, slots = packed.load_shared_tracks(args, "test", "train", clips)
+    assert int(store.get_slot(slots[1])[0]) == 7
+    assert store.get_slot(slots[1]).shape[0] == 120
+    assert arena_files(tmp_path) != before
+
+
+def test_shared_store_is_removed_by_its_writer(tmp_path, clips):
+    args = config(local_rank=0, sample_rate=8000, keep_shared=False)
+    store, _ = packed.load_shared_tracks(args, "test", "train", clips)
+    packed.remove_shared_store(store.root, os.getpid() + 1)  # e.g. a forked worker
+    assert len(arena_files(tmp_path)) == 2
+    packed.remove_shared_store(store.root, os.getpid())
+    assert arena_files(tmp_path) == []
+
+
+def test_stale_tmp_files_are_removed(tmp_path, clips):
+    dead = subprocess.Popen([sys.executable, "-c", "pass"])
+    dead.wait()
+    root = str(tmp_path / "shm" / "store")
+    stale = f"{root}.packed.{dead.pid}.tmp"
+    live = f"{root}.packed.{os.getpid()}.tmp"
+    for path in [stale, live]:
+        open(path, "w").close()
+    packed.remove_stale_tmp(root)
+    assert not os.path.exists(stale)
+    assert os.path.exists(live)
+
+
+def test_failed_write_leaves_no_tmp_files(tmp_path, clips, monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(packed, "encode_audio", fail)
+    args = config(local_rank=0, sample_rate=8000, keep_shared=False)
+    with pytest.raises(Exception, match="No space left"):
+        packed.load_shared_tracks(args, "test", "train", clips)
+    assert arena_files(tmp_path) == []
@@ -0,0 +1,69 @@
+import random
+import numpy as np
+import pytest
+import torch
+
+from modules.transformations.audio import RandomPitchShift
+from modules.transformations.pitch_shift import BatchedPitchShift
+
+SR = 16000
+LENGTH = 16000
+
+
+def tone(f0, sr=SR, length=LENGTH):
+    t = np.arange(length) / sr
+    return (0.5 * np.sin(2 * np.pi * f0 * t)).astype(np.float32)
+
+
+def peak_frequency(audio, sr=SR):
+    # the middle of the clip, away from the edges of the STFT
+    audio = audio[len(audio) // 4 : -len(audio) // 4]
+    spectrum = np.abs(np.fft.rfft(audio * np.hanning(len(audio))))
+    return np.argmax(spectrum) * sr / len(audio)
+
+
+@pytest.mark.parametrize("cents", [-700, -350, 0, 400, 700])
+def test_random_pitch_shift_torch_backend(cents):
+    shift = RandomPitchShift(audio_length=LENGTH, sr=SR, p=1.0, backend="torch", grid=50)
+    shift.n_steps = lambda: cents
+    random.seed(0)
+    y = shift(tone(440.0))
+    assert isinstance(y, np.ndarray) and y.dtype == np.float32
+    assert y.shape == (LENGTH,)
+    assert np.isfinite(y).all()
+    expected = 440.0 * 2 ** (cents / 1200)
+    assert abs(peak_frequency(y) - expected) / expected < 0.02
+
+
+def test_random_pitch_shift_torch_backend_skips():
+    shift = RandomPitchShift(audio_length=LENGTH, sr=SR, p=0.0, backend="torch")
+    x = tone(440.0)
+    assert shift(x) is x
+
+
+def test_grid_points_shift_a_tone():
+    # every grid point moves the tone to the target frequency (no sox needed)
+    shift = BatchedPitchShift(SR, grid=50)
+    x = torch.from_numpy(tone(440.0)).reshape(1, 1, -1).repeat(len(shift.points), 1, 1)
+    with torch.no_grad():
+        y = shift(x, torch.tensor(shift.points)).reshape(len(shift.points), -1).numpy()
+    for point, audio in zip(shift.points, y):
+        expected = 440.0 * 2 ** (point / 1200)
+        assert abs(peak_frequency(audio) - expected) / expected < 0.01, f"{point} cents"
+
+
+def test_grid_points_match_sox():
+    pytest.importorskip("augment")
+    from scripts.benchmarks.pitch_shift import sox_pitch_shift, spectral_similarity, synthetic_clips
+
+    clips = synthetic_clips(4, SR, LENGTH)
+    batch = torch.from_numpy(np.stack(clips)).reshape(len(clips), 1, -1)
+    shift = BatchedPitchShift(SR, grid=50)
+    with torch.no_grad():
+        for point in shift.points:
+            if point == 0:
+                continue
+            ours = shift(batch, torch.full((len(clips),), point)).reshape(len(clips), -1).numpy()
+            sox = [sox_pitch_shift(c, SR, point) for c in clips]
+            spectrum_corr = np.mean([spectral_similarity(x, y)[1] for x, y in zip(sox, ours)])
+            assert spectrum_corr > 0.9, f"{point} cents"
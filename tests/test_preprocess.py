@@ -0,0 +1,93 @@
+import os
+import numpy as np
+import scipy.io.wavfile
+import scipy.signal
+
+from utils import resample as resample_module
+from utils.preprocess import process_jobs, read_manifest
+from utils.resample import load_audio_rates, resample_poly
+from tests.conftest import write_wav
+
+SR = 16000
+
+
+def tone(f0=440.0, sr=SR, seconds=1.0):
+    t = np.arange(int(sr * seconds)) / sr
+    return (10000 * np.sin(2 * np.pi * f0 * t)).astype(np.int16)
+
+
+def peak_frequency(audio, sr):
+    spectrum = np.abs(np.fft.rfft(audio * np.hanning(len(audio))))
+    return np.argmax(spectrum) * sr / len(audio)
+
+
+def test_resample_poly_matches_scipy():
+    x = np.random.RandomState(0).normal(size=4000).astype(np.float32)
+    np.testing.assert_allclose(resample_poly(x, 16000, 22050), scipy.signal.resample_poly(x, 441, 320), atol=1e-5)
+    assert resample_poly(x, 16000, 16000) is x
+
+
+def test_load_audio_rates_decodes_once(tmp_path, monkeypatch):
+    fp = str(tmp_path / "a.wav")
+    write_wav(fp, tone(), SR)
+    decodes = []
+    decode = resample_module.decode
+    monkeypatch.setattr(resample_module, "decode", lambda source: decodes.append(source) or decode(source))
+
+    rates = [8000, 16000, 22050]
+    audios = load_audio_rates(fp, rates, dtype="int16")
+    assert decodes == [fp]
+    for audio, sr in zip(audios, rates):
+        assert audio.dtype == np.int16 and audio.shape == (sr,)
+        assert abs(peak_frequency(audio, sr) - 440.0) <= 1.0
+
+
+def source_jobs(tmp_path, num_sources, rates):
+    out_dir = str(tmp_path / "processed")
+    jobs = []
+    for i in range(num_sources):
+        src = str(tmp_path / f"{i}.wav")
+        write_wav(src, tone(220.0 * (i + 1)), SR)
+        jobs.append((src, [(os.path.join(out_dir, f"{i}-{sr}.wav"), sr) for sr in rates]))
+    return jobs, os.path.join(out_dir, "manifest.txt")
+
+
+def test_process_jobs_writes_every_rate(tmp_path):
+    rates = [8000, 16000]
+    jobs, manifest = source_jobs(tmp_path, 3, rates)
+    process_jobs(jobs, manifest, num_workers=2)
+
+    for src, targets in jobs:
+        for target, sr in targets:
+            target_sr, audio = scipy.io.wavfile.read(target)
+            assert target_sr == sr and audio.shape == (sr,)
+    assert read_manifest(manifest) == {os.path.basename(t) for _, targets in jobs for t, _ in targets}
+    assert not [f for f in os.listdir(os.path.dirname(manifest)) if f.endswith(".tmp")]
+
+
+def test_process_jobs_skips_the_targets_in_the_manifest(tmp_path, capsys):
+    jobs, manifest = source_jobs(tmp_path, 2, [8000])
+    process_jobs(jobs, manifest, num_workers=1)
+    mtimes = {t: os.stat(t).st_mtime_ns for _, targets in jobs for t, _ in targets}
+
+    # a second run only writes the new rate
+    jobs, _ = source_jobs(tmp_path, 2, [8000, 22050])
+    capsys.readouterr()
+    process_jobs(jobs, manifest, num_workers=1)
+    assert "2/4 files already processed" in capsys.readouterr().out
+    for target, mtime in mtimes.items():
+        assert os.stat(target).st_mtime_ns == mtime
+    assert len(read_manifest(manifest)) == 4
+
+    process_jobs(jobs, manifest, num_workers=1)
+    assert "4/4 files already processed" in capsys.readouterr().out
+
+
+def test_process_jobs_leaves_failed_sources_out_of_the_manifest(tmp_path, capsys):
+    jobs, manifest = source_jobs(tmp_path, 2, [8000])
+    with open(jobs[0][0], "wb") as f:
+        f.write(b"not audio")
+    process_jobs(jobs, manifest, num_workers=1)
+    assert f"Failed to process {jobs[0][0]}" in capsys.readouterr().out
+    assert read_manifest(manifest) == {"1-8000.wav"}
+    assert not os.path.exists(jobs[0][1][0][0])
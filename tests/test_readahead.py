@@ -0,0 +1,96 @@
+import io
+import os
+import torch
+
+from data import get_dataset
+from data.audio import dataset as dataset_module
+from data.audio import readahead
+from data.audio.readahead import ReadAheadDataset, read_file
+from utils.audio import read_wav_header
+from tests.conftest import pretrain_config
+
+
+def record_reads(monkeypatch):
+    reads = []
+    monkeypatch.setattr(dataset_module, "read_file", lambda fp, offset=0, length=None: reads.append((fp, offset, length)))
+    return reads
+
+
+def test_read_file_range(tmp_path, monkeypatch):
+    fp = str(tmp_path / "a.bin")
+    size = 3 * 2 ** 20 + 5
+    with open(fp, "wb") as f:
+        f.write(os.urandom(size))
+
+    num_read = []
+
+    class CountingFile(io.FileIO):
+        def readinto(self, b):
+            n = super().readinto(b)
+            num_read.append(n)
+            return n
+
+    monkeypatch.setattr(readahead, "open", lambda fp, mode, buffering: CountingFile(fp, mode.replace("b", "")), raising=False)
+    read_file(fp)
+    assert sum(num_read) == size
+    # across chunk boundaries, and past the end of the file
+    num_read.clear()
+    read_file(fp, 10, 2 ** 20 + 3)
+    assert sum(num_read) == 2 ** 20 + 3
+    num_read.clear()
+    read_file(fp, 3 * 2 ** 20, 100)
+    assert sum(num_read) == 5
+
+
+def test_prefetch_reads_the_segment_window(mtt, monkeypatch):
+    args = pretrain_config(mtt, supervised=True)
+    train_dataset = get_dataset(args, pretrain=False)[1]
+    reads = record_reads(monkeypatch)
+
+    idx = next(i for i in range(len(train_dataset)) if train_dataset.index.segments[i] > 0)
+    train_dataset.prefetch(idx)
+    (fp, offset, length), = reads
+    header = read_wav_header(fp)
+    start = int(train_dataset.index.segments[idx]) * args.audio_length
+    assert offset == header.offset + start * 2
+    assert length == args.audio_length * 2
+
+
+def test_prefetch_reads_small_clips_for_crops(mtt, monkeypatch):
+    args = pretrain_config(mtt)
+    train_dataset = get_dataset(args, pretrain=True)[1]
+    reads = record_reads(monkeypatch)
+    train_dataset.prefetch(0)
+    (fp, offset, length), = reads
+    assert length == read_wav_header(fp).num_samples * 2
+
+    # clips larger than PREFETCH_WHOLE_BYTES are not read ahead for random crops
+    reads.clear()
+    monkeypatch.setattr(dataset_module, "PREFETCH_WHOLE_BYTES", 1000)
+    train_dataset.prefetch(0)
+    assert reads == []
+
+
+def test_prefetch_skips_datasets_without_an_audio_index(mtt, monkeypatch):
+    args = pretrain_config(mtt, supervised=True)
+    train_dataset = get_dataset(args, pretrain=False)[1]
+    reads = record_reads(monkeypatch)
+    train_dataset.index = [("track", "clip", 0, "a.wav", None)]
+    train_dataset.prefetch(0)
+    del train_dataset.index
+    train_dataset.prefetch(0)
+    assert reads == []
+
+
+def test_prefetch_errors_are_reported(capsys):
+    class Broken:
+        def __getitem__(self, idx):
+            return torch.zeros(1)
+
+        def prefetch(self, idx):
+            raise OSError("no such file")
+
+    items = list(ReadAheadDataset(Broken(), depth=2, num_threads=1).load([0, 1, 2]))
+    assert len(items) == 3
+    out = capsys.readouterr().out
+    assert out.count("could not prefetch") == 3 and "OSError: no such file" in out
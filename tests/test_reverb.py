@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from modules.transformations import reverb
+from modules.transformations.reverb import IRBank, ir_bank_path, prepare_ir_bank
+from tests.conftest import config
+
+
+def reverb_config(root, **kwargs):
+    return config(data_input_dir=str(root), sample_rate=8000, reverb_backend="ir", **kwargs)
+
+
+def fake_render(sr, grid, seconds):
+    irs = np.zeros((grid ** 3, int(sr * seconds)), dtype=np.float32)
+    irs[:, 0] = 1
+    return irs, np.zeros((grid ** 3, 3), dtype=np.int64)
+
+
+def test_missing_bank_fails_with_the_render_command(tmp_path):
+    args = reverb_config(tmp_path)
+    path = ir_bank_path(args.data_input_dir, args.sample_rate, args.reverb_grid, args.reverb_ir_seconds)
+    with pytest.raises(Exception, match="render_ir_bank"):
+        IRBank(path, args.sample_rate, args.reverb_grid, args.reverb_ir_seconds)
+
+
+def test_prepare_renders_on_local_rank_0_only(tmp_path, monkeypatch):
+    monkeypatch.setattr(reverb, "render_ir_bank", fake_render)
+    args = reverb_config(tmp_path, reverb_grid=2, local_rank=1)
+    path = prepare_ir_bank(args)
+    assert not (tmp_path / "ir_bank").exists()
+
+    args.local_rank = 0
+    assert prepare_ir_bank(args) == path
+    bank = IRBank(path, args.sample_rate, args.reverb_grid, args.reverb_ir_seconds)
+    assert len(bank) == 8
+
+
+def test_prepare_fails_when_rendering_fails(tmp_path, monkeypatch):
+    def broken_render(sr, grid, seconds):
+        raise ImportError("No module named 'augment'")
+
+    monkeypatch.setattr(reverb, "render_ir_bank", broken_render)
+    with pytest.raises(Exception, match="Could not render"):
+        prepare_ir_bank(reverb_config(tmp_path))
@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+import torch
+
+from data import get_dataset, set_epoch
+from data.audio.index import AudioIndex
+from data.audio.samplers import BlockShuffleSampler, TrackBatchSampler
+from tests.conftest import pretrain_config
+
+
+def make_index(num_tracks=24, clips_per_track=3, num_segments=2):
+    track_ids = np.repeat(np.arange(num_tracks), clips_per_track)
+    clip_ids = np.arange(len(track_ids))
+    paths = [f"/data/{t}/{c}.wav" for t, c in zip(track_ids, clip_ids)]
+    return AudioIndex.from_clips(track_ids.tolist(), clip_ids.tolist(), paths, np.zeros((len(paths), 2)), num_segments)
+
+
+def row_tracks(index, rows):
+    return index.track_ids[np.asarray(rows)]
+
+
+def find_sampler(obj, sampler_class):
+    # through the wrappers of get_loader
+    while obj is not None and not isinstance(obj, sampler_class):
+        obj = getattr(obj, "batch_sampler", None) or getattr(obj, "sampler", None)
+    return obj
+
+
+def test_track_batches_hold_unique_tracks():
+    index = make_index()
+    sampler = TrackBatchSampler(index.track_index(), batch_size=4)
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == 24 // 4
+    tracks = [row_tracks(index, batch) for batch in batches]
+    for t in tracks:
+        assert len(set(t.tolist())) == 4
+    # every track once per epoch
+    assert sorted(np.concatenate(tracks).tolist()) == sorted(set(index.track_ids.tolist()))
+
+
+def test_track_batches_multi_crop():
+    index = make_index(num_tracks=32)
+    sampler = TrackBatchSampler(index.track_index(), batch_size=4, crops_per_track=2, crop_mix=2, num_workers=2)
+    batches = list(sampler)
+    assert len(batches) == len(sampler) == (32 // 8) * 2 * 2
+    for batch in batches:
+        assert len(set(row_tracks(index, batch).tolist())) == 4
+    # every track twice per epoch, on the same worker (workers take batches in turn)
+    workers = {}
+    for b, batch in enumerate(batches):
+        for row in batch:
+            workers.setdefault(int(index.track_ids[row]), set()).add(b % 2)
+    assert all(len(w) == 1 for w in workers.values())
+    counts = np.bincount(row_tracks(index, np.concatenate(batches)))
+    assert set(counts.tolist()) == {2}
+
+
+class WorkerIds(torch.utils.data.Dataset):
+    # the DataLoader worker that loads each row
+    def __len__(self):
+        return 10 ** 6
+
+    def __getitem__(self, idx):
+        return idx, torch.utils.data.get_worker_info().id
+
+
+@pytest.mark.parametrize("num_tracks,num_workers", [(40, 3), (24, 4), (48, 3)])
+def test_track_batches_multi_crop_windows_stay_on_one_worker(num_tracks, num_workers):
+    # 40 tracks are 5 windows of 8 for 3 workers, padded to 6 windows
+    index = make_index(num_tracks=num_tracks)
+    sampler = TrackBatchSampler(
+        index.track_index(), batch_size=4, crops_per_track=3, crop_mix=2, num_workers=num_workers
+    )
+    loader = torch.utils.data.DataLoader(WorkerIds(), batch_sampler=sampler, num_workers=num_workers)
+    workers = {}
+    num_batches = 0
+    for rows, worker_ids in loader:
+        num_batches += 1
+        for row, worker in zip(rows.tolist(), worker_ids.tolist()):
+            workers.setdefault(int(index.track_ids[row]), []).append(worker)
+    assert num_batches == len(sampler) == -(-(num_tracks // 8) // num_workers) * num_workers * 2 * 3
+    # every window (also a padded one, of tracks drawn before) is drawn by one worker, so a
+    # worker draws all 3 pairs of every track it decodes
+    assert len(workers) == num_tracks
+    for w in workers.values():
+        assert all(count % 3 == 0 for count in np.bincount(w))
+
+
+def test_track_batches_of_ranks_are_disjoint():
+    index = make_index()
+    track_index = index.track_index()
+    ranks = [list(TrackBatchSampler(track_index, 4, num_replicas=2, rank=r)) for r in range(2)]
+    for a, b in zip(*ranks):
+        assert not set(row_tracks(index, a).tolist()) & set(row_tracks(index, b).tolist())
+
+
+@pytest.mark.parametrize("sampler_class", ["track", "block"])
+def test_epoch_is_only_set_by_set_epoch(sampler_class):
+    index = make_index()
+    if sampler_class == "track":
+        sampler = TrackBatchSampler(index.track_index(), batch_size=4, seed=1)
+    else:
+        sampler = BlockShuffleSampler(index, block_size=4, window=8, seed=1)
+
+    sampler.set_epoch(3)
+    first = list(sampler)
+    assert list(sampler) == first  # iterating does not advance the epoch
+    sampler.set_epoch(4)
+    assert list(sampler) != first
+    sampler.set_epoch(3)
+    assert list(sampler) == first
+
+
+@pytest.mark.parametrize("block_size,window", [(1, 0), (8, 0), (8, 32), (1000, 0)])
+def test_block_shuffle_is_a_permutation(block_size, window):
+    index = make_index()
+    rows = list(BlockShuffleSampler(index, block_size=block_size, window=window, seed=0))
+    assert sorted(rows) == list(range(len(index)))
+
+
+def test_block_shuffle_reads_blocks_in_storage_order():
+    index = make_index()
+    keys = np.arange(len(index))
+    sampler = BlockShuffleSampler(index, block_size=6, keys=keys)
+    rows = np.array(list(sampler))
+    # runs of a block are consecutive rows in storage order
+    assert (np.diff(rows.reshape(-1, 6), axis=1) == 1).all()
+
+
+def test_block_shuffle_ranks_cover_all_rows():
+    index = make_index(num_tracks=25)
+    ranks = [list(BlockShuffleSampler(index, block_size=4, num_replicas=3, rank=r)) for r in range(3)]
+    assert len(set(map(len, ranks))) == 1
+    assert set(np.concatenate(ranks).tolist()) == set(range(len(index)))
+
+
+@pytest.mark.parametrize("options", [{}, {"read_ahead": 2}, {"batch_slabs": True}])
+def test_set_epoch_reaches_the_train_sampler(mtt, options):
+    args = pretrain_config(mtt, **options)
+    train_loader = get_dataset(args, pretrain=True)[0]
+    set_epoch(train_loader, 7)
+    loader = getattr(train_loader, "loader", train_loader)
+    sampler = find_sampler(loader.batch_sampler, TrackBatchSampler) or find_sampler(loader.sampler, TrackBatchSampler)
+    assert sampler.epoch == 7
+
+
+def test_block_shuffle_is_ignored_for_track_batches(mtt, capsys):
+    args = pretrain_config(mtt, block_shuffle=4)
+    get_dataset(args, pretrain=True)
+    assert "block_shuffle is ignored" in capsys.readouterr().out
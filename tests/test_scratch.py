@@ -0,0 +1,57 @@
+import os
+import threading
+import time
+
+from data.audio.scratch import ScratchCache
+
+
+def write_file(fp, size):
+    os.makedirs(os.path.dirname(fp), exist_ok=True)
+    with open(fp, "wb") as f:
+        f.write(b"\0" * size)
+
+
+def test_copy_and_evict(tmp_path):
+    root = str(tmp_path / "shared")
+    cache = ScratchCache(root, str(tmp_path / "scratch"), max_bytes=3000)
+    cache.grace = 0
+    fps = [os.path.join(root, f"{i}.wav") for i in range(5)]
+    for i, fp in enumerate(fps):
+        write_file(fp, 1000)
+        local = cache.local_path(fp)
+        cache.copy(fp, local)
+        # distinct mtimes, so the least recently used file is evicted first
+        os.utime(local, (i, i))
+
+    local = [cache.local_path(fp) for fp in fps]
+    assert all(os.path.exists(fp) for fp in local[-2:])
+    assert not os.path.exists(local[0])
+    assert sum(os.path.getsize(fp) for fp in local if os.path.exists(fp)) <= 3000
+    assert cache.path(fps[-1]) == local[-1]
+
+
+def test_schedule_does_not_wait_for_scan(tmp_path):
+    root = str(tmp_path / "shared")
+    cache = ScratchCache(root, str(tmp_path / "scratch"), max_bytes=3000)
+    cache._start()
+
+    scanning = threading.Event()
+    release = threading.Event()
+
+    def slow_scan():
+        scanning.set()
+        release.wait(5)
+        return []
+
+    cache.scan = slow_scan
+    thread = threading.Thread(target=cache.reserve, args=(1000,))
+    thread.start()
+    assert scanning.wait(5)
+
+    t0 = time.monotonic()
+    fp = os.path.join(root, "a.wav")
+    cache.schedule(fp, cache.local_path(fp))
+    assert time.monotonic() - t0 < 1
+    release.set()
+    thread.join(5)
+    assert cache._num_bytes == 1000
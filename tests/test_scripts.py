@@ -0,0 +1,31 @@
+import os
+import subprocess
+import sys
+
+from tests.conftest import ROOT
+
+
+def run_script(module, *argv):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable, "-m", module, *argv], cwd=ROOT, env=env, capture_output=True, text=True)
+
+
+def dataset_args(root):
+    return ["--data_input_dir", root, "--dataset", "magnatagatune", "--audio_length", "8000", "--sample_rate", "8000"]
+
+
+# the dataset scripts take the options they do not set from config/config.yaml, they must build
+# complete args for the dataloaders
+
+
+def test_write_shards(mtt):
+    result = run_script("scripts.datasets.write_shards", *dataset_args(mtt))
+    assert result.returncode == 0, result.stderr
+    assert os.path.exists(os.path.join(mtt, "magnatagatune", "shards", "train", "shards.json"))
+
+
+def test_preprocess_dataset(mtt):
+    # there are no raw files, so every job fails (and is reported), after the datasets are built
+    result = run_script("scripts.datasets.preprocess_dataset", *dataset_args(mtt), "--num_workers", "1")
+    assert result.returncode == 0, result.stderr
+    assert "Processing all train tracks" in result.stdout
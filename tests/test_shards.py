@@ -0,0 +1,75 @@
+import json
+import os
+import numpy as np
+import torch
+
+from data import get_dataset
+from data.audio.magnatagatune import MTTDataset
+from data.audio.shards import ShardedAudioDataset, shard_dir, write_shards
+from modules.transformations import AudioTransforms
+from tests.conftest import config, pretrain_config
+
+
+def write_train_shards(root, shard_size_mb=1, out_dir=None):
+    args = config(data_input_dir=root, sample_rate=8000, audio_length=8000, workers=0, manifest=False)
+    dataset = MTTDataset(args, split="train", pretrain=False)
+    out_dir = out_dir or os.path.join(root, "shards", "train")
+    write_shards(dataset, out_dir, shard_size_mb=shard_size_mb)
+    return out_dir
+
+
+def test_supervised_epochs_hold_every_segment(mtt):
+    out_dir = write_train_shards(mtt)
+    args = config(sample_rate=8000, audio_length=8000, supervised=True, seed=0, batch_size=1, workers=0)
+    dataset = ShardedAudioDataset(out_dir, args, pretrain=False)
+
+    # 6 clips of 30 s, 30 segments of 1 s each
+    assert len(dataset) == 6 * 30
+    segments = [x0.numpy().tobytes() for (x0, x1), _ in dataset]
+    assert len(segments) == 6 * 30
+    assert len(set(segments)) == 6 * 30
+
+
+def test_older_shards_count_one_segment_per_clip(mtt):
+    out_dir = write_train_shards(mtt)
+    with open(os.path.join(out_dir, "shards.json")) as f:
+        meta = json.load(f)
+    for shard in meta["shards"]:
+        del shard["lengths"]
+    with open(os.path.join(out_dir, "shards.json"), "w") as f:
+        json.dump(meta, f)
+
+    args = config(sample_rate=8000, audio_length=8000, supervised=True, seed=0, batch_size=1, workers=0)
+    assert len(ShardedAudioDataset(out_dir, args, pretrain=False)) == 6
+
+
+def test_pretraining_yields_two_crops_per_clip(mtt):
+    out_dir = write_train_shards(mtt)
+    args = pretrain_config(mtt, supervised=False, seed=0, batch_size=1)
+    dataset = ShardedAudioDataset(out_dir, args, pretrain=True, transform=AudioTransforms(args))
+    num_items = 0
+    # items share the transform buffers, so they are checked as they come
+    for (x0, x1), label in dataset:
+        assert x0.shape == x1.shape == (1, 8000)
+        assert not np.array_equal(x0.numpy(), x1.numpy())
+        num_items += 1
+    assert len(dataset) == num_items == 6
+
+
+def test_loader_length_counts_the_batches_of_every_worker(mtt):
+    out_dir = write_train_shards(mtt)
+    # 180 segments over 2 workers: 90 each, 5 full batches of 16 per worker (not 180 // 16 = 11)
+    args = config(sample_rate=8000, audio_length=8000, supervised=True, seed=0, batch_size=16, workers=2)
+    dataset = ShardedAudioDataset(out_dir, args, pretrain=False)
+    loader = torch.utils.data.DataLoader(dataset, batch_size=16, drop_last=True, num_workers=2)
+    assert len(loader) == 10
+    batches = list(loader)
+    assert len(batches) == 10
+    assert all(x0.shape == (16, 1, 8000) for (x0, x1), _ in batches)
+
+
+def test_sharded_pretraining_warns_about_unique_tracks(mtt, capsys):
+    write_train_shards(mtt, out_dir=shard_dir(mtt, MTTDataset.base_dir, "train"))
+    args = pretrain_config(mtt, sharded=True, supervised=False)
+    get_dataset(args, pretrain=True)
+    assert "do not hold unique tracks" in capsys.readouterr().out
@@ -0,0 +1,41 @@
+import argparse
+import torch
+from torch.utils.data import BatchSampler, SequentialSampler
+
+from data.get_dataloader import get_loader
+
+
+class IndexDataset(torch.utils.data.Dataset):
+    # every item holds its own index, so a rewritten slab row is detected
+    num_tags = 2
+
+    def __init__(self, size, audio_length):
+        self.size = size
+        self.audio_length = audio_length
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, idx):
+        x = torch.full((1, self.audio_length), float(idx))
+        return (x, x), torch.full((self.num_tags,), float(idx))
+
+
+def test_batch_is_valid_while_the_next_is_drawn():
+    args = argparse.Namespace(batch_size=4, audio_length=16, workers=2, read_ahead=0, read_ahead_threads=1)
+    dataset = IndexDataset(64, args.audio_length)
+    batch_sampler = BatchSampler(SequentialSampler(dataset), args.batch_size, drop_last=True)
+    loader = get_loader(args, dataset, batch_sampler=batch_sampler, slabs=True)
+
+    previous = None
+    for b, ((x_i, x_j), y) in enumerate(loader):
+        expected = torch.arange(b * 4, (b + 1) * 4, dtype=torch.float32)
+        assert torch.equal(y[:, 0], expected)
+        assert torch.equal(x_i[:, 0, 0], expected)
+        if previous is not None:
+            # the previous batch is still intact after the next one was drawn
+            (p_i, _), p_y = previous
+            assert torch.equal(p_y[:, 0], expected - 4)
+            assert torch.equal(p_i[:, 0, -1], expected - 4)
+        previous = (x_i, x_j), y
+    assert b == 64 // 4 - 1
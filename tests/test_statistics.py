@@ -0,0 +1,75 @@
+import os
+import numpy as np
+
+from scripts.datasets.statistics import RunningStatistics, compute_statistics
+from utils.audio import read_wav
+from tests.conftest import write_wav
+
+
+def load_wav(fp):
+    audio, sr = read_wav(fp)
+    return audio.astype(np.float64) / 32768, sr
+
+
+def test_merge_matches_the_statistics_of_all_samples():
+    rng = np.random.RandomState(0)
+    tracks = [rng.normal(rng.uniform(-1, 1), rng.uniform(0.1, 2), n) for n in [10, 1000, 4096, 3]]
+    stats = RunningStatistics()
+    for audio in tracks:
+        stats.update(audio)
+
+    audio = np.concatenate(tracks)
+    assert stats.num_tracks == len(tracks)
+    assert stats.count[0] == len(audio)
+    np.testing.assert_allclose(stats.mean[0], audio.mean())
+    np.testing.assert_allclose(stats.channel_std()[0], audio.std())
+
+    # merging partial results in any grouping gives the same statistics
+    left, right = RunningStatistics(), RunningStatistics()
+    for audio in tracks[:2]:
+        left.update(audio)
+    for audio in tracks[2:]:
+        right.update(audio)
+    left.merge(right)
+    np.testing.assert_allclose(left.mean, stats.mean)
+    np.testing.assert_allclose(left.m2, stats.m2)
+
+
+def test_merge_of_different_channel_counts():
+    rng = np.random.RandomState(1)
+    mono = rng.normal(0, 1, 500)
+    stereo = rng.normal(1, 2, (2, 300))
+    stats = RunningStatistics().update(mono).update(stereo)
+    np.testing.assert_allclose(stats.mean, [np.concatenate([mono, stereo[0]]).mean(), stereo[1].mean()])
+
+    mean, std = stats.global_mean_std()
+    audio = np.concatenate([mono, stereo.ravel()])
+    np.testing.assert_allclose([mean, std], [audio.mean(), audio.std()])
+
+
+def test_save_load_round_trip(tmp_path):
+    stats = RunningStatistics().update(np.random.RandomState(2).normal(0, 1, 5000))
+    fp = str(tmp_path / "stats.npz")
+    stats.save(fp, ["a.wav"])
+    loaded, done = RunningStatistics.load(fp)
+    assert done == ["a.wav"]
+    np.testing.assert_array_equal(loaded.m2, stats.m2)
+    np.testing.assert_array_equal(loaded.rms_hist, stats.rms_hist)
+
+
+def test_compute_statistics_in_parallel(tmp_path):
+    rng = np.random.RandomState(3)
+    fps = []
+    tracks = []
+    for i in range(6):
+        audio = rng.normal(0, 3000, 4000).clip(-32768, 32767).astype(np.int16)
+        fp = os.path.join(str(tmp_path), f"{i}.wav")
+        write_wav(fp, audio, 8000)
+        fps.append(fp)
+        tracks.append(audio / 32768)
+
+    stats = compute_statistics(fps + fps[:2], load_wav, num_workers=2)
+    audio = np.concatenate(tracks)
+    assert stats.num_tracks == 6
+    mean, std = stats.global_mean_std()
+    np.testing.assert_allclose([mean, std], [audio.mean(), audio.std()])
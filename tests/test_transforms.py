@@ -0,0 +1,130 @@
+import random
+import numpy as np
+import pytest
+import torch
+
+from modules.transformations import AudioTransforms, BatchedAudioTransforms
+from modules.transformations.audio import copy_into
+from modules.transformations.batched import STAGES, batched_stages
+from tests.conftest import config, write_ir_bank
+
+
+def transforms_config(**kwargs):
+    kwargs.setdefault("audio_length", 16384)  # longer than the longest delay
+    kwargs.setdefault("batch_size", 4)
+    return config(**kwargs)
+
+
+def run_chain(args, num_items=20):
+    random.seed(0)
+    transforms = AudioTransforms(args)
+    rng = np.random.RandomState(0)
+    for _ in range(num_items):
+        x = (rng.normal(0, 0.1, args.audio_length * 2) * 32767).astype(np.int16)
+        x0, x1 = transforms(x, None, None)
+        assert x0.shape == (1, args.audio_length) and x1.shape == (1, args.audio_length)
+        assert x0.dtype == torch.float32
+        assert torch.isfinite(x0).all() and torch.isfinite(x1).all()
+
+
+def test_copy_into_flattens_effect_chain_output():
+    out = np.zeros(8, dtype=np.float32)
+    copy_into(np.arange(8, dtype=np.float32).reshape(1, -1), out)
+    np.testing.assert_array_equal(out, np.arange(8))
+
+    copy_into(np.ones((1, 5), dtype=np.float32), out)
+    np.testing.assert_array_equal(out, [1, 1, 1, 1, 1, 0, 0, 0])
+
+
+def test_default_chain():
+    pytest.importorskip("augment")
+    args = transforms_config(transforms_pitch=1.0, transforms_reverb=1.0)
+    assert args.pitch_backend == "sox" and args.reverb_backend == "sox"
+    run_chain(args)
+
+
+def test_torch_pitch_and_ir_reverb_chain(tmp_path):
+    args = transforms_config(
+        data_input_dir=str(tmp_path),
+        pitch_backend="torch",
+        reverb_backend="ir",
+        transforms_polarity=1.0,
+        transforms_noise=1.0,
+        transforms_gain=1.0,
+        transforms_filters=1.0,
+        transforms_delay=1.0,
+        transforms_pitch=1.0,
+        transforms_reverb=1.0,
+    )
+    write_ir_bank(tmp_path, args)
+    run_chain(args)
+
+
+def test_in_place_chain_matches_functional_chain(tmp_path):
+    # with the same random draws, the in-place chain gives the functional result (noise draws
+    # from another generator)
+    args = transforms_config(
+        data_input_dir=str(tmp_path),
+        pitch_backend="torch",
+        reverb_backend="ir",
+        transforms_polarity=1.0,
+        transforms_noise=0.0,
+        transforms_gain=1.0,
+        transforms_filters=1.0,
+        transforms_delay=1.0,
+        transforms_pitch=0.0,
+        transforms_reverb=1.0,
+    )
+    write_ir_bank(tmp_path, args)
+    transforms = AudioTransforms(args)
+    x = (np.random.RandomState(0).normal(0, 0.1, args.audio_length) * 32767).astype(np.int16)
+    out = np.empty(args.audio_length, dtype=np.float32)
+    scratch = np.empty(args.audio_length, dtype=np.float32)
+    for seed in range(10):
+        random.seed(seed)
+        expected = transforms.transform(x, 0)
+        random.seed(seed)
+        transforms.transform_into(x, out, scratch, 0)
+        np.testing.assert_allclose(out, expected.reshape(-1), rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize(
+    "pitch_backend, reverb_backend, expected",
+    [
+        ("torch", "ir", ["polarity", "noise", "gain", "filters", "delay", "pitch", "reverb"]),
+        ("sox", "ir", ["reverb"]),
+        ("torch", "sox", []),
+        ("sox", "sox", []),
+    ],
+)
+def test_batched_stages_keep_the_chain_order(tmp_path, pitch_backend, reverb_backend, expected):
+    # the workers run the chain up to the last sox effect, the batch the rest
+    args = transforms_config(
+        data_input_dir=str(tmp_path),
+        pitch_backend=pitch_backend,
+        reverb_backend=reverb_backend,
+        batch_transforms=True,
+    )
+    assert batched_stages(args) == expected
+    if "sox" in (pitch_backend, reverb_backend):
+        pytest.importorskip("augment")
+    write_ir_bank(tmp_path, args)
+
+    names = {
+        "InvertSignal": "polarity",
+        "Noise": "noise",
+        "Gain": "gain",
+        "HighLowBandPass": "filters",
+        "Delay": "delay",
+        "RandomPitchShift": "pitch",
+        "Reverb": "reverb",
+    }
+    per_sample = AudioTransforms(args).train_transform
+    assert type(per_sample[0]).__name__ == "RandomResizedCrop"
+    assert [names[type(t).__name__] for t in per_sample[1:]] + expected == STAGES
+    assert BatchedAudioTransforms(args).stages == expected
+
+
+def test_sox_stage_without_probability_is_not_a_barrier():
+    args = transforms_config(pitch_backend="torch", reverb_backend="sox", transforms_reverb=0.0)
+    assert batched_stages(args) == STAGES
@@ -1,11 +1,14 @@
 import torchaudio
 import numpy as np
 import os
+import struct
+from collections import namedtuple
 from tqdm import tqdm
 import warnings
 import scipy.io.wavfile
 import scipy
-from scripts.datasets.resample import resample
+from .misc import LRUDict
+from .resample import resample_poly
 
 
 def tensor_to_audio(fn, t, sr):
@@ -59,17 +62,6 @@ def write_audio_tb(args, train_loader, test_loader, writer, num_audio=5):
         )
 
 
- 
-def load_tracks(sample_rate, index):
-    audios = {}
-    for track_id, clip_id, segment, fp, _ in tqdm(index):
-        key = "{}-{}".format(track_id, clip_id)
-        if key not in audios.keys():
-            audio, sr = process_wav(sample_rate, fp, False)
-            audios[key] = audio
-    return audios
-
-
 def load_set(sample_rate, set_dirname, use_ulaw):
     ulaw_str = "_ulaw" if use_ulaw else ""
     file_names = [fn for fn in os.listdir(set_dirname) if fn.endswith(".wav")]
@@ -81,11 +73,102 @@ def load_set(sample_rate, set_dirname, use_ulaw):
     return full_sequences
 
 
+def pcm8_to_pcm16(audio):
+    """
+    8-bit WAV is unsigned linear PCM, while uint8 audio in memory is mu-law (see
+    float_to_ulaw), so 8-bit files are read as int16
+    """
+    if audio.dtype == np.uint8:
+        audio = (audio.astype(np.int16) - 128) << 8
+    return audio
+
+
 def read_wav(filename):
     with warnings.catch_warnings():
         warnings.simplefilter("error")
         sr, audio = scipy.io.wavfile.read(filename)
-    return audio, sr
+    return pcm8_to_pcm16(audio), sr
+
+
+WavHeader = namedtuple(
+    "WavHeader", ["offset", "dtype", "channels", "sample_rate", "num_samples"]
+)
+
+# parsed once per file and process, of the most recently read files; a header is parsed again
+# when the size or mtime of its file change
+_wav_headers = LRUDict(4096)
+
+
+def read_wav_header(filename):
+    """
+    Parses the RIFF header of a PCM / IEEE float WAV file, without reading any audio
+    """
+    st = os.stat(filename)
+    cached = _wav_headers.get(filename)
+    if cached is not None and cached[0] == (st.st_size, st.st_mtime_ns):
+        return cached[1]
+
+    with open(filename, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        if riff != b"RIFF" or wave != b"WAVE":
+            raise Exception(f"{filename} is not a RIFF/WAVE file")
+
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise Exception(f"{filename} has no data chunk")
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk)
+            if chunk_id == b"fmt ":
+                fmt = f.read(chunk_size)
+                if chunk_size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                offset = f.tell()
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+    if fmt is None:
+        raise Exception(f"{filename} has no fmt chunk")
+
+    format_tag, channels, sample_rate, _, _, bits = struct.unpack("<HHIIHH", fmt[:16])
+    if format_tag == 0xFFFE:  # WAVE_FORMAT_EXTENSIBLE, sub-format in the GUID
+        format_tag = struct.unpack("<H", fmt[24:26])[0]
+
+    if format_tag == 1 and bits in (8, 16, 32):
+        dtype = np.dtype({8: "u1", 16: "<i2", 32: "<i4"}[bits])
+    elif format_tag == 3 and bits in (32, 64):
+        dtype = np.dtype({32: "<f4", 64: "<f8"}[bits])
+    else:
+        raise Exception(f"{filename} has an unsupported WAV format ({format_tag}, {bits} bits)")
+
+    num_samples = chunk_size // (dtype.itemsize * channels)
+    header = WavHeader(offset, dtype, channels, sample_rate, num_samples)
+    _wav_headers[filename] = ((st.st_size, st.st_mtime_ns), header)
+    return header
+
+
+def read_wav_window(filename, start=0, length=None):
+    """
+    Reads |length| samples from |start| by seeking past the header, instead of
+    reading the whole file. Returns the raw (mono) samples, like read_wav.
+    """
+    header = read_wav_header(filename)
+    if length is None:
+        length = header.num_samples - start
+    length = max(0, min(length, header.num_samples - start))
+
+    frame_size = header.dtype.itemsize * header.channels
+    audio = np.fromfile(
+        filename,
+        dtype=header.dtype,
+        count=length * header.channels,
+        offset=header.offset + start * frame_size,
+    )
+    if header.channels > 1:
+        audio = audio.reshape(-1, header.channels)
+    return pcm8_to_pcm16(ensure_mono(audio)), header.sample_rate
 
 
 def write_wav(filename, sample_rate, data):
@@ -95,7 +178,7 @@ def write_wav(filename, sample_rate, data):
 def process_wav(desired_sample_rate, filename, use_ulaw):
     audio, sr = read_wav(filename)
     # audio = ensure_mono(audio)
-    audio = wav_to_float(audio)
+    audio = pcm_to_float(audio)
     if use_ulaw:
         audio = ulaw(audio)
     # audio = ensure_sample_rate(desired_sample_rate, sr, audio)
@@ -138,6 +221,95 @@ def wav_to_float(x):
     return x
 
 
+def pcm_to_float(x):
+    """
+    wav_to_float for (memory-mapped) PCM views, computed in float32 so only the
+    selected window is converted. Float views are copied, so the result is writable.
+    uint8 audio is mu-law (see float_to_ulaw).
+    """
+    if x.dtype.kind == "f":
+        return x.astype(np.float32)
+    if x.dtype == np.uint8:
+        return ulaw_to_float(x)
+    max_value = np.iinfo(x.dtype).max
+    min_value = np.iinfo(x.dtype).min
+    x = x.astype(np.float32)
+    x -= min_value
+    x /= (max_value - min_value) / 2.0
+    x -= 1.0
+    return x
+
+
+def pcm_to_float_into(x, out):
+    """
+    pcm_to_float, written into the float32 array |out| (of the same length) without
+    allocating a new array
+    """
+    if x.dtype == np.uint8:
+        return np.take(_ulaw_table, x, out=out)
+    np.copyto(out, x, casting="unsafe")
+    if x.dtype.kind == "f":
+        return out
+    max_value = np.iinfo(x.dtype).max
+    min_value = np.iinfo(x.dtype).min
+    out -= min_value
+    out /= (max_value - min_value) / 2.0
+    out -= 1.0
+    return out
+
+
+# sample formats of decoded audio in the RAM caches and the packed store
+storage_dtypes = {
+    "float32": np.dtype(np.float32),
+    "int16": np.dtype(np.int16),
+    "ulaw": np.dtype(np.uint8),
+}
+
+
+def float_to_int16(x):
+    """
+    16-bit PCM encoding of float audio in [-1, 1], the inverse of pcm_to_float (so
+    int16 -> float -> int16 is exact)
+    """
+    x = (np.clip(x, -1.0, 1.0) + 1.0) * 32767.5 - 32768
+    return np.round(x).astype(np.int16)
+
+
+def float_to_ulaw(x, u=255):
+    """
+    8-bit mu-law encoding of float audio in [-1, 1]
+    """
+    x = ulaw(np.clip(x, -1.0, 1.0), u)
+    return np.round((x + 1.0) * 127.5).astype(np.uint8)
+
+
+def ulaw_table(u=255):
+    x = np.arange(256, dtype=np.float64) / 127.5 - 1.0
+    return (np.sign(x) * ((1 + u) ** np.abs(x) - 1) / u).astype(np.float32)
+
+
+_ulaw_table = ulaw_table()
+
+
+def ulaw_to_float(x):
+    # a table lookup, so expanding a window is as cheap as converting PCM
+    return _ulaw_table[x]
+
+
+def encode_audio(audio, storage_format):
+    """
+    Converts (PCM or float) audio to the |storage_format| sample format
+    """
+    dtype = storage_dtypes[storage_format]
+    if audio.dtype == dtype:
+        return audio
+    if storage_format == "ulaw":
+        return float_to_ulaw(pcm_to_float(audio))
+    if storage_format == "int16":
+        return float_to_int16(pcm_to_float(audio))
+    return pcm_to_float(audio)
+
+
 def ulaw2lin(x, u=255.0):
     max_value = np.iinfo("uint8").max
     min_value = np.iinfo("uint8").min
@@ -152,9 +324,7 @@ def ulaw2lin(x, u=255.0):
 
 def ensure_sample_rate(desired_sample_rate, file_sample_rate, mono_audio):
     if file_sample_rate != desired_sample_rate:
-        mono_audio = scipy.signal.resample_poly(
-            mono_audio, desired_sample_rate, file_sample_rate
-        )
+        mono_audio = resample_poly(mono_audio, file_sample_rate, desired_sample_rate)
     return mono_audio
 
 
@@ -167,54 +337,22 @@ def ensure_mono(raw_audio):
     return raw_audio
 
 
-def concat_tracks(sample_rate, dir, split, track_index):
-    new_index = []
-    concat_fps = []
-    for track_id, v in tqdm(track_index.items()):
-        out_file = os.path.join(dir, split, f"{track_id}-{sample_rate}.wav")
-
-        # only process files that do not exist yet
-        if not os.path.exists(out_file):
-            for clip_id, segment, fp, label in v:
-                # only use 1 segment, it is already the whole 30s file
-                if segment == 0:
-                    concat_fps.append(fp)
-
-            audios = []
-            for fp in concat_fps:
-                audio, sr = process_wav(sample_rate, fp, False)
-                audios.append(audio)
-
-            audios = np.concatenate(audios)
-            audios = float_to_pcm(audios)
-            write_wav(out_file, sample_rate, audios)
-            concat_fps = []
-        
-        label_len = len(v[0][3])
-        new_index.append([track_id, 0, 0, out_file, [0]*label_len])
-    return new_index
-
-
-def preprocess_tracks(sample_rate, raw_dir, proc_dir, split, track_index, id2audio_path):
-    clips = []
+def preprocess_tracks(sample_rate, raw_dir, proc_dir, split, track_index, id2audio_path, num_workers=None):
+    from .preprocess import process_jobs
+
     proc_dir = os.path.join(proc_dir, split)
-    if not os.path.exists(proc_dir):
-        os.makedirs(proc_dir)
 
-    for track_id, values in tqdm(track_index.items()):
+    # |sample_rate| can be a list of rates, all written from one decode of every track
+    sample_rates = sample_rate if isinstance(sample_rate, (list, tuple)) else [sample_rate]
+
+    jobs = []
+    for track_id, values in track_index.items():
         for clip_id, segment, fp, label in values:
             if segment == 0:
-                orig_fp = id2audio_path[clip_id]
-                orig_fp = os.path.join(raw_dir, orig_fp)
-                
-                new_fp = f"{track_id}-{clip_id}-{sample_rate}.wav"
-                new_fp = os.path.join(proc_dir, new_fp)
-
-                # convert to wav to avoid conversion during training i/o
-                conv_fp = orig_fp + ".wav"
-                resample(orig_fp, conv_fp, sample_rate)
-                audio, sr = read_wav(conv_fp)
-                audio = ensure_mono(audio)
-                write_wav(new_fp, sample_rate, audio)
-                os.remove(conv_fp)
-        
+                orig_fp = os.path.join(raw_dir, id2audio_path[str(clip_id)])
+                targets = [
+                    (os.path.join(proc_dir, f"{track_id}-{clip_id}-{sr}.wav"), sr) for sr in sample_rates
+                ]
+                jobs.append((orig_fp, targets))
+
+    process_jobs(jobs, os.path.join(proc_dir, "manifest.txt"), num_workers)
@@ -3,6 +3,7 @@ import json
 from datetime import datetime
 import yaml
 import copy
+from collections import OrderedDict
 
 def label_to_tag(list_of_tags, label):
     with open(list_of_tags, "r") as f:
@@ -25,3 +26,31 @@ def write_args(args):
         if "device" in d.keys():
             del d["device"]
         f.write(yaml.dump(d))
+
+
+class LRUDict:
+    """
+    Dict that holds at most |max_items| entries, dropping the least recently used first
+    """
+
+    def __init__(self, max_items):
+        self.max_items = max_items
+        self.items = OrderedDict()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, key):
+        return key in self.items
+
+    def get(self, key, default=None):
+        if key not in self.items:
+            return default
+        self.items.move_to_end(key)
+        return self.items[key]
+
+    def __setitem__(self, key, value):
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
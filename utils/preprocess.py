@@ -0,0 +1,85 @@
+import os
+import time
+import multiprocessing
+from tqdm import tqdm
+
+from .resample import resample_rates
+
+
+def read_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return set()
+    with open(manifest_path, "r") as f:
+        return set(f.read().splitlines())
+
+
+def process(job):
+    src_path, targets = job
+    t0 = time.time()
+    try:
+        # write next to the targets and rename, so an interrupted run never leaves a partial file
+        resample_rates(src_path, [(target_path + ".tmp", sample_rate) for target_path, sample_rate in targets])
+        for target_path, _ in targets:
+            os.replace(target_path + ".tmp", target_path)
+    except Exception as e:
+        return src_path, [], time.time() - t0, str(e)
+    return src_path, [(target_path, os.path.getsize(target_path)) for target_path, _ in targets], time.time() - t0, None
+
+
+def process_jobs(jobs, manifest_path, num_workers=None, report_every=500):
+    """
+    Runs (src_path, [(target_path, sample_rate), ...]) jobs in parallel: every source is decoded
+    once and written at all of its target sample rates. Completed targets are appended to
+    |manifest_path|, so an interrupted run resumes where it stopped.
+    """
+    done = read_manifest(manifest_path)
+    todo = []
+    num_targets = 0
+    for src_path, targets in jobs:
+        num_targets += len(targets)
+        targets = [t for t in targets if os.path.basename(t[0]) not in done]
+        if targets:
+            todo.append((src_path, targets))
+
+    num_todo = sum(len(targets) for _, targets in todo)
+    print(f"{num_targets - num_todo}/{num_targets} files already processed ({manifest_path})")
+    if not todo:
+        return
+
+    for target_dir in set(os.path.dirname(t[0]) for _, targets in todo for t in targets):
+        if not os.path.exists(target_dir):
+            os.makedirs(target_dir)
+
+    num_files = 0
+    num_bytes = 0
+    busy_time = 0
+    failed = []
+    t0 = time.time()
+    with multiprocessing.Pool(processes=num_workers) as p, open(manifest_path, "a") as manifest:
+        for src_path, written, dt, error in tqdm(
+            p.imap_unordered(process, todo, chunksize=4), total=len(todo)
+        ):
+            if error is not None:
+                failed.append(src_path)
+                print(f"Failed to process {src_path}: {error}")
+                continue
+
+            for target_path, size in written:
+                manifest.write(os.path.basename(target_path) + "\n")
+                num_bytes += size
+            manifest.flush()
+
+            num_files += 1
+            busy_time += dt
+            if num_files % report_every == 0:
+                elapsed = time.time() - t0
+                print(
+                    f"{num_files / elapsed:.1f} files/s, {num_bytes / elapsed / 2 ** 20:.1f} MB/s, "
+                    f"{busy_time / num_files * 1000:.1f} ms/file per process"
+                )
+
+    elapsed = time.time() - t0
+    print(
+        f"Processed {num_files} files in {elapsed:.1f}s ({num_files / max(elapsed, 1e-9):.1f} files/s), "
+        f"{len(failed)} failed"
+    )
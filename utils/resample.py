@@ -0,0 +1,113 @@
+import functools
+import subprocess
+from math import gcd
+import numpy as np
+import scipy.io.wavfile
+import scipy.signal
+import torchaudio
+
+
+@functools.lru_cache(maxsize=None)
+def resample_filter(src_rate, dst_rate):
+    """
+    Designs the polyphase filter once per (src_rate, dst_rate) pair, with the same
+    Kaiser-windowed FIR that scipy.signal.resample_poly designs on every call
+    """
+    g = gcd(src_rate, dst_rate)
+    up = dst_rate // g
+    down = src_rate // g
+    max_rate = max(up, down)
+    half_len = 10 * max_rate
+    h = scipy.signal.firwin(2 * half_len + 1, 1.0 / max_rate, window=("kaiser", 5.0))
+    return up, down, h
+
+
+def resample_poly(audio, src_rate, dst_rate):
+    if src_rate == dst_rate:
+        return audio
+    up, down, h = resample_filter(src_rate, dst_rate)
+    return scipy.signal.resample_poly(audio, up, down, window=h).astype(np.float32)
+
+
+def decode(source):
+    """
+    Decodes |source| in-process to mono float32 in [-1, 1]
+    """
+    if source.endswith(".wav"):
+        sr, audio = scipy.io.wavfile.read(source)
+        if audio.dtype == np.uint8:
+            audio = (audio.astype(np.float32) - 128) / 128
+        elif audio.dtype.kind == "i":
+            audio = audio.astype(np.float32) / -np.iinfo(audio.dtype).min
+        audio = audio.astype(np.float32, copy=False)
+        if audio.ndim == 2:
+            audio = audio.mean(axis=1)
+    else:
+        audio, sr = torchaudio.load(source)
+        audio = audio.mean(dim=0).numpy()
+    return audio, sr
+
+
+def ffmpeg_decode(source, sample_rate):
+    """
+    Fallback for formats that cannot be decoded in-process: ffmpeg decodes and resamples
+    to raw PCM on stdout, so no temporary file is written.
+    """
+    process = subprocess.Popen(
+        [
+            "ffmpeg",
+            "-i",
+            source,
+            "-ac",
+            "1", # to mono
+            "-ar",
+            str(sample_rate),
+            "-f",
+            "s16le",
+            "-",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+    )
+    stdout, _ = process.communicate()
+    if process.returncode != 0:
+        raise Exception(f"ffmpeg could not convert {source}")
+    audio = np.frombuffer(stdout, dtype=np.int16).astype(np.float32) / 32768
+    return audio
+
+
+def load_audio_rates(source, sample_rates, dtype="float32"):
+    """
+    Decodes |source| once and resamples it to mono audio at every rate of |sample_rates|,
+    as float32 in [-1, 1] or int16
+    """
+    try:
+        audio, sr = decode(source)
+        audios = [resample_poly(audio, sr, sample_rate) for sample_rate in sample_rates]
+    except Exception:
+        audios = [ffmpeg_decode(source, sample_rate) for sample_rate in sample_rates]
+
+    if np.dtype(dtype) == np.int16:
+        audios = [np.clip(audio * 32768, -32768, 32767).astype(np.int16) for audio in audios]
+    return audios
+
+
+def load_audio(source, sample_rate, dtype="float32"):
+    """
+    Decodes and resamples |source| to mono |sample_rate| audio, as float32 in [-1, 1] or int16
+    """
+    return load_audio_rates(source, [sample_rate], dtype)[0]
+
+
+def resample(source, target, sample_rate):
+    audio = load_audio(source, sample_rate, dtype="int16")
+    scipy.io.wavfile.write(target, sample_rate, audio)
+
+
+def resample_rates(source, targets):
+    """
+    Writes |source| to every (target, sample_rate) of |targets|, from a single decode
+    """
+    audios = load_audio_rates(source, [sample_rate for _, sample_rate in targets], dtype="int16")
+    for (target, sample_rate), audio in zip(targets, audios):
+        scipy.io.wavfile.write(target, sample_rate, audio)
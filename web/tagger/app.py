@@ -9,8 +9,8 @@ matplotlib.use("Agg")
 
 from data import get_dataset
 from model import load_encoder
-from scripts.datasets.resample import resample
-from utils import parse_args, download_yt, process_wav
+from utils.resample import load_audio
+from utils import parse_args, download_yt
 from inference import save_taggram
 import base64
 
@@ -58,11 +58,8 @@ def predict():
 
     print("Downloading and converting YouTube video...")
     video_title, video_id = download_yt(video_link, tmp_input_file, args.sample_rate)
-    conv_fn = f"{tmp_input_file}_{args.sample_rate}.wav"
     print("Resampling...")
-    resample(tmp_input_file, conv_fn, args.sample_rate)
-
-    yt_audio, _ = process_wav(args.sample_rate, conv_fn, False)
+    yt_audio = load_audio(tmp_input_file, args.sample_rate)
     yt_audio = yt_audio.reshape(1, -1)
     yt_audio = torch.from_numpy(yt_audio)  # numpy to torch tensor
 
@@ -89,7 +86,6 @@ def predict():
     
     print("Cleaning up mp3...")
     os.remove(tmp_input_file)
-    os.remove(conv_fn)
 
     fn = "{}_taggram.png".format(str(uuid.uuid4()))
     taggram_fp = os.path.join(image_path, fn)